@@ -1,62 +1,320 @@
-from flask import Flask, request, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, Response, request, jsonify, stream_with_context
+import hashlib
+import json
+import os
+from batching import MicroBatchExecutor, load_model_factory
+from categorizer import KeywordCategorizer
+from dedup import NearDuplicateIndex
+from history_store import CustomerHistoryStore, StripedLock, epoch_day, iso_date
+from metrics import NULL_TIMER, Instrumentation
+from response_cache import IdempotencyKeyReused, ResponseCache, request_fingerprint
+from rules import RuleEngine
+from scoring import evaluate_dispute, evaluate_disputes, submission_day_of, validate_dispute
+from stream_disputes import process_ndjson
+from triage_queue import TriageQueue
+from velocity import VelocityTracker
 
 app = Flask(__name__)
 
-# Simulated customer history (replace with database in production)
-customer_history = {
-    "C001": {"dispute_count": 5, "high_risk": True, "last_dispute_date": "2025-04-20", "credit_score": 650},
-    "C002": {"dispute_count": 1, "high_risk": False, "last_dispute_date": "2025-03-01", "credit_score": 750}
+# When enabled, every processed dispute is counted in the customer's history, so
+# later disputes from the same customer are scored against the updated record
+app.config['LIVE_HISTORY_UPDATES'] = os.environ.get('LIVE_HISTORY_UPDATES', '').lower() in ('1', 'true', 'yes')
+
+# Keyword categorizer by default. The vocabulary can be extended without a code change
+# by pointing DISPUTE_KEYWORDS_FILE at a JSON file. With CATEGORIZER_BACKEND=batched,
+# descriptions are micro-batched into calls to a model (e.g. BERT) in worker processes.
+if os.environ.get('CATEGORIZER_BACKEND') == 'batched':
+    categorizer = MicroBatchExecutor(
+        load_model_factory(os.environ.get('CATEGORIZER_MODEL', 'batching:StandInModel')),
+        max_batch_size=int(os.environ.get('CATEGORIZER_MAX_BATCH_SIZE', 32)),
+        max_wait_ms=float(os.environ.get('CATEGORIZER_MAX_WAIT_MS', 5)),
+        workers=int(os.environ.get('CATEGORIZER_WORKERS', 1)),
+    )
+elif os.environ.get('DISPUTE_KEYWORDS_FILE'):
+    categorizer = KeywordCategorizer.from_file(os.environ['DISPUTE_KEYWORDS_FILE'])
+else:
+    categorizer = KeywordCategorizer()
+
+# Sample customers, inserted into the history database if not already present
+SEED_CUSTOMER_HISTORY = {
+    "C001": {"dispute_count": 5, "high_risk": True, "last_dispute_day": epoch_day("2025-04-20"), "credit_score": 650},
+    "C002": {"dispute_count": 1, "high_risk": False, "last_dispute_day": epoch_day("2025-03-01"), "credit_score": 750}
 }
 
-@app.route('/process-dispute', methods=['POST'])
-def process_dispute():
-    data = request.get_json()
+# Customer history lives in SQLite with an LRU cache in front of it
+history_store = CustomerHistoryStore(
+    os.environ.get('CUSTOMER_HISTORY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'customer_history.db')),
+    cache_size=int(os.environ.get('CUSTOMER_HISTORY_CACHE_SIZE', 100_000)),
+    seed=SEED_CUSTOMER_HISTORY,
+)
+
+# Responses to recent /process-dispute requests, so retries are served without
+# recomputation. A customer's entries are dropped when their history changes,
+# unless scoring recorded the dispute (see records_disputes).
+response_cache = ResponseCache(
+    max_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 10_000)),
+    ttl_seconds=float(os.environ.get('RESPONSE_CACHE_TTL', 300)),
+)
+# Serializes concurrent retries of the same request, so only the first computes it
+request_locks = StripedLock()
+
+def on_history_change(customer_id):
+    response_cache.invalidate_customer(customer_id)
+
+history_store.add_listener(on_history_change)
+
+# Processed disputes waiting for analysts, highest priority first
+triage_queue = TriageQueue(
+    snapshot_path=os.environ.get('TRIAGE_QUEUE_SNAPSHOT',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'triage_queue.pkl')),
+    visibility_timeout=float(os.environ.get('TRIAGE_QUEUE_VISIBILITY_TIMEOUT', 300)),
+)
+
+# Priority and high-risk rules, compiled from a JSON file and reloaded when it changes
+rule_engine = RuleEngine(os.environ.get(
+    'DISPUTE_RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dispute_rules.json')))
+
+# Groups near-identical descriptions (e.g. from a fraud ring) into clusters, so
+# analysts can handle them together. Each response then carries the dispute's
+# cluster_id and its similarity to the closest recent dispute.
+if os.environ.get('NEAR_DUPLICATE_DETECTION', '').lower() in ('1', 'true', 'yes'):
+    dedup_index = NearDuplicateIndex(
+        threshold=float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.8)),
+        ttl_seconds=float(os.environ.get('NEAR_DUPLICATE_TTL', 86_400)),
+        max_entries=int(os.environ.get('NEAR_DUPLICATE_MAX_ENTRIES', 100_000)),
+    )
+else:
+    dedup_index = None
+
+# Rolling per-customer dispute counts and amounts over 1h/24h/7d/30d, available
+# to the rules file as velocity conditions (e.g. disputes_in_24h_at_least)
+if os.environ.get('VELOCITY_TRACKING', '').lower() in ('1', 'true', 'yes'):
+    velocity_tracker = VelocityTracker()
+else:
+    velocity_tracker = None
+
+# Per-stage latency histograms, exported at /metrics. Off by default; when disabled
+# each stage boundary costs a call to a no-op timer.
+instrumentation = Instrumentation(
+    enabled=os.environ.get('DISPUTE_METRICS_ENABLED', '').lower() in ('1', 'true', 'yes'))
+
+def score_dispute(data, timer=NULL_TIMER):
+    """
+    Categorize a single dispute, look up the customer's history and score it.
+
+    Args:
+        data: Parsed dispute JSON
+        timer: Stage timer from instrumentation.start(); lap() is called as each
+            stage finishes, stopping it is left to the caller
+
+    Raises:
+        ValueError: If the dispute is invalid, before anything is recorded
+    """
+    validate_dispute(data)
     customer_id = data.get('customer_id')
-    dispute_description = data.get('dispute_description', '').lower()
-    transaction_amount = data.get('transaction_amount', 0)
-    submission_date = data.get('submission_date', datetime.now().strftime("%Y-%m-%d"))
+    dispute_description = data.get('dispute_description', '')
 
     # Simulate AI categorization (replace with BERT model in production)
-    category = "Fraud" if "fraud" in dispute_description or "unauthorized" in dispute_description else \
-               "Billing Error" if "error" in dispute_description else "Other"
-
-    # Assign priority based on customer history
-    history = customer_history.get(customer_id, {"dispute_count": 0, "high_risk": False, "last_dispute_date": None, "credit_score": 700})
-    dispute_count = history["dispute_count"]
-    priority = "High" if dispute_count >= 4 else "Medium" if dispute_count >= 2 else "Low"
-
-    # Adjust priority based on recency, amount, and category
-    if history["last_dispute_date"]:
-        last_dispute = datetime.strptime(history["last_dispute_date"], "%Y-%m-%d")
-        if submission_date <= (last_dispute + timedelta(days=30)).strftime("%Y-%m-%d"):
-            priority = "High" if priority == "Medium" else priority
-    if transaction_amount > 1000:
-        priority = "High" if priority == "Medium" else priority
-    if category == "Fraud":
-        priority = "High"
-
-    # Flag high-risk disputes
-    high_risk = history["high_risk"] or category == "Fraud" or transaction_amount > 1000 or history["credit_score"] < 600
-
-    # Generate recommendation
-    recommendation = f"Review {category} dispute. Priority: {priority}. "
-    if high_risk:
-        recommendation += "Flag for high-risk investigation."
-    elif category == "Fraud":
-        recommendation += "Verify transaction details with customer."
-    elif category == "Billing Error":
-        recommendation += "Request additional documentation."
+    category = categorizer.categorize(dispute_description.lower())
+    timer.lap('categorize')
+
+    if app.config['LIVE_HISTORY_UPDATES']:
+        history = history_store.record_dispute(customer_id, submission_day_of(data))
+    else:
+        history = history_store.get(customer_id)
+    timer.lap('history')
+
+    velocity = None
+    if velocity_tracker is not None:
+        velocity = velocity_tracker.record(customer_id, data.get('transaction_amount', 0))
+        timer.lap('velocity')
+
+    result = evaluate_dispute(data, category, history, rule_engine.rules, velocity, timer)
+    if dedup_index is not None:
+        result['cluster_id'], result['similarity'] = dedup_index.add(dispute_description)
+        timer.lap('dedup')
+    return result
+
+def score_disputes_batch(disputes):
+    """
+    Apply the same rules as score_dispute to a list of disputes at once.
+
+    Descriptions are categorized in one batch and histories fetched in bulk,
+    then every rule is evaluated column-wise. Results are returned in input order.
+
+    Raises:
+        ValueError: If any dispute is invalid, naming its index, before anything is recorded
+    """
+    if not disputes:
+        return []
+    for index, dispute in enumerate(disputes):
+        try:
+            validate_dispute(dispute)
+        except ValueError as e:
+            raise ValueError(f"at index {index}: {e}") from None
+
+    categories = categorizer.categorize_batch([d.get('dispute_description', '').lower() for d in disputes])
+    submission_days = [submission_day_of(d) for d in disputes]
+
+    if app.config['LIVE_HISTORY_UPDATES']:
+        # Count disputes one at a time in input order, so a customer appearing
+        # several times in the batch is scored exactly as with single requests
+        histories = [history_store.record_dispute(d.get('customer_id'), submission_day)
+                     for d, submission_day in zip(disputes, submission_days)]
     else:
-        recommendation += "Standard review."
+        histories = history_store.get_many([d.get('customer_id') for d in disputes])
+
+    velocities = None
+    if velocity_tracker is not None:
+        velocities = [velocity_tracker.record(d.get('customer_id'), d.get('transaction_amount', 0)) for d in disputes]
+
+    results = evaluate_disputes(disputes, categories, histories, rule_engine.rules, submission_days, velocities)
+    if dedup_index is not None:
+        for dispute, result in zip(disputes, results):
+            result['cluster_id'], result['similarity'] = dedup_index.add(dispute.get('dispute_description', ''))
+    return results
+
+def records_disputes():
+    """
+    Whether scoring a dispute records it (in the customer's history or velocity).
+
+    Responses of such requests are idempotency records: retrying the request
+    must replay them, so history changes don't drop them from the cache.
+    """
+    return app.config['LIVE_HISTORY_UPDATES'] or velocity_tracker is not None
+
+def score_dispute_once(data, timer=NULL_TIMER):
+    """
+    Score a validated dispute through the response cache.
+
+    Requests are keyed on their Idempotency-Key header, scoped to the
+    customer, if they have one, else on their fingerprint. Concurrent retries
+    of the same request wait for the first one, and retries within the cache
+    TTL get its response without recomputing it or counting the dispute again.
+
+    Returns:
+        (response, cache key)
+
+    Raises:
+        IdempotencyKeyReused: If the Idempotency-Key was used for a different body
+    """
+    fingerprint = request_fingerprint(data, submission_day_of(data))
+    idempotency_key = request.headers.get('Idempotency-Key')
+    key = f"key:{json.dumps([data.get('customer_id'), idempotency_key])}" if idempotency_key else fingerprint
+    with request_locks(key):
+        result = response_cache.get(key, fingerprint)
+        timer.lap('cache_lookup')
+        if result is None:
+            result = score_dispute(data, timer)
+            response_cache.put(key, data.get('customer_id'), result, fingerprint, invalidate=not records_disputes())
+    return result, key
+
+@app.errorhandler(IdempotencyKeyReused)
+def idempotency_key_reused(e):
+    return jsonify({'error': 'Idempotency-Key was already used for a different dispute'}), 422
+
+@app.route('/process-dispute', methods=['POST'])
+def process_dispute():
+    timer = instrumentation.start()
+    data = request.get_json()
+    timer.lap('parse')
+    try:
+        validate_dispute(data)
+        result, _ = score_dispute_once(data, timer)
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f'Invalid dispute: {e}'}), 400
+    response = jsonify(result)
+    timer.lap('serialize')
+    timer.stop()
+    return response
+
+@app.route('/process-disputes', methods=['POST'])
+def process_disputes():
+    disputes = request.get_json()
+    if not isinstance(disputes, list):
+        return jsonify({'error': 'Request body must be a JSON array of disputes'}), 400
+    try:
+        return jsonify(score_disputes_batch(disputes))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid dispute: {e}'}), 400
+
+@app.route('/process-disputes/stream', methods=['POST'])
+def process_disputes_stream():
+    """Score an NDJSON request body line by line, streaming NDJSON results back."""
+    return Response(stream_with_context(process_ndjson(request.stream, score_dispute)),
+                    mimetype='application/x-ndjson')
+
+@app.route('/queue/disputes', methods=['POST'])
+def enqueue_dispute():
+    """
+    Process a dispute and add it to the triage queue.
+
+    Scored through the same cache as /process-dispute, so a dispute already
+    processed there is not counted again. The dispute_id derives from the
+    cache key, so a retry returns the queued item (200) instead of queueing
+    it twice.
+    """
+    data = request.get_json()
+    try:
+        validate_dispute(data)
+        result, key = score_dispute_once(data)
+        submission_day = submission_day_of(data)
+        item = dict(result,
+                    dispute_id=hashlib.sha256(key.encode('utf-8')).hexdigest()[:32],
+                    transaction_amount=data.get('transaction_amount', 0),
+                    submission_date=iso_date(submission_day))
+        created = triage_queue.enqueue(item, submission_day)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid dispute: {e}'}), 400
+    return jsonify(item), 201 if created else 200
+
+# Longest visibility timeout a claim may ask for, in seconds
+MAX_VISIBILITY_TIMEOUT = 86_400
+
+@app.route('/queue/claim', methods=['POST'])
+def claim_dispute():
+    """Claim the highest-priority dispute; it is hidden from other claims until acked or timed out."""
+    data = request.get_json(silent=True) or {}
+    visibility_timeout = data.get('visibility_timeout')
+    if visibility_timeout is not None and (isinstance(visibility_timeout, bool)
+                                           or not isinstance(visibility_timeout, (int, float))
+                                           or not 0 < visibility_timeout <= MAX_VISIBILITY_TIMEOUT):
+        return jsonify({'error': f'visibility_timeout must be a number of seconds greater than 0 '
+                                 f'and at most {MAX_VISIBILITY_TIMEOUT}'}), 400
+    claim = triage_queue.claim(visibility_timeout)
+    if claim is None:
+        return '', 204
+    return jsonify(claim)
+
+@app.route('/queue/ack', methods=['POST'])
+def ack_dispute():
+    """Mark a claimed dispute as handled."""
+    data = request.get_json(silent=True) or {}
+    if not triage_queue.ack(data.get('receipt')):
+        return jsonify({'error': 'Unknown or expired receipt'}), 404
+    return jsonify({'acknowledged': True})
+
+@app.route('/queue/stats', methods=['GET'])
+def queue_stats():
+    return jsonify(triage_queue.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms of /process-dispute in Prometheus text format."""
+    return Response(instrumentation.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
-    return jsonify({
-        'customer_id': customer_id,
-        'category': category,
-        'priority': priority,
-        'high_risk': high_risk,
-        'recommendation': recommendation
-    })
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Cache statistics for the response cache and the customer history cache."""
+    stats = {
+        'response_cache': response_cache.stats(),
+        'history_cache': history_store.stats(),
+    }
+    if dedup_index is not None:
+        stats['near_duplicates'] = dedup_index.stats()
+    if velocity_tracker is not None:
+        stats['velocity'] = velocity_tracker.stats()
+    return jsonify(stats)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
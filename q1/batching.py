@@ -0,0 +1,161 @@
+import importlib
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from categorizer import Categorizer, KeywordCategorizer
+
+
+class StandInModel(Categorizer):
+    """
+    CPU-only stand-in for a batched ML categorization model.
+
+    Produces the same categories as KeywordCategorizer, and can simulate the
+    latency profile of a real model: a fixed cost per call plus a smaller cost
+    per description, which is what makes batching pay off.
+    """
+
+    def __init__(self, call_overhead_ms=0.0, per_item_ms=0.0):
+        """
+        Initialize the model.
+
+        Args:
+            call_overhead_ms: Simulated fixed latency of one model call
+            per_item_ms: Simulated additional latency per description in a call
+        """
+        self.call_overhead_ms = call_overhead_ms
+        self.per_item_ms = per_item_ms
+        self._keywords = KeywordCategorizer()
+
+    def categorize(self, description):
+        return self.categorize_batch([description])[0]
+
+    def categorize_batch(self, descriptions):
+        delay_ms = self.call_overhead_ms + self.per_item_ms * len(descriptions)
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        return [self._keywords.categorize(description) for description in descriptions]
+
+
+def load_model_factory(path):
+    """Resolve a "module:callable" path to a model factory, e.g. "batching:StandInModel"."""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+# Model instance of the current worker process, created once by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_factory):
+    global _worker_model
+    _worker_model = model_factory()
+
+
+def _run_batch(descriptions):
+    return _worker_model.categorize_batch(descriptions)
+
+
+class MicroBatchExecutor(Categorizer):
+    """
+    Dynamic batching front-end for a categorization model.
+
+    Descriptions submitted from any thread are collected until max_batch_size
+    items are waiting or the oldest has waited max_wait_ms, then categorized
+    in one model call in a worker process. Each caller gets a Future for its
+    own description. Larger batches and longer waits trade latency for
+    throughput.
+    """
+
+    def __init__(self, model_factory, max_batch_size=32, max_wait_ms=5.0, workers=1):
+        """
+        Initialize the executor and start its batching thread.
+
+        Args:
+            model_factory: Picklable callable returning a Categorizer; called once
+                in each worker process
+            max_batch_size: Maximum descriptions per model call
+            max_wait_ms: Maximum time the first description of a batch waits for more
+            workers: Number of worker processes running the model
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.items = 0
+        self._pending = queue.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_factory,))
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, description):
+        """Queue a description for categorization. Returns a Future resolving to its category."""
+        future = Future()
+        self._pending.put((description, future))
+        return future
+
+    def categorize(self, description):
+        return self.submit(description).result()
+
+    def categorize_batch(self, descriptions):
+        futures = [self.submit(description) for description in descriptions]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        while True:
+            first = self._pending.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Shutting down: flush what we have, then stop
+                    self._pending.put(None)
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        futures = [future for _, future in batch]
+        try:
+            result = self._pool.submit(_run_batch, [description for description, _ in batch])
+        except RuntimeError as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def resolve(result):
+            error = result.exception()
+            if error is not None:
+                for future in futures:
+                    future.set_exception(error)
+            else:
+                for future, category in zip(futures, result.result()):
+                    future.set_result(category)
+
+        result.add_done_callback(resolve)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+    def shutdown(self):
+        """Categorize anything already queued, then stop the batching thread and workers."""
+        self._pending.put(None)
+        self._collector.join()
+        self._pool.shutdown(wait=True)
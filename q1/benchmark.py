@@ -0,0 +1,363 @@
+"""
+Micro-benchmarks for the dispute processing hot paths.
+
+Usage:
+    python benchmark.py [categorizer] [history] [recency] [queue] [batching] [instrumentation] [rescore] [dedup] [velocity]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+
+from batching import MicroBatchExecutor, StandInModel
+from categorizer import KeywordCategorizer
+from history_store import CustomerHistoryStore, epoch_day
+from triage_queue import TriageQueue
+
+
+def _timeit(fn, items, repeat=3):
+    """Return the best per-item time in microseconds over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def _random_word(rng, min_len=5, max_len=12):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def bench_categorizer(sizes=(10, 100, 1000), n_descriptions=2000):
+    """Compare per-dispute latency of substring scans and the compiled categorizer."""
+    rng = random.Random(42)
+    filler = [_random_word(rng, 2, 8) for _ in range(500)]
+
+    print("Keyword categorization (us per dispute)")
+    print(f"{'keywords':>10} {'substring scan':>16} {'compiled':>10}")
+    for size in sizes:
+        vocabulary = {_random_word(rng): rng.choice(["Fraud", "Billing Error"]) for _ in range(size)}
+        vocabulary.update({"fraud": "Fraud", "unauthorized": "Fraud", "error": "Billing Error"})
+        fraud_terms = [k for k, c in vocabulary.items() if c == "Fraud"]
+        billing_terms = [k for k, c in vocabulary.items() if c == "Billing Error"]
+
+        # Realistic descriptions of ~20 words, a third of them containing a keyword
+        descriptions = []
+        for _ in range(n_descriptions):
+            words = [rng.choice(filler) for _ in range(20)]
+            if rng.random() < 0.33:
+                words[rng.randrange(20)] = rng.choice(list(vocabulary))
+            descriptions.append(" ".join(words))
+
+        def substring_scan(description):
+            if any(term in description for term in fraud_terms):
+                return "Fraud"
+            if any(term in description for term in billing_terms):
+                return "Billing Error"
+            return "Other"
+
+        categorizer = KeywordCategorizer(vocabulary)
+        assert all(substring_scan(d) == categorizer.categorize(d) for d in descriptions)
+
+        print(f"{size:>10} {_timeit(substring_scan, descriptions):>16.2f} "
+              f"{_timeit(categorizer.categorize, descriptions):>10.2f}")
+
+
+def _percentiles(samples_ns):
+    samples = sorted(samples_ns)
+    return {p: samples[min(int(len(samples) * p / 100), len(samples) - 1)] / 1000 for p in (50, 99, 99.9)}
+
+
+def bench_history_store(n_customers=500_000, cache_size=50_000, n_lookups=200_000):
+    """Lookup latency percentiles for the SQLite history store with an LRU cache."""
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CustomerHistoryStore(os.path.join(tmp, "history.db"), cache_size=cache_size)
+        with store._connection() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO customer_history VALUES (?, ?, ?, ?, ?)",
+                ((f"C{i:07d}", rng.randint(0, 6), rng.random() < 0.1, epoch_day("2025-04-20"), rng.randint(450, 850))
+                 for i in range(n_customers)),
+            )
+            conn.execute("COMMIT")
+
+        # Skewed traffic: most lookups go to a small set of active customers
+        customer_ids = [f"C{min(int(rng.paretovariate(1.2)) - 1, n_customers - 1):07d}" if rng.random() < 0.8
+                        else f"C{rng.randrange(n_customers):07d}" for _ in range(n_lookups)]
+        samples = []
+        for customer_id in customer_ids:
+            start = time.perf_counter_ns()
+            store.get(customer_id)
+            samples.append(time.perf_counter_ns() - start)
+
+        stats = store.stats()
+        print(f"History lookups over {n_customers:,} customers, cache of {cache_size:,}")
+        print(f"  hit ratio {stats['hit_ratio']:.2%}")
+        for p, us in _percentiles(samples).items():
+            print(f"  p{p:<5} {us:8.2f} us")
+
+
+def bench_recency(n_disputes=200_000):
+    """Compare the string-based 30-day recency check with the epoch-day version."""
+    rng = random.Random(3)
+    dates = [f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(400)]
+    pairs = [(rng.choice(dates), rng.choice(dates)) for _ in range(n_disputes)]
+    day_pairs = [(epoch_day(submission), epoch_day(last)) for submission, last in pairs]
+
+    def string_dates(pair):
+        submission_date, last_dispute_date = pair
+        last_dispute = datetime.strptime(last_dispute_date, "%Y-%m-%d")
+        return submission_date <= (last_dispute + timedelta(days=30)).strftime("%Y-%m-%d")
+
+    def epoch_days(pair):
+        # History dates are stored pre-parsed; only the submission date is parsed, with a cache
+        submission_date, last_dispute_day = pair
+        return epoch_day(submission_date) <= last_dispute_day + 30
+
+    mixed = [(submission, last_day) for (submission, _), (_, last_day) in zip(pairs, day_pairs)]
+    assert [string_dates(p) for p in pairs] == [epoch_days(p) for p in mixed]
+
+    before = _timeit(string_dates, pairs)
+    after = _timeit(epoch_days, mixed)
+    print("30-day recency check (us per dispute)")
+    print(f"  strptime/strftime  {before:8.3f}")
+    print(f"  epoch days         {after:8.3f}  ({before / after:.0f}x faster)")
+
+
+def bench_queue(n_items=1_000_000, n_claims=100_000):
+    """Enqueue/claim/ack cost with journaling, and compaction time and stalls for the triage queue at a million items."""
+    rng = random.Random(11)
+    items = [{"dispute_id": str(i), "priority": rng.choice(["Low", "Medium", "High"]),
+              "high_risk": rng.random() < 0.2, "transaction_amount": rng.randint(1, 5000)}
+             for i in range(n_items)]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Compaction is timed separately below
+        queue = TriageQueue(snapshot_path=os.path.join(tmp, "queue.pkl"), compact_min_records=float("inf"))
+
+        start = time.perf_counter()
+        for i, item in enumerate(items):
+            queue.enqueue(item, 20000 + i % 365)
+        enqueue_us = (time.perf_counter() - start) / n_items * 1e6
+
+        start = time.perf_counter()
+        for _ in range(n_claims):
+            queue.ack(queue.claim()["receipt"])
+        claim_us = (time.perf_counter() - start) / n_claims * 1e6
+
+        # Longest gap between the ticks of another thread while compacting,
+        # i.e. how long request threads could be held up
+        stop = threading.Event()
+        gaps = []
+
+        def tick():
+            last = time.perf_counter()
+            while not stop.is_set():
+                time.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticker = threading.Thread(target=tick)
+        ticker.start()
+        start = time.perf_counter()
+        queue.snapshot()
+        compact_s = time.perf_counter() - start
+        stop.set()
+        ticker.join()
+
+        start = time.perf_counter()
+        TriageQueue(snapshot_path=queue.snapshot_path)
+        restore_s = time.perf_counter() - start
+
+    print(f"Triage queue with {n_items:,} items")
+    print(f"  enqueue        {enqueue_us:8.2f} us (journaled)")
+    print(f"  claim + ack    {claim_us:8.2f} us")
+    print(f"  compaction     {compact_s:8.2f} s (longest stall of another thread: {max(gaps) * 1e3:.0f} ms)")
+    print(f"  restore        {restore_s:8.2f} s")
+
+
+def bench_batching(n_requests=2000, concurrency=64, settings=((1, 0), (8, 2), (32, 5), (64, 10))):
+    """Throughput and latency of micro-batched model calls under concurrent requests."""
+    # A model call costing 5 ms plus 0.1 ms per description, like a small transformer on CPU
+    model = partial(StandInModel, call_overhead_ms=5, per_item_ms=0.1)
+    print(f"Micro-batched categorization, {concurrency} concurrent callers, 2 workers")
+    print(f"{'batch':>6} {'wait ms':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for max_batch_size, max_wait_ms in settings:
+        executor = MicroBatchExecutor(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, workers=2)
+        executor.categorize("warm up")
+
+        def call(_):
+            start = time.perf_counter_ns()
+            executor.categorize("unauthorized charge on my card")
+            return time.perf_counter_ns() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(call, range(n_requests)))
+        elapsed = time.perf_counter() - start
+        stats = executor.stats()
+        executor.shutdown()
+        p = _percentiles(latencies)
+        print(f"{max_batch_size:>6} {max_wait_ms:>8} {n_requests / elapsed:>8.0f} "
+              f"{p[50] / 1000:>8.1f} {p[99] / 1000:>8.1f} {stats['mean_batch_size']:>11.1f}")
+
+
+def bench_instrumentation(n_requests=2000, n_timers=200_000):
+    """Per-request cost of stage timing, next to the latency of a /process-dispute request."""
+    import app as dispute_app
+    from metrics import Instrumentation
+    from response_cache import ResponseCache
+
+    dispute_app.history_store = CustomerHistoryStore(":memory:", seed=dispute_app.SEED_CUSTOMER_HISTORY)
+    dispute_app.response_cache = ResponseCache(max_size=0)
+    dispute_app.instrumentation = Instrumentation(enabled=False)
+    client = dispute_app.app.test_client()
+    disputes = [{"customer_id": f"C{i % 1000:03d}", "dispute_description": "unauthorized charge on my card",
+                 "transaction_amount": i, "submission_date": "2025-05-01"} for i in range(n_requests)]
+    request_us = _timeit(lambda dispute: client.post("/process-dispute", json=dispute), disputes, repeat=5)
+
+    # The same start/lap/stop sequence as /process-dispute, timed in isolation,
+    # because its cost is below the run-to-run noise of a whole request
+    stages = ("parse", "cache_lookup", "categorize", "history", "date_math", "rules", "recommendation", "serialize")
+
+    def timed_request(instrumentation):
+        timer = instrumentation.start()
+        for stage in stages:
+            timer.lap(stage)
+        timer.stop()
+
+    disabled_us = _timeit(timed_request, [Instrumentation(enabled=False)] * n_timers)
+    enabled_us = _timeit(timed_request, [Instrumentation(enabled=True)] * n_timers)
+
+    print(f"Stage instrumentation overhead ({len(stages)} stages per request)")
+    print(f"  request latency        {request_us:8.2f} us")
+    print(f"  timing disabled        {disabled_us:8.2f} us  ({disabled_us / request_us:6.2%})")
+    print(f"  timing enabled         {enabled_us:8.2f} us  ({enabled_us / request_us:6.2%})")
+
+
+def bench_rescore(n_rows=200_000, n_customers=100_000, chunk_size=10_000):
+    """Throughput of the parallel re-scoring CLI for increasing worker counts."""
+    import rescore
+
+    rng = random.Random(11)
+    descriptions = ["unauthorized charge on my card", "billing error on my statement",
+                    "question about this charge", "suspected fraud on account"]
+    worker_counts = sorted({1, 2, 4, 8, 16, os.cpu_count()} & set(range(1, os.cpu_count() + 1)))
+    with tempfile.TemporaryDirectory() as tmp:
+        history_db = os.path.join(tmp, "history.db")
+        store = CustomerHistoryStore(history_db)
+        with store._connection() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO customer_history VALUES (?, ?, ?, ?, ?)",
+                ((f"C{i:07d}", rng.randint(0, 6), rng.random() < 0.1, epoch_day("2025-04-20"), rng.randint(450, 850))
+                 for i in range(n_customers)),
+            )
+            conn.execute("COMMIT")
+
+        input_path = os.path.join(tmp, "disputes.ndjson")
+        with open(input_path, "w") as f:
+            for _ in range(n_rows):
+                f.write(json.dumps({
+                    "customer_id": f"C{rng.randrange(n_customers):07d}",
+                    "dispute_description": rng.choice(descriptions),
+                    "transaction_amount": round(rng.uniform(1, 3000), 2),
+                    "submission_date": f"2025-05-{rng.randint(1, 28):02d}",
+                }) + "\n")
+
+        print(f"Re-scoring {n_rows:,} NDJSON rows, chunks of {chunk_size:,}")
+        print(f"{'workers':>8} {'rows/s':>10} {'speed-up':>9}")
+        baseline = None
+        for workers in worker_counts:
+            with open(input_path) as source, open(os.devnull, "wb") as sink:
+                start = time.perf_counter()
+                rescore.rescore(rescore.read_chunks(source, "ndjson", chunk_size), sink, "ndjson", workers,
+                                history_db, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dispute_rules.json"))
+                rate = n_rows / (time.perf_counter() - start)
+            baseline = baseline or rate
+            print(f"{workers:>8} {rate:>10,.0f} {rate / baseline:>8.2f}x")
+
+
+def bench_dedup(n_indexed=100_000, n_lookups=20_000):
+    """Lookup latency of the near-duplicate index with a full window of recent descriptions."""
+    from dedup import NearDuplicateIndex
+
+    rng = random.Random(5)
+    vocabulary = [_random_word(rng, 3, 9) for _ in range(5000)]
+    templates = [" ".join(rng.choice(vocabulary) for _ in range(12)) for _ in range(500)]
+
+    def description():
+        # One in five is a fraud-ring template with a different reference number
+        if rng.random() < 0.2:
+            return f"{rng.choice(templates)} ref {rng.randrange(10 ** 6)}"
+        return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(6, 20)))
+
+    index = NearDuplicateIndex(max_entries=n_indexed)
+    for _ in range(n_indexed):
+        index.add(description())
+
+    samples = []
+    for text in [description() for _ in range(n_lookups)]:
+        start = time.perf_counter_ns()
+        index.add(text)
+        samples.append(time.perf_counter_ns() - start)
+
+    stats = index.stats()
+    print(f"Near-duplicate lookup + insert with {stats['size']:,} indexed descriptions")
+    print(f"  match ratio {stats['match_ratio']:.2%}")
+    for p, us in _percentiles(samples).items():
+        print(f"  p{p:<5} {us:8.2f} us")
+
+
+def bench_velocity(n_customers=1_000_000, n_records=200_000):
+    """Update latency and memory of the rolling velocity counters over a large customer base."""
+    from velocity import VelocityTracker
+
+    rng = random.Random(9)
+    clock = [1_750_000_000.0]
+    tracker = VelocityTracker(initial_capacity=n_customers, clock=lambda: clock[0])
+    for i in range(n_customers):
+        tracker.record(f"C{i:07d}", 10)
+
+    customer_ids = [f"C{rng.randrange(n_customers):07d}" for _ in range(n_records)]
+    samples = []
+    for customer_id in customer_ids:
+        clock[0] += 1
+        start = time.perf_counter_ns()
+        tracker.record(customer_id, 25.0)
+        samples.append(time.perf_counter_ns() - start)
+
+    stats = tracker.stats()
+    print(f"Velocity updates over {stats['customers']:,} customers")
+    print(f"  memory    {stats['bytes_per_customer']} bytes per customer, "
+          f"{stats['bytes_per_customer'] * stats['capacity'] / 2 ** 20:,.0f} MiB of counters")
+    for p, us in _percentiles(samples).items():
+        print(f"  p{p:<5} {us:8.2f} us")
+
+
+BENCHMARKS = {
+    "categorizer": bench_categorizer,
+    "history": bench_history_store,
+    "recency": bench_recency,
+    "queue": bench_queue,
+    "batching": bench_batching,
+    "instrumentation": bench_instrumentation,
+    "rescore": bench_rescore,
+    "dedup": bench_dedup,
+    "velocity": bench_velocity,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import numpy as np
+
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(description):
+    """Lowercase a description and collapse punctuation and whitespace to single spaces."""
+    return _NON_WORD.sub(" ", description.lower()).strip()
+
+
+class MinHasher:
+    """
+    MinHash signatures of character shingles.
+
+    Each shingle of `shingle_size` bytes is packed into an integer, so
+    shingling needs no hashing. The permutations are multiply-shift hashes,
+    ((a * x + b) mod 2**64) >> 32 with odd a, applied all at once with NumPy.
+    """
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        """
+        Initialize the hasher.
+
+        Args:
+            num_perm: Number of hash permutations, i.e. signature length
+            shingle_size: Bytes per shingle (at most 8)
+            seed: Seed of the permutation coefficients
+        """
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = (rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) << np.uint64(1) | np.uint64(1))[:, None]
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)[:, None]
+        self._byte_weights = np.uint64(256) ** np.arange(shingle_size - 1, -1, -1, dtype=np.uint64)
+
+    def signature(self, text):
+        """Return the uint32 MinHash signature of text, or None if it is empty."""
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        if not len(data):
+            return None
+        if len(data) < self.shingle_size:
+            data = np.pad(data, (0, self.shingle_size - len(data)))
+        # Repeated shingles need no de-duplication: they can't change a minimum
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle_size)
+        shingles = windows.astype(np.uint64) @ self._byte_weights
+        return ((self._a * shingles + self._b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index of recent dispute descriptions.
+
+    Signatures are split into bands; descriptions sharing any band land in the
+    same bucket and become candidates, and the candidate with the highest
+    estimated Jaccard similarity (the fraction of equal signature values) is
+    the match if it reaches the threshold. A new description joins the
+    cluster of its match, or starts a new cluster.
+
+    Memory is bounded: entries expire after ttl_seconds, at most max_entries
+    are kept (oldest evicted first), and each bucket only remembers its
+    newest bucket_size entries, so a large cluster costs no more to look up
+    than a small one.
+    """
+
+    def __init__(self, threshold=0.8, ttl_seconds=86_400, max_entries=100_000, num_perm=64, bands=16,
+                 bucket_size=8):
+        """
+        Initialize the index.
+
+        Args:
+            threshold: Minimum estimated similarity for a near-duplicate
+            ttl_seconds: Seconds a description stays in the index
+            max_entries: Maximum number of indexed descriptions
+            num_perm: MinHash signature length
+            bands: Number of LSH bands; num_perm must be a multiple of it
+            bucket_size: Newest entries remembered per LSH bucket
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bands = bands
+        self.bucket_size = bucket_size
+        self.hasher = MinHasher(num_perm)
+        self.lookups = 0
+        self.matches = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._rows = num_perm // bands
+        self._next_id = 0
+        # entry id -> (expires_at, signature, cluster_id, band keys), oldest first
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+                for band in range(self.bands)]
+
+    def _remove_oldest(self):
+        """Remove the oldest entry from the index. Caller holds the lock."""
+        entry_id, (_, _, _, band_keys) = self._entries.popitem(last=False)
+        for key in band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                try:
+                    bucket.remove(entry_id)
+                except ValueError:
+                    pass  # already pushed out by newer entries
+                if not bucket:
+                    del self._buckets[key]
+
+    def _expire(self, now):
+        while self._entries and next(iter(self._entries.values()))[0] <= now:
+            self._remove_oldest()
+            self.expirations += 1
+
+    def add(self, description):
+        """
+        Index a description and find its cluster.
+
+        Returns:
+            (cluster_id, similarity): the cluster the description belongs to and
+            its estimated similarity to the closest recent match, or None if it
+            started a new cluster. (None, None) for an empty description.
+        """
+        signature = self.hasher.signature(normalize(description))
+        if signature is None:
+            return None, None
+        band_keys = self._band_keys(signature)
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+            self.lookups += 1
+            candidates = {entry_id for key in band_keys for entry_id in self._buckets.get(key, ())}
+            best_cluster, best_similarity = None, 0.0
+            if candidates:
+                entries = [self._entries[entry_id] for entry_id in candidates]
+                similarities = (np.stack([entry[1] for entry in entries]) == signature).mean(axis=1)
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    best_cluster, best_similarity = entries[best][2], float(similarities[best])
+
+            if best_cluster is None:
+                cluster_id = uuid.uuid4().hex[:16]
+                similarity = None
+            else:
+                self.matches += 1
+                cluster_id = best_cluster
+                similarity = round(best_similarity, 4)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (now + self.ttl_seconds, signature, cluster_id, band_keys)
+            for key in band_keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = deque(maxlen=self.bucket_size)
+                bucket.append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove_oldest()
+                self.evictions += 1
+
+        return cluster_id, similarity
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "match_ratio": round(self.matches / self.lookups, 4) if self.lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+                "buckets": len(self._buckets),
+            }
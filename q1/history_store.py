@@ -0,0 +1,328 @@
+import queue
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache
+
+
+# History used for customers with no record, as in the original in-memory lookup
+DEFAULT_HISTORY = {"dispute_count": 0, "high_risk": False, "last_dispute_day": None, "credit_score": 700}
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_MISSING = object()
+
+# Dates are stored as days since 1970-01-01, so recency checks are integer comparisons
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customer_history (
+    customer_id TEXT PRIMARY KEY,
+    dispute_count INTEGER NOT NULL DEFAULT 0,
+    high_risk INTEGER NOT NULL DEFAULT 0,
+    last_dispute_day INTEGER,
+    credit_score INTEGER NOT NULL DEFAULT 700
+) WITHOUT ROWID
+"""
+
+# Databases created before dates were stored as epoch days kept them as ISO strings
+_MIGRATE_DATE_COLUMN = [
+    "ALTER TABLE customer_history RENAME TO customer_history_old",
+    _SCHEMA,
+    "INSERT INTO customer_history "
+    "SELECT customer_id, dispute_count, high_risk, "
+    "CAST(julianday(last_dispute_date) - julianday('1970-01-01') AS INTEGER), credit_score "
+    "FROM customer_history_old",
+    "DROP TABLE customer_history_old",
+]
+
+
+@lru_cache(maxsize=4096)
+def epoch_day(iso_date):
+    """
+    Convert an ISO date (or the date part of an ISO datetime) to days since 1970-01-01.
+
+    Cached, since submission dates repeat heavily across a day's disputes.
+    """
+    return date.fromisoformat(iso_date[:10]).toordinal() - _EPOCH_ORDINAL
+
+
+def iso_date(day):
+    """Convert days since 1970-01-01 back to an ISO date string."""
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+
+def today_epoch_day():
+    return date.today().toordinal() - _EPOCH_ORDINAL
+
+
+class StripedLock:
+    """
+    A fixed pool of locks shared out by key hash.
+
+    Operations on the same key always take the same lock, while operations on
+    different keys usually take different ones, so unrelated customers don't
+    serialize on a single global lock.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        """Return the lock guarding `key`."""
+        return self._locks[hash(key) % len(self._locks)]
+
+
+def _to_record(row):
+    return {"dispute_count": row[0], "high_risk": bool(row[1]), "last_dispute_day": row[2], "credit_score": row[3]}
+
+
+class CustomerHistoryStore:
+    """
+    Customer dispute history stored in SQLite, with a bounded LRU read cache.
+
+    Only the cache lives in worker memory; the full customer base stays on
+    disk. The schema is set up once, when the store is created; requests then
+    borrow connections from a small pool, and the database runs in WAL mode
+    so readers never block each other.
+    """
+
+    def __init__(self, path, cache_size=100_000, seed=None, lock_stripes=64, pool_size=8):
+        """
+        Initialize the store.
+
+        Args:
+            path: SQLite database file, or ":memory:" for a private in-memory database
+            cache_size: Maximum number of customers kept in the LRU cache
+            seed: Optional mapping of customer_id to history records, inserted if not present
+            lock_stripes: Number of locks serializing updates to the same customer
+            pool_size: Most idle connections kept for reuse
+        """
+        if path == ":memory:":
+            # A named shared-cache database, so every connection sees the same
+            # data. The anchor connection keeps it alive for the store's lifetime.
+            self._uri = f"file:history-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._uri = f"file:{path}"
+        self.path = path
+        self.cache_size = cache_size
+        self.seed = seed or {}
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._customer_locks = StripedLock(lock_stripes)
+        self._listeners = []
+        self._anchor = self._setup()
+
+    def _open(self):
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _setup(self):
+        """Create the schema, migrate and seed; returns the connection for :memory: stores, else None."""
+        conn = self._open()
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        if self._has_date_column(conn):
+            self._migrate_date_column(conn)
+        if self.seed:
+            conn.executemany(
+                "INSERT OR IGNORE INTO customer_history VALUES (?, ?, ?, ?, ?)",
+                [(customer_id, h["dispute_count"], int(h["high_risk"]), h["last_dispute_day"], h["credit_score"])
+                 for customer_id, h in self.seed.items()],
+            )
+        if self.path == ":memory:":
+            return conn
+        self._release(conn)
+        return None
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a connection from the pool, opening one if none is idle."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @staticmethod
+    def _has_date_column(conn):
+        return any(row[1] == "last_dispute_date" for row in conn.execute("PRAGMA table_info(customer_history)"))
+
+    def _migrate_date_column(self, conn):
+        """Convert ISO date strings from older databases to epoch days."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another connection may have migrated while this one waited for the lock
+            if self._has_date_column(conn):
+                for statement in _MIGRATE_DATE_COLUMN:
+                    conn.execute(statement)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _cache_get(self, customer_id):
+        with self._cache_lock:
+            record = self._cache.get(customer_id, _MISSING)
+            if record is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(customer_id)
+            return record
+
+    def _cache_put(self, customer_id, record, replace=True):
+        with self._cache_lock:
+            if not replace and customer_id in self._cache:
+                return
+            self._cache[customer_id] = record
+            self._cache.move_to_end(customer_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _load(self, customer_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT dispute_count, high_risk, last_dispute_day, credit_score "
+                "FROM customer_history WHERE customer_id = ?", (customer_id,)
+            ).fetchone()
+        return _to_record(row) if row else None
+
+    def get(self, customer_id):
+        """
+        Return the history record for a customer.
+
+        Unknown customers get DEFAULT_HISTORY. Returned records are shared with
+        the cache and must not be modified; use put() to change a record.
+        """
+        record = self._cache_get(customer_id)
+        if record is _MISSING:
+            # Unknown customers are cached as None so repeat lookups stay off disk.
+            # A concurrent write may have cached a newer record since the row was
+            # read, so never overwrite an existing entry here.
+            record = self._load(customer_id)
+            self._cache_put(customer_id, record, replace=False)
+        return DEFAULT_HISTORY if record is None else record
+
+    def get_many(self, customer_ids):
+        """Return history records for a list of customers, with one query for all cache misses."""
+        records = {}
+        missing = []
+        for customer_id in dict.fromkeys(customer_ids):
+            record = self._cache_get(customer_id)
+            if record is _MISSING:
+                missing.append(customer_id)
+            else:
+                records[customer_id] = record
+
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT customer_id, dispute_count, high_risk, last_dispute_day, credit_score "
+                    f"FROM customer_history WHERE customer_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            found = {row[0]: _to_record(row[1:]) for row in rows}
+            for customer_id in chunk:
+                records[customer_id] = found.get(customer_id)
+                self._cache_put(customer_id, records[customer_id], replace=False)
+
+        return [DEFAULT_HISTORY if records[c] is None else records[c] for c in customer_ids]
+
+    def put(self, customer_id, history):
+        """Insert or replace a customer's history record."""
+        record = {
+            "dispute_count": history["dispute_count"],
+            "high_risk": bool(history["high_risk"]),
+            "last_dispute_day": history["last_dispute_day"],
+            "credit_score": history["credit_score"],
+        }
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO customer_history VALUES (?, ?, ?, ?, ?)",
+                (customer_id, record["dispute_count"], int(record["high_risk"]),
+                 record["last_dispute_day"], record["credit_score"]),
+            )
+        self._cache_put(customer_id, record)
+        for listener in self._listeners:
+            listener(customer_id)
+
+    def add_listener(self, callback):
+        """Call callback(customer_id) whenever a customer's history is written."""
+        self._listeners.append(callback)
+
+    def record_dispute(self, customer_id, submission_day):
+        """
+        Atomically count a new dispute against a customer's history.
+
+        Increments dispute_count and moves last_dispute_day forward to
+        submission_day (never backwards). The read and the increment run in
+        one IMMEDIATE transaction, so updates from other processes sharing the
+        database are never lost; within a process, the customer's lock stripe
+        keeps threads from contending for the write lock on the same customer.
+
+        A dispute without a customer_id has no history to count against, so
+        nothing is written and it is scored against DEFAULT_HISTORY, as it is
+        without live updates.
+
+        Returns:
+            dict: The history as it was before this dispute
+        """
+        if customer_id is None:
+            return DEFAULT_HISTORY
+        with self._customer_locks(customer_id), self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT dispute_count, high_risk, last_dispute_day, credit_score "
+                    "FROM customer_history WHERE customer_id = ?", (customer_id,)
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO customer_history (customer_id, dispute_count, last_dispute_day) VALUES (?, 1, ?) "
+                    "ON CONFLICT(customer_id) DO UPDATE SET dispute_count = dispute_count + 1, "
+                    "last_dispute_day = MAX(COALESCE(last_dispute_day, excluded.last_dispute_day), "
+                    "excluded.last_dispute_day)",
+                    (customer_id, submission_day),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        before = _to_record(row) if row else DEFAULT_HISTORY
+        last_dispute_day = before["last_dispute_day"]
+        if last_dispute_day is None or submission_day > last_dispute_day:
+            last_dispute_day = submission_day
+        self._cache_put(customer_id, dict(before, dispute_count=before["dispute_count"] + 1,
+                                          last_dispute_day=last_dispute_day))
+        for listener in self._listeners:
+            listener(customer_id)
+        return before
+
+    def stats(self):
+        """Return cache hit/miss counters."""
+        with self._cache_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+            }
@@ -0,0 +1,169 @@
+import threading
+from time import perf_counter_ns
+
+
+# Each power of two from 2**9 ns (~0.5 us) to 2**35 ns (~34 s) is split into four
+# equal-width buckets (at most 25% wide); values outside that range land in the
+# first or last bucket
+_SUB_BUCKETS = 4
+_MIN_EXPONENT = 9
+_MAX_EXPONENT = 35
+_N_BUCKETS = (_MAX_EXPONENT - _MIN_EXPONENT) * _SUB_BUCKETS
+_UPPER_BOUNDS_NS = [2 ** (_MIN_EXPONENT + i // _SUB_BUCKETS) * (1 + (i % _SUB_BUCKETS + 1) / _SUB_BUCKETS)
+                    for i in range(_N_BUCKETS)]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def bucket_index(duration_ns):
+    """Histogram bucket of a duration: 4 * floor(log2(ns)) plus the two bits below the leading one."""
+    bits = duration_ns.bit_length()
+    if bits <= _MIN_EXPONENT:
+        return 0
+    index = (bits - 1 - _MIN_EXPONENT) * _SUB_BUCKETS + ((duration_ns >> (bits - 3)) & 3)
+    return index if index < _N_BUCKETS else _N_BUCKETS - 1
+
+
+class LatencyHistogram:
+    """Fixed-size log-scale histogram of durations in nanoseconds."""
+
+    __slots__ = ("counts", "count", "sum_ns")
+
+    def __init__(self):
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.sum_ns = 0
+
+    def observe(self, duration_ns):
+        """Record one duration. Not thread-safe; Instrumentation serializes calls."""
+        self.counts[bucket_index(duration_ns)] += 1
+        self.count += 1
+        self.sum_ns += duration_ns
+
+    @staticmethod
+    def quantile(counts, count, q):
+        """Upper bound in ns of the bucket holding the q-th quantile (within 25%)."""
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return _UPPER_BOUNDS_NS[index]
+        return _UPPER_BOUNDS_NS[-1]
+
+
+class StageTimer:
+    """
+    Times consecutive stages of one request.
+
+    Each lap() only notes a timestamp; stop() turns them into the time since
+    the previous lap (or since the timer was created) and adds those to the
+    histograms under a single lock.
+    """
+
+    __slots__ = ("_instrumentation", "_start", "_marks")
+
+    def __init__(self, instrumentation):
+        self._instrumentation = instrumentation
+        self._marks = []
+        self._start = perf_counter_ns()
+
+    def lap(self, stage):
+        self._marks.append((stage, perf_counter_ns()))
+
+    def stop(self):
+        self._instrumentation.observe_marks(self._start, self._marks)
+        if self._marks:
+            self._start = self._marks[-1][1]
+            self._marks = []
+
+
+class _NullTimer:
+    """Timer handed out while instrumentation is disabled; lap() and stop() do nothing."""
+
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """
+    Per-stage latency histograms for the dispute pipeline.
+
+    Call start() at the beginning of a request, lap(stage) on the returned
+    timer as each stage finishes and stop() once the request is done. While
+    disabled, start() returns a shared no-op timer, so instrumented code costs
+    one method call per stage.
+    """
+
+    def __init__(self, enabled=False, prefix="dispute_stage_duration"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        return StageTimer(self) if self.enabled else NULL_TIMER
+
+    def observe_marks(self, start_ns, marks):
+        """
+        Record the stages of one timed request.
+
+        Args:
+            start_ns: perf_counter_ns() when the first stage started
+            marks: (stage, perf_counter_ns() when the stage finished) pairs in order
+        """
+        histograms = self._histograms
+        last = start_ns
+        with self._lock:
+            for stage, timestamp in marks:
+                histogram = histograms.get(stage)
+                if histogram is None:
+                    histogram = histograms[stage] = LatencyHistogram()
+                histogram.observe(timestamp - last)
+                last = timestamp
+
+    def _snapshot(self):
+        """Return {stage: (counts, count, sum_ns)} copied under the lock."""
+        with self._lock:
+            return {stage: (list(h.counts), h.count, h.sum_ns) for stage, h in self._histograms.items()}
+
+    def quantiles(self):
+        """Return {stage: {quantile: seconds}} for p50/p95/p99."""
+        return {stage: {q: LatencyHistogram.quantile(counts, count, q) / 1e9 for q in QUANTILES}
+                for stage, (counts, count, _) in self._snapshot().items()}
+
+    def render_prometheus(self):
+        """Render all histograms in the Prometheus text exposition format."""
+        name = f"{self.prefix}_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of dispute processing.",
+            f"# TYPE {name} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {self.prefix}_quantile_seconds Estimated latency quantiles per stage.",
+            f"# TYPE {self.prefix}_quantile_seconds gauge",
+        ]
+        for stage, (counts, count, sum_ns) in sorted(self._snapshot().items()):
+            # Export one bucket per power of two; finer buckets are only used for quantiles
+            cumulative = 0
+            for index, bucket_count in enumerate(counts):
+                cumulative += bucket_count
+                if (index + 1) % _SUB_BUCKETS == 0 and index < _N_BUCKETS - 1:
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{_UPPER_BOUNDS_NS[index] / 1e9:.9g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {sum_ns / 1e9:.9g}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+            for q in QUANTILES:
+                value = LatencyHistogram.quantile(counts, count, q) / 1e9
+                quantile_lines.append(f'{self.prefix}_quantile_seconds{{stage="{stage}",quantile="{q}"}} {value:.9g}')
+        return "\n".join(lines + quantile_lines) + "\n"
@@ -0,0 +1,210 @@
+"""
+Offline re-scoring of historical disputes.
+
+Reads disputes from a CSV file (with a header row naming customer_id,
+dispute_description, transaction_amount and submission_date) or from NDJSON,
+in chunks. Chunks are scored in parallel by a pool of worker processes, each
+with its own categorizer, compiled rules and read-only connection to the
+customer history database, and results are written in input order as NDJSON
+or CSV. Progress and throughput are reported on stderr.
+
+Invalid records produce an error record ({"line": <n>, "error": <message>})
+and processing continues, as with the streaming endpoint.
+
+Usage:
+    python rescore.py disputes.csv -o rescored.ndjson
+    python rescore.py disputes.ndjson --workers 8 --chunk-size 20000 -o rescored.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from categorizer import KeywordCategorizer
+from history_store import CustomerHistoryStore
+from rules import RuleEngine
+from scoring import evaluate_disputes, submission_day_of, validate_dispute
+
+
+CSV_OUTPUT_FIELDS = ["line", "customer_id", "category", "priority", "high_risk", "recommendation", "error"]
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_chunks(source, input_format, chunk_size):
+    """
+    Yield (header, records) chunks of at most chunk_size input records.
+
+    Records are (line_number, raw) pairs, where raw is an NDJSON line or a
+    list of CSV values; header is the CSV header row (None for NDJSON).
+    Decoding is left to the workers, so it runs in parallel too.
+    """
+    header = None
+    if input_format == "csv":
+        reader = csv.reader(source)
+        header = next(reader, None)
+        rows = ((reader.line_num, row) for row in reader if row)
+    else:
+        rows = ((line_number, line) for line_number, line in enumerate(source, 1) if line.strip())
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield header, chunk
+            chunk = []
+    if chunk:
+        yield header, chunk
+
+
+def decode_record(raw, header):
+    """Turn one raw input record into a dispute dict, or raise ValueError/TypeError."""
+    if header is None:
+        record = json.loads(raw)
+        if not isinstance(record, dict):
+            raise ValueError("Each line must be a JSON object")
+        return record
+    record = dict(zip(header, raw))
+    record["transaction_amount"] = float(record.get("transaction_amount") or 0)
+    if not record.get("submission_date"):
+        record.pop("submission_date", None)
+    return record
+
+
+# Scoring state of the current worker process, created once by _init_worker
+_worker_state = None
+
+
+def _init_worker(history_db, rules_path, keywords_path):
+    global _worker_state
+    categorizer = KeywordCategorizer.from_file(keywords_path) if keywords_path else KeywordCategorizer()
+    _worker_state = (categorizer, CustomerHistoryStore(history_db), RuleEngine(rules_path).rules)
+
+
+def score_chunk(header, records, output_format):
+    """Decode and score one chunk in a worker, returning the encoded output."""
+    categorizer, history_store, rules = _worker_state
+
+    results = [None] * len(records)
+    valid = []
+    for index, (line_number, raw) in enumerate(records):
+        try:
+            dispute = decode_record(raw, header)
+            # The same checks as the API, so a bad record fails its line rather than the chunk
+            validate_dispute(dispute)
+            description = dispute.get("dispute_description", "").lower()
+            valid.append((index, dispute, description, submission_day_of(dispute)))
+        except (TypeError, ValueError, AttributeError) as e:
+            message = f"Invalid JSON: {e}" if isinstance(e, json.JSONDecodeError) else f"Invalid dispute: {e}"
+            results[index] = {"line": line_number, "error": message}
+
+    if valid:
+        indices, disputes, descriptions, submission_days = zip(*valid)
+        categories = categorizer.categorize_batch(list(descriptions))
+        histories = history_store.get_many([d.get("customer_id") for d in disputes])
+        for index, result in zip(indices, evaluate_disputes(list(disputes), categories, histories, rules,
+                                                            list(submission_days))):
+            results[index] = result
+
+    if output_format == "csv":
+        out = io.StringIO()
+        writer = csv.DictWriter(out, CSV_OUTPUT_FIELDS)
+        writer.writerows(dict(result, line=line_number) for (line_number, _), result in zip(records, results))
+        return out.getvalue().encode("utf-8")
+    return "".join(json.dumps(result, separators=(",", ":")) + "\n" for result in results).encode("utf-8")
+
+
+def rescore(chunks, sink, output_format, workers, history_db, rules_path, keywords_path=None, progress=None):
+    """
+    Score chunks in a process pool and write the results to sink in input order.
+
+    At most two chunks per worker are in flight at once, so memory use does
+    not grow with the input size.
+
+    Returns:
+        Number of records processed
+    """
+    rows = 0
+    started = last_report = time.monotonic()
+
+    def report(final=False):
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed else 0.0
+        progress.write(f"\r{rows:,} rows  {rate:,.0f} rows/s" + ("\n" if final else ""))
+        progress.flush()
+
+    if output_format == "csv":
+        sink.write((",".join(CSV_OUTPUT_FIELDS) + "\r\n").encode("utf-8"))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(history_db, rules_path, keywords_path)) as pool:
+        in_flight = deque()
+
+        def write_oldest():
+            nonlocal rows, last_report
+            future, size = in_flight.popleft()
+            sink.write(future.result())
+            rows += size
+            if progress is not None and time.monotonic() - last_report >= 1:
+                last_report = time.monotonic()
+                report()
+
+        for header, records in chunks:
+            if len(in_flight) >= 2 * workers:
+                write_oldest()
+            in_flight.append((pool.submit(score_chunk, header, records, output_format), len(records)))
+        while in_flight:
+            write_oldest()
+
+    if progress is not None:
+        report(final=True)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score historical disputes in parallel.")
+    parser.add_argument("input", help="CSV or NDJSON input file, or - for NDJSON on stdin")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--input-format", choices=["csv", "ndjson"],
+                        help="Input format (default: csv for .csv files, otherwise ndjson)")
+    parser.add_argument("--output-format", choices=["csv", "ndjson"],
+                        help="Output format (default: csv for .csv output files, otherwise ndjson)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Records per chunk (default: 10000)")
+    parser.add_argument("--history-db", default=os.environ.get('CUSTOMER_HISTORY_DB',
+                                                               os.path.join(_HERE, 'customer_history.db')),
+                        help="Customer history database (default: as the API)")
+    parser.add_argument("--rules", default=os.environ.get('DISPUTE_RULES_FILE',
+                                                          os.path.join(_HERE, 'dispute_rules.json')),
+                        help="Rules file (default: as the API)")
+    parser.add_argument("--keywords", default=os.environ.get('DISPUTE_KEYWORDS_FILE'),
+                        help="Keyword vocabulary file (default: built-in keywords)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't report progress")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.history_db):
+        parser.error(f"history database not found: {args.history_db}")
+    input_format = args.input_format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    output_format = args.output_format or ("csv" if (args.output or "").endswith(".csv") else "ndjson")
+
+    if args.input == "-":
+        source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    else:
+        source = open(args.input, encoding="utf-8", newline="")
+    sink = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        rescore(read_chunks(source, input_format, args.chunk_size), sink, output_format, args.workers,
+                args.history_db, args.rules, args.keywords, progress=None if args.quiet else sys.stderr)
+    finally:
+        if args.input != "-":
+            source.close()
+        if sink is not sys.stdout.buffer:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def request_fingerprint(data, submission_day):
+    """
+    Hash the fields of a dispute that determine its response.
+
+    The description is lowercased, as categorization is case-insensitive, and
+    the submission date is passed in resolved (so a request without one is
+    keyed on today's date), making trivially different retries share a key.
+    """
+    normalized = {
+        "customer_id": data.get("customer_id"),
+        "dispute_description": data.get("dispute_description", "").lower(),
+        "transaction_amount": data.get("transaction_amount", 0),
+        "submission_day": submission_day,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class IdempotencyKeyReused(Exception):
+    """An idempotency key was sent again with a different request body."""
+
+
+class ResponseCache:
+    """
+    Bounded response cache with per-entry TTL and LRU eviction.
+
+    Entries are indexed by customer so that every cached response for a
+    customer can be dropped when that customer's history changes. Entries
+    answering requests whose side effects were recorded (e.g. the dispute was
+    counted in the customer's history) are not indexed: they are idempotency
+    records, which must be replayed, not recomputed, until they expire.
+    """
+
+    def __init__(self, max_size=10_000, ttl_seconds=300):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of cached responses; 0 disables caching
+            ttl_seconds: Seconds a cached response stays valid
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # key -> (expires_at, customer_id, response, fingerprint)
+        self._entries = OrderedDict()
+        self._keys_by_customer = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        """Remove an entry and its customer index. Caller holds the lock."""
+        _, customer_id, _, _ = self._entries.pop(key)
+        keys = self._keys_by_customer.get(customer_id)
+        if keys is None or key not in keys:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_customer[customer_id]
+
+    def get(self, key, fingerprint=None):
+        """
+        Return the cached response for key, or None.
+
+        Raises:
+            IdempotencyKeyReused: If the entry was stored for a different
+                request fingerprint (only checked when both are given)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if fingerprint is not None and entry[3] is not None and entry[3] != fingerprint:
+                raise IdempotencyKeyReused(key)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, customer_id, response, fingerprint=None, invalidate=True):
+        """
+        Cache a response.
+
+        Args:
+            fingerprint: Identifies the request the response answers, if key doesn't
+            invalidate: Drop the entry when the customer's history changes; False
+                for responses to recorded requests, which must be replayed
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, customer_id, response, fingerprint)
+            if invalidate:
+                self._keys_by_customer.setdefault(customer_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_customer(self, customer_id):
+        """Drop every cached response for a customer, except idempotency records."""
+        with self._lock:
+            for key in list(self._keys_by_customer.get(customer_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "capacity": self.max_size,
+            }
@@ -0,0 +1,215 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from velocity import WINDOWS as VELOCITY_WINDOWS
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("Low", "Medium", "High")
+
+# Decision tables have 2**n entries per dispute-count tier, so keep n small
+MAX_PREDICATES = 16
+
+
+def _recent(days):
+    return (lambda f: f["days_since_last_dispute"] is not None and f["days_since_last_dispute"] <= days,
+            lambda c: c["has_last_dispute"] & (c["days_since_last_dispute"] <= days))
+
+
+def _amount_over(amount):
+    return (lambda f: f["transaction_amount"] > amount,
+            lambda c: c["transaction_amount"] > amount)
+
+
+def _category(category):
+    return (lambda f: f["category"] == category,
+            lambda c: c["category"] == category)
+
+
+def _history_high_risk(value):
+    if value is not True:
+        raise ValueError("history_high_risk condition must be true")
+    return (lambda f: bool(f["history_high_risk"]),
+            lambda c: c["history_high_risk"].astype(bool))
+
+
+def _credit_score_below(score):
+    return (lambda f: f["credit_score"] < score,
+            lambda c: c["credit_score"] < score)
+
+
+def _dispute_count_at_least(count):
+    return (lambda f: f["dispute_count"] >= count,
+            lambda c: c["dispute_count"] >= count)
+
+
+def _feature_at_least(feature):
+    return lambda threshold: (lambda f: f[feature] >= threshold,
+                              lambda c: c[feature] >= threshold)
+
+
+def _feature_over(feature):
+    return lambda threshold: (lambda f: f[feature] > threshold,
+                              lambda c: c[feature] > threshold)
+
+
+# Condition name -> factory returning (scalar predicate, vectorized predicate)
+CONDITIONS = {
+    "recent_within_days": _recent,
+    "amount_over": _amount_over,
+    "category": _category,
+    "history_high_risk": _history_high_risk,
+    "credit_score_below": _credit_score_below,
+    "dispute_count_at_least": _dispute_count_at_least,
+}
+
+# Rolling velocity, e.g. {"disputes_in_24h_at_least": 3} or {"amount_in_7d_over": 5000}
+for _window in VELOCITY_WINDOWS:
+    CONDITIONS[f"disputes_in_{_window}_at_least"] = _feature_at_least(f"disputes_{_window}")
+    CONDITIONS[f"amount_in_{_window}_over"] = _feature_over(f"amount_{_window}")
+
+
+class CompiledRules:
+    """
+    Priority and high-risk rules compiled into flat decision tables.
+
+    Every distinct condition in the rule file becomes one bit of a mask, and
+    the base priority comes from the dispute-count tier. Compilation runs the
+    escalation rules once for every (tier, mask) combination, so evaluating a
+    dispute is a tier lookup, a few comparisons to build its mask, and two
+    table lookups, for one dispute or a whole column of them.
+    """
+
+    def __init__(self, config):
+        tiers = sorted(config["dispute_count_tiers"], key=lambda tier: tier["min_count"])
+        self.tier_thresholds = [tier["min_count"] for tier in tiers]
+        tier_priorities = [config.get("default_priority", "Low")] + [tier["priority"] for tier in tiers]
+
+        self.predicates = []
+        self.vector_predicates = []
+        predicate_bits = {}
+
+        def mask_of(condition):
+            """Map a condition dict to the bitmask of the predicates it requires."""
+            mask = 0
+            for kind, value in condition.items():
+                if kind not in CONDITIONS:
+                    raise ValueError(f"Unknown rule condition: {kind}")
+                key = (kind, value)
+                if key not in predicate_bits:
+                    predicate_bits[key] = len(self.predicates)
+                    scalar, vector = CONDITIONS[kind](value)
+                    self.predicates.append(scalar)
+                    self.vector_predicates.append(vector)
+                mask |= 1 << predicate_bits[key]
+            return mask
+
+        escalations = []
+        for rule in config.get("escalations", []):
+            from_codes = {self._code(p) for p in rule["from"]} if "from" in rule else None
+            escalations.append((mask_of(rule["when"]), from_codes, self._code(rule["to"])))
+        high_risk_masks = [mask_of(condition) for condition in config.get("high_risk_when", [])]
+
+        if len(self.predicates) > MAX_PREDICATES:
+            raise ValueError(f"Rules use {len(self.predicates)} distinct conditions; at most {MAX_PREDICATES} allowed")
+
+        # Rules fire when all their conditions hold; escalations apply in file order
+        n_masks = 1 << len(self.predicates)
+        self.priority_table = np.empty((len(tier_priorities), n_masks), dtype=np.int8)
+        self.high_risk_table = np.zeros(n_masks, dtype=bool)
+        for mask in range(n_masks):
+            for tier, tier_priority in enumerate(tier_priorities):
+                priority = self._code(tier_priority)
+                for required, from_codes, to in escalations:
+                    if mask & required == required and (from_codes is None or priority in from_codes):
+                        priority = to
+                self.priority_table[tier, mask] = priority
+            self.high_risk_table[mask] = any(mask & required == required for required in high_risk_masks)
+        self._priority_rows = self.priority_table.tolist()
+        self._high_risk_list = self.high_risk_table.tolist()
+
+    @staticmethod
+    def _code(priority):
+        try:
+            return PRIORITIES.index(priority)
+        except ValueError:
+            raise ValueError(f"Unknown priority {priority!r}; expected one of {PRIORITIES}") from None
+
+    def evaluate(self, features):
+        """
+        Return (priority, high_risk) for one dispute.
+
+        Args:
+            features: dict with dispute_count, days_since_last_dispute (None if no
+                prior dispute), transaction_amount, category, history_high_risk,
+                credit_score and the velocity FEATURES (disputes_24h, amount_7d, ...)
+        """
+        mask = 0
+        for bit, predicate in enumerate(self.predicates):
+            if predicate(features):
+                mask |= 1 << bit
+        tier = bisect.bisect_right(self.tier_thresholds, features["dispute_count"])
+        return PRIORITIES[self._priority_rows[tier][mask]], self._high_risk_list[mask]
+
+    def evaluate_batch(self, columns):
+        """
+        Return (priority_codes, high_risk) arrays for a batch of disputes.
+
+        Args:
+            columns: dict of equal-length NumPy arrays with the same keys as
+                evaluate() features, plus has_last_dispute; days_since_last_dispute
+                may hold any value where has_last_dispute is False
+        """
+        n = len(columns["dispute_count"])
+        mask = np.zeros(n, dtype=np.int64)
+        for bit, predicate in enumerate(self.vector_predicates):
+            mask |= predicate(columns).astype(np.int64) << bit
+        tier = np.searchsorted(self.tier_thresholds, columns["dispute_count"], side="right")
+        return self.priority_table[tier, mask], self.high_risk_table[mask]
+
+
+class RuleEngine:
+    """
+    Loads CompiledRules from a JSON file and hot-reloads it when the file changes.
+
+    The file's modification time is checked at most once per check_interval
+    seconds; a changed file is recompiled and swapped in atomically, so running
+    workers pick up new rules without a restart. If the new file is invalid the
+    previous rules stay active.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._rules = self._load()
+        self._mtime = os.stat(path).st_mtime_ns
+        self._next_check = time.monotonic() + check_interval
+        self._reload_lock = threading.Lock()
+
+    def _load(self):
+        with open(self.path) as f:
+            return CompiledRules(json.load(f))
+
+    @property
+    def rules(self):
+        """The current CompiledRules, reloading the file first if it has changed."""
+        if time.monotonic() >= self._next_check and self._reload_lock.acquire(blocking=False):
+            try:
+                self._next_check = time.monotonic() + self.check_interval
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    self._rules = self._load()
+                    logger.info("Reloaded dispute rules from %s", self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error("Keeping previous dispute rules; failed to load %s: %s", self.path, e)
+            finally:
+                self._reload_lock.release()
+        return self._rules
@@ -0,0 +1,79 @@
+"""
+Streaming NDJSON dispute processing.
+
+Reads newline-delimited JSON disputes, scores them one record at a time and
+writes one JSON result per line. Every stage is a generator, so memory use
+stays constant regardless of input size. Malformed lines produce an error
+record ({"line": <n>, "error": <message>}) and processing continues.
+
+Usage:
+    python stream_disputes.py disputes.ndjson > results.ndjson
+    cat disputes.ndjson | python stream_disputes.py - -o results.ndjson
+"""
+import argparse
+import json
+import sys
+
+
+def parse_lines(lines):
+    """Yield (line_number, dispute, error) for each non-blank line; error is None for valid lines."""
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, record, None
+
+
+def score_records(parsed, score):
+    """Apply `score` to each parsed dispute, turning failures into error records."""
+    for line_number, record, error in parsed:
+        if error is None:
+            try:
+                yield score(record)
+                continue
+            except (TypeError, ValueError, AttributeError) as e:
+                error = f"Invalid dispute: {e}"
+        yield {"line": line_number, "error": error}
+
+
+def encode_ndjson(results):
+    """Encode results as NDJSON bytes, one line per result."""
+    for result in results:
+        yield (json.dumps(result, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def process_ndjson(lines, score):
+    """Full pipeline: NDJSON lines in, NDJSON result lines out."""
+    return encode_ndjson(score_records(parse_lines(lines), score))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score an NDJSON file of disputes, streaming NDJSON results.")
+    parser.add_argument("input", help="NDJSON input file, or - for stdin")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # Imported here because app imports this module for its streaming endpoint
+    from app import score_dispute
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    sink = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in process_ndjson(source, score_dispute):
+            sink.write(chunk)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if sink is not sys.stdout.buffer:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
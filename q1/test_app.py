@@ -0,0 +1,786 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import app as dispute_app
+from batching import MicroBatchExecutor, StandInModel
+import rescore
+import stream_disputes
+from categorizer import KeywordCategorizer
+import dedup
+from dedup import NearDuplicateIndex
+from history_store import CustomerHistoryStore, DEFAULT_HISTORY, epoch_day
+from metrics import NULL_TIMER, Instrumentation, LatencyHistogram
+from response_cache import ResponseCache
+from rules import PRIORITIES, CompiledRules, RuleEngine
+from triage_queue import TriageQueue
+import velocity as velocity_module
+from velocity import VelocityTracker
+
+
+DISPUTES = [
+    {"customer_id": "C001", "dispute_description": "This was an unauthorized transaction on my card",
+     "transaction_amount": 1500, "submission_date": "2025-05-01"},
+    {"customer_id": "C002", "dispute_description": "There was a billing error on my account",
+     "transaction_amount": 500, "submission_date": "2025-05-01"},
+    {"customer_id": "C003", "dispute_description": "I have a question about this charge",
+     "transaction_amount": 200},
+    {"customer_id": "C002", "dispute_description": "Suspected FRAUD", "transaction_amount": 20,
+     "submission_date": "2025-03-15"},
+    {"customer_id": "C001", "dispute_description": "Charged twice", "transaction_amount": 1000.01,
+     "submission_date": "2025-05-20"},
+    {"customer_id": "C001", "dispute_description": "Charged twice", "transaction_amount": 10,
+     "submission_date": "2025-05-21"},
+]
+
+
+@pytest.fixture(autouse=True)
+def history_store(monkeypatch):
+    store = CustomerHistoryStore(":memory:", cache_size=100, seed=dispute_app.SEED_CUSTOMER_HISTORY)
+    store.add_listener(dispute_app.on_history_change)
+    monkeypatch.setattr(dispute_app, 'history_store', store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    cache = ResponseCache(max_size=100, ttl_seconds=60)
+    monkeypatch.setattr(dispute_app, 'response_cache', cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def triage_queue(monkeypatch):
+    queue = TriageQueue()
+    monkeypatch.setattr(dispute_app, 'triage_queue', queue)
+    return queue
+
+
+@pytest.fixture
+def client():
+    dispute_app.app.config['TESTING'] = True
+    with dispute_app.app.test_client() as client:
+        yield client
+
+
+def test_process_dispute_fraud_high_risk(client):
+    response = client.post('/process-dispute', json=DISPUTES[0])
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'customer_id': 'C001',
+        'category': 'Fraud',
+        'priority': 'High',
+        'high_risk': True,
+        'recommendation': 'Review Fraud dispute. Priority: High. Flag for high-risk investigation.'
+    }
+
+
+def test_batch_matches_single_dispute_path(client):
+    expected = [client.post('/process-dispute', json=d).get_json() for d in DISPUTES]
+    response = client.post('/process-disputes', json=DISPUTES)
+    assert response.status_code == 200
+    assert response.get_json() == expected
+
+
+def test_batch_rejects_non_array(client):
+    response = client.post('/process-disputes', json=DISPUTES[0])
+    assert response.status_code == 400
+
+
+def test_batch_and_single_reject_the_same_invalid_disputes(client):
+    invalid = [1, None, "C001", {"dispute_description": 5}, dict(DISPUTES[0], transaction_amount="1500"),
+               dict(DISPUTES[0], transaction_amount=True), dict(DISPUTES[0], submission_date=20250501),
+               dict(DISPUTES[0], customer_id=["C001"])]
+    for dispute in invalid:
+        single = client.post('/process-dispute', data=json.dumps(dispute), content_type='application/json')
+        assert single.status_code == 400
+        response = client.post('/process-disputes', json=[DISPUTES[1], dispute])
+        assert response.status_code == 400
+        assert "at index 1" in response.get_json()["error"]
+
+
+def test_batch_empty(client):
+    assert client.post('/process-disputes', json=[]).get_json() == []
+
+
+def test_categorizer_default_precedence():
+    categorizer = KeywordCategorizer()
+    assert categorizer.categorize("Billing ERROR, looks like fraud") == "Fraud"
+    assert categorizer.categorize("terror of a statement") == "Billing Error"
+    assert categorizer.categorize("question about a charge") == "Other"
+
+
+def test_categorizer_overlapping_keywords_respect_precedence():
+    categorizer = KeywordCategorizer({"she": "Fraud", "he": "Billing Error", "hers": "Billing Error"})
+    assert categorizer.categorize("ushers") == "Fraud"
+    assert categorizer.categorize("the") == "Billing Error"
+
+
+def test_categorizer_matches_substring_scan_without_growing():
+    rng = np.random.default_rng(4)
+    alphabet = list("abcab ") + ["\u4e2d", "\u6587", "\u00e9"]
+    precedence = ("Fraud", "Billing Error", "Refund")
+    keywords = {"".join(rng.choice(list("abc"), rng.integers(1, 5))): precedence[rng.integers(3)] for _ in range(40)}
+    categorizer = KeywordCategorizer(keywords, precedence)
+    transitions = sum(len(table) for table in categorizer._goto)
+    for _ in range(2000):
+        description = "".join(rng.choice(alphabet, rng.integers(0, 30)))
+        matched = [precedence.index(category) for keyword, category in keywords.items() if keyword in description]
+        assert categorizer.categorize(description) == (precedence[min(matched)] if matched else "Other")
+    # Scanning never adds transitions, whatever characters come in
+    assert sum(len(table) for table in categorizer._goto) == transitions
+
+
+def test_categorizer_from_file(tmp_path):
+    path = tmp_path / "keywords.json"
+    path.write_text(json.dumps({
+        "keywords": {"chargeback": "Fraud", "double charge": "Billing Error", "refund": "Refund"},
+        "precedence": ["Fraud", "Billing Error", "Refund"],
+    }))
+    categorizer = KeywordCategorizer.from_file(str(path))
+    assert categorizer.categorize("Refund after a double charge") == "Billing Error"
+    assert categorizer.categorize("refund please") == "Refund"
+    assert categorizer.categorize("nothing") == "Other"
+
+
+def test_categorizer_rejects_category_without_precedence():
+    with pytest.raises(ValueError):
+        KeywordCategorizer({"refund": "Refund"})
+
+
+def test_history_store_default_for_unknown_customer(history_store):
+    assert history_store.get("C999") == DEFAULT_HISTORY
+    assert history_store.get_many(["C999", "C001"])[0] == DEFAULT_HISTORY
+
+
+def test_history_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "history.db")
+    record = {"dispute_count": 3, "high_risk": False, "last_dispute_day": epoch_day("2025-01-31"), "credit_score": 580}
+    CustomerHistoryStore(path).put("C100", record)
+    assert CustomerHistoryStore(path).get("C100") == record
+
+
+def test_history_store_reuses_pooled_connections(tmp_path, monkeypatch):
+    store = CustomerHistoryStore(str(tmp_path / "history.db"), cache_size=0, seed=dispute_app.SEED_CUSTOMER_HISTORY)
+    opened = []
+    open_connection = store._open
+    monkeypatch.setattr(store, '_open', lambda: opened.append(1) or open_connection())
+    # A thread per request, as under Flask's development server
+    for i in range(50):
+        thread = threading.Thread(target=store.get, args=(f"C{i % 3:03d}",))
+        thread.start()
+        thread.join()
+    assert store.get("C001")["dispute_count"] == 5
+    assert len(opened) == 0
+
+
+def test_history_store_lru_cache(history_store):
+    history_store.cache_size = 2
+    history_store.get("C001")
+    history_store.get("C001")
+    history_store.get_many(["C002", "C003", "C001"])
+    stats = history_store.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 3, 2)
+    # C001 was least recently used when C002 and C003 were loaded, so it was evicted
+    history_store.get("C001")
+    assert history_store.stats()["misses"] == 4
+
+
+@pytest.fixture
+def live_history(monkeypatch):
+    monkeypatch.setitem(dispute_app.app.config, 'LIVE_HISTORY_UPDATES', True)
+
+
+def test_live_updates_escalate_repeat_disputes(client, live_history):
+    dispute = {"customer_id": "C050", "dispute_description": "Charged twice", "submission_date": "2025-06-01"}
+    priorities = [client.post('/process-dispute', json=dict(dispute, transaction_amount=50 + i)).get_json()['priority']
+                  for i in range(5)]
+    # 0 and 1 prior disputes are Low, 2-3 are Medium escalated to High by recency, 4+ are High
+    assert priorities == ["Low", "Low", "High", "High", "High"]
+    assert dispute_app.history_store.get("C050")["dispute_count"] == 5
+
+
+def test_live_updates_batch_matches_sequential_requests(client, live_history, monkeypatch):
+    expected = [client.post('/process-dispute', json=d).get_json() for d in DISPUTES]
+    monkeypatch.setattr(dispute_app, 'history_store', CustomerHistoryStore(
+        ":memory:", seed=dispute_app.SEED_CUSTOMER_HISTORY))
+    assert client.post('/process-disputes', json=DISPUTES).get_json() == expected
+
+
+def test_live_updates_last_dispute_day_only_moves_forward(history_store):
+    history_store.record_dispute("C002", epoch_day("2025-02-01"))
+    assert history_store.get("C002")["last_dispute_day"] == epoch_day("2025-03-01")
+    history_store.record_dispute("C002", epoch_day("2025-03-05"))
+    assert history_store.get("C002") == {"dispute_count": 3, "high_risk": False,
+                                         "last_dispute_day": epoch_day("2025-03-05"), "credit_score": 750}
+
+
+def test_live_updates_counts_exact_under_parallel_submissions(tmp_path, monkeypatch, live_history):
+    store = CustomerHistoryStore(str(tmp_path / "history.db"), cache_size=2,
+                                 seed=dispute_app.SEED_CUSTOMER_HISTORY, lock_stripes=4)
+    store.add_listener(dispute_app.on_history_change)
+    monkeypatch.setattr(dispute_app, 'history_store', store)
+    customers = ["C001", "C002", "C200", "C201", "C202"]
+    n_threads, per_thread = 8, 50
+    errors = []
+
+    def submit(thread_index):
+        with dispute_app.app.test_client() as client:
+            for i in range(per_thread):
+                response = client.post('/process-dispute', json={
+                    "customer_id": customers[(thread_index + i) % len(customers)],
+                    "dispute_description": f"Charged twice ({thread_index}-{i})",
+                    "transaction_amount": 10,
+                    "submission_date": f"2025-06-{i % 28 + 1:02d}",
+                })
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=submit, args=(t,)) for t in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    submitted = {c: 0 for c in customers}
+    for t in range(n_threads):
+        for i in range(per_thread):
+            submitted[customers[(t + i) % len(customers)]] += 1
+    # Check against a fresh store so the counts come from disk, not the cache
+    reopened = CustomerHistoryStore(str(tmp_path / "history.db"))
+    for customer_id, count in submitted.items():
+        initial = dispute_app.SEED_CUSTOMER_HISTORY.get(customer_id, DEFAULT_HISTORY)["dispute_count"]
+        assert reopened.get(customer_id)["dispute_count"] == initial + count
+        assert reopened.get(customer_id)["last_dispute_day"] == epoch_day("2025-06-28")
+
+
+def _record_disputes(path, customer_id, count):
+    store = CustomerHistoryStore(path, cache_size=2)
+    for i in range(count):
+        store.record_dispute(customer_id, epoch_day("2025-06-01") + i % 28)
+
+
+def test_live_updates_counts_exact_across_processes(tmp_path):
+    path = str(tmp_path / "history.db")
+    CustomerHistoryStore(path, seed=dispute_app.SEED_CUSTOMER_HISTORY)
+    n_processes, per_process = 4, 150
+    processes = [multiprocessing.Process(target=_record_disputes, args=(path, customer_id, per_process))
+                 for customer_id in ["C009"] * n_processes + ["C001"] * n_processes]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    reopened = CustomerHistoryStore(path)
+    assert reopened.get("C009")["dispute_count"] == n_processes * per_process
+    assert reopened.get("C001") == dict(dispute_app.SEED_CUSTOMER_HISTORY["C001"],
+                                        dispute_count=5 + n_processes * per_process,
+                                        last_dispute_day=epoch_day("2025-06-28"))
+
+
+def test_live_updates_do_not_count_rejected_disputes(client, live_history, history_store):
+    dispute = {"customer_id": "C009", "dispute_description": "Charged twice", "transaction_amount": "12"}
+    for _ in range(3):
+        assert client.post('/process-dispute', json=dispute).status_code == 400
+    valid = dict(dispute, transaction_amount=12)
+    assert client.post('/process-disputes', json=[valid, valid, dispute]).status_code == 400
+    assert history_store.get("C009")["dispute_count"] == 0
+
+
+def test_live_updates_score_anonymous_disputes_against_default_history(client, live_history):
+    anonymous = {"dispute_description": "Charged twice", "transaction_amount": 12, "submission_date": "2025-06-01"}
+    expected = dispute_app.evaluate_dispute(anonymous, dispute_app.categorizer.categorize("charged twice"),
+                                            DEFAULT_HISTORY, dispute_app.rule_engine.rules)
+
+    response = client.post('/process-dispute', json=anonymous)
+    assert (response.status_code, response.get_json()) == (200, expected)
+    response = client.post('/process-disputes', json=[anonymous, DISPUTES[0], anonymous])
+    assert response.status_code == 200
+    assert response.get_json()[0] == response.get_json()[2] == expected
+
+    body = "\n".join(json.dumps(dispute) for dispute in (anonymous, DISPUTES[1], anonymous)) + "\n"
+    response = client.post('/process-disputes/stream', data=body, content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 3 and lines[0] == lines[2] == expected
+
+
+def test_stream_endpoint_scores_ndjson_and_reports_bad_lines(client):
+    body = "\n".join([json.dumps(DISPUTES[0]), "{not json", "", json.dumps(DISPUTES[1]), "[1, 2]",
+                      json.dumps({"customer_id": "C001", "transaction_amount": "lots"})]) + "\n"
+    response = client.post('/process-disputes/stream', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == client.post('/process-dispute', json=DISPUTES[0]).get_json()
+    assert lines[1]["line"] == 2 and lines[1]["error"].startswith("Invalid JSON")
+    assert lines[2] == client.post('/process-dispute', json=DISPUTES[1]).get_json()
+    assert lines[3] == {"line": 5, "error": "Each line must be a JSON object"}
+    assert lines[4]["line"] == 6 and lines[4]["error"].startswith("Invalid dispute")
+    assert len(lines) == 5
+
+
+def test_stream_cli(tmp_path):
+    source = tmp_path / "disputes.ndjson"
+    output = tmp_path / "results.ndjson"
+    source.write_text("".join(json.dumps(d) + "\n" for d in DISPUTES[:2]))
+    stream_disputes.main([str(source), "-o", str(output)])
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["category"] for r in results] == ["Fraud", "Billing Error"]
+
+
+def test_recency_window_boundary(client, history_store):
+    history_store.put("C300", {"dispute_count": 2, "high_risk": False,
+                               "last_dispute_day": epoch_day("2025-04-01"), "credit_score": 700})
+    dispute = {"customer_id": "C300", "dispute_description": "Charged twice", "transaction_amount": 10}
+    disputes = [dict(dispute, submission_date=d) for d in ("2025-05-01", "2025-05-02", "2025-05-01T23:59:00")]
+    priorities = [client.post('/process-dispute', json=d).get_json()['priority'] for d in disputes]
+    assert priorities == ["High", "Medium", "High"]
+    assert [r['priority'] for r in client.post('/process-disputes', json=disputes).get_json()] == priorities
+
+
+def test_invalid_submission_date_is_rejected(client):
+    dispute = dict(DISPUTES[0], submission_date="01/05/2025")
+    assert client.post('/process-dispute', json=dispute).status_code == 400
+    assert client.post('/process-disputes', json=[dispute]).status_code == 400
+
+
+def test_queue_claims_in_priority_order(client):
+    queued = [
+        {"customer_id": "C002", "dispute_description": "billing error", "transaction_amount": 300,
+         "submission_date": "2025-06-01"},                                     # Low
+        {"customer_id": "C003", "dispute_description": "fraud", "transaction_amount": 50,
+         "submission_date": "2025-06-02"},                                     # High, high risk, small
+        {"customer_id": "C003", "dispute_description": "fraud", "transaction_amount": 900,
+         "submission_date": "2025-06-03"},                                     # High, high risk, larger
+        {"customer_id": "C003", "dispute_description": "fraud", "transaction_amount": 900,
+         "submission_date": "2025-06-01"},                                     # same, submitted earlier
+        {"customer_id": "C001", "dispute_description": "charged twice", "transaction_amount": 10,
+         "submission_date": "2025-06-01"},                                     # High, high-risk history
+    ]
+    ids = [client.post('/queue/disputes', json=d).get_json()['dispute_id'] for d in queued]
+    claimed = []
+    while True:
+        response = client.post('/queue/claim')
+        if response.status_code == 204:
+            break
+        claim = response.get_json()
+        claimed.append(claim['dispute']['dispute_id'])
+        assert client.post('/queue/ack', json={'receipt': claim['receipt']}).status_code == 200
+    assert claimed == [ids[3], ids[2], ids[1], ids[4], ids[0]]
+    assert client.get('/queue/stats').get_json() == {"pending": 0, "in_flight": 0}
+
+
+def test_queue_unacked_claim_is_redelivered_after_timeout(client):
+    client.post('/queue/disputes', json=DISPUTES[0])
+    first = client.post('/queue/claim', json={'visibility_timeout': 0.001}).get_json()
+    time.sleep(0.01)
+    second = client.post('/queue/claim', json={'visibility_timeout': 60}).get_json()
+    assert second['dispute'] == first['dispute']
+    assert client.post('/queue/ack', json={'receipt': first['receipt']}).status_code == 404
+    assert client.post('/queue/ack', json={'receipt': second['receipt']}).status_code == 200
+    assert client.post('/queue/claim').status_code == 204
+
+
+def test_queue_rejects_bad_visibility_timeouts(client):
+    client.post('/queue/disputes', json=DISPUTES[0])
+    for timeout in ("abc", 0, -5, True, float(dispute_app.MAX_VISIBILITY_TIMEOUT + 1)):
+        assert client.post('/queue/claim', json={'visibility_timeout': timeout}).status_code == 400, timeout
+    # Nothing was claimed or lost meanwhile
+    assert client.get('/queue/stats').get_json() == {"pending": 1, "in_flight": 0}
+    assert client.post('/queue/disputes', json=DISPUTES[0]).status_code == 200
+    assert client.post('/queue/claim', json={'visibility_timeout': 30}).get_json()['dispute']['customer_id'] == "C001"
+
+
+def test_queue_snapshot_survives_restart(tmp_path):
+    path = str(tmp_path / "queue.pkl")
+    queue = TriageQueue(snapshot_path=path)
+    for amount in (10, 20, 30):
+        queue.enqueue({"priority": "Medium", "high_risk": False, "transaction_amount": amount}, 0)
+    in_flight = queue.claim()
+    queue.snapshot()
+
+    restored = TriageQueue(snapshot_path=path)
+    # The claim in flight at shutdown is claimable again, still in priority order
+    assert restored.stats() == {"pending": 3, "in_flight": 0}
+    assert restored.claim()["dispute"] == in_flight["dispute"]
+    restored.enqueue({"priority": "Medium", "high_risk": False, "transaction_amount": 20}, 0)
+    assert [restored.claim()["dispute"]["transaction_amount"] for _ in range(3)] == [20, 20, 10]
+
+
+def test_queue_journal_replays_without_snapshot(tmp_path):
+    path = str(tmp_path / "queue.pkl")
+    queue = TriageQueue(snapshot_path=path, compact_min_records=4)
+    for amount in range(1, 11):
+        queue.enqueue({"dispute_id": str(amount), "priority": "Medium", "high_risk": False,
+                       "transaction_amount": amount}, 0)
+    assert not queue.enqueue({"dispute_id": "3", "priority": "High", "high_risk": True,
+                              "transaction_amount": 3}, 0)
+    for _ in range(3):
+        queue.ack(queue.claim()["receipt"])
+    claimed = queue.claim()
+    # Let background compactions finish, then leave without a final snapshot, as a crash would
+    for thread in threading.enumerate():
+        if thread.name == "triage-queue-compaction":
+            thread.join()
+    assert os.path.exists(path)
+    queue._journal.write(b"\x80\x05\x95")
+
+    restored = TriageQueue(snapshot_path=path)
+    assert restored.stats() == {"pending": 7, "in_flight": 0}
+    assert restored.claim()["dispute"] == claimed["dispute"]
+    assert not restored.enqueue({"dispute_id": "5", "priority": "Low", "high_risk": False,
+                                 "transaction_amount": 5}, 0)
+    restored.enqueue({"dispute_id": "11", "priority": "High", "high_risk": False, "transaction_amount": 11}, 0)
+    # The torn record was dropped, so records written after it replay too
+    assert TriageQueue(snapshot_path=path).stats() == {"pending": 8, "in_flight": 0}
+
+
+def test_queue_enqueue_is_idempotent(client, live_history, history_store):
+    dispute = {"customer_id": "C010", "dispute_description": "Charged twice", "transaction_amount": 10,
+               "submission_date": "2025-06-01"}
+    processed = client.post('/process-dispute', json=dispute).get_json()
+    first = client.post('/queue/disputes', json=dispute)
+    retry = client.post('/queue/disputes', json=dispute)
+    assert (first.status_code, retry.status_code) == (201, 200)
+    assert first.get_json() == retry.get_json()
+    assert first.get_json()['priority'] == processed['priority']
+    assert history_store.get("C010")["dispute_count"] == 1
+    assert client.get('/queue/stats').get_json() == {"pending": 1, "in_flight": 0}
+
+
+@pytest.fixture
+def batched_categorizer(monkeypatch):
+    executor = MicroBatchExecutor(StandInModel, max_batch_size=8, max_wait_ms=50, workers=2)
+    monkeypatch.setattr(dispute_app, 'categorizer', executor)
+    yield executor
+    executor.shutdown()
+
+
+def test_micro_batching_matches_keyword_categorizer(batched_categorizer):
+    descriptions = [d["dispute_description"] for d in DISPUTES] * 5
+    futures = [batched_categorizer.submit(description) for description in descriptions]
+    expected = KeywordCategorizer().categorize_batch(descriptions)
+    assert [future.result(timeout=10) for future in futures] == expected
+    stats = batched_categorizer.stats()
+    assert stats["items"] == len(descriptions)
+    # Submitted together, so they are grouped into full batches
+    assert stats["batches"] < len(descriptions)
+
+
+def test_micro_batching_concurrent_requests(client, batched_categorizer):
+    expected = [client.post('/process-dispute', json=d).get_json() for d in DISPUTES]
+    results = [None] * len(DISPUTES)
+
+    def post(i):
+        with dispute_app.app.test_client() as thread_client:
+            results[i] = thread_client.post('/process-dispute', json=DISPUTES[i]).get_json()
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(DISPUTES))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
+    assert client.post('/process-disputes', json=DISPUTES).get_json() == expected
+
+
+def test_retries_are_served_from_cache(client, response_cache, live_history):
+    dispute = dict(DISPUTES[1], dispute_description="There was a billing ERROR on my account")
+    first = client.post('/process-dispute', json=DISPUTES[1]).get_json()
+    # Same dispute up to case: served from the cache without being counted again
+    assert client.post('/process-dispute', json=dispute).get_json() == first
+    assert dispute_app.history_store.get("C002")["dispute_count"] == 2
+    stats = client.get('/stats').get_json()['response_cache']
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_idempotency_key(client, response_cache):
+    first = client.post('/process-dispute', json=DISPUTES[0], headers={'Idempotency-Key': 'abc'}).get_json()
+    retry = dict(DISPUTES[0], dispute_description=DISPUTES[0]["dispute_description"].upper())
+    assert client.post('/process-dispute', json=retry, headers={'Idempotency-Key': 'abc'}).get_json() == first
+    # Reusing the key for a different dispute is an error, not a replay
+    reused = client.post('/process-dispute', json=dict(DISPUTES[0], transaction_amount=5),
+                         headers={'Idempotency-Key': 'abc'})
+    assert reused.status_code == 422
+    assert client.post('/queue/disputes', json=dict(DISPUTES[0], transaction_amount=5),
+                       headers={'Idempotency-Key': 'abc'}).status_code == 422
+    # Keys are scoped to the customer
+    other = dict(DISPUTES[2], customer_id="C777")
+    response = client.post('/process-dispute', json=other, headers={'Idempotency-Key': 'abc'}).get_json()
+    assert response['customer_id'] == "C777"
+    assert response_cache.stats()['hits'] == 1
+
+
+def test_history_change_invalidates_cached_responses(client, history_store, response_cache):
+    client.post('/process-dispute', json=DISPUTES[1])
+    client.post('/process-dispute', json=DISPUTES[0])
+    history_store.put("C002", {"dispute_count": 4, "high_risk": False, "last_dispute_day": None, "credit_score": 750})
+    assert client.post('/process-dispute', json=DISPUTES[1]).get_json()['priority'] == "High"
+    # Only C002's entry was dropped
+    client.post('/process-dispute', json=DISPUTES[0])
+    stats = client.get('/stats').get_json()['response_cache']
+    assert (stats['invalidations'], stats['hits']) == (1, 1)
+
+
+def test_retries_replay_after_other_disputes_change_history(client, response_cache, live_history):
+    first = client.post('/process-dispute', json=DISPUTES[0], headers={'Idempotency-Key': 'k1'}).get_json()
+    second = client.post('/process-dispute', json=DISPUTES[4]).get_json()
+    # Neither retry is counted again, and both get their first response
+    assert client.post('/process-dispute', json=DISPUTES[0], headers={'Idempotency-Key': 'k1'}).get_json() == first
+    assert client.post('/process-dispute', json=DISPUTES[4]).get_json() == second
+    assert dispute_app.history_store.get("C001")["dispute_count"] == 7
+    assert response_cache.stats()["invalidations"] == 0
+
+
+def test_response_cache_ttl_and_lru_eviction(monkeypatch):
+    cache = ResponseCache(max_size=2, ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr("response_cache.time.monotonic", lambda: now[0])
+    cache.put("a", "C1", {"n": 1})
+    cache.put("b", "C1", {"n": 2})
+    cache.get("a")
+    cache.put("c", "C2", {"n": 3})
+    assert cache.get("b") is None
+    now[0] += 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expirations"], stats["size"]) == (1, 1, 1)
+
+
+def legacy_priority_and_risk(dispute_count, days_since_last_dispute, amount, category, history_high_risk,
+                             credit_score):
+    """The hand-written cascade process_dispute used before rules moved to dispute_rules.json."""
+    priority = "High" if dispute_count >= 4 else "Medium" if dispute_count >= 2 else "Low"
+    if days_since_last_dispute is not None and days_since_last_dispute <= 30:
+        priority = "High" if priority == "Medium" else priority
+    if amount > 1000:
+        priority = "High" if priority == "Medium" else priority
+    if category == "Fraud":
+        priority = "High"
+    high_risk = history_high_risk or category == "Fraud" or amount > 1000 or credit_score < 600
+    return priority, high_risk
+
+
+def test_default_rules_reproduce_legacy_cascade():
+    rules = RuleEngine(dispute_app.rule_engine.path).rules
+    grid = list(itertools.product(
+        range(7), [None, -5, 0, 29, 30, 31, 400], [0, 999.99, 1000, 1000.01, 5000],
+        ["Fraud", "Billing Error", "Other"], [False, True], [300, 599, 600, 850]))
+    expected = [legacy_priority_and_risk(*case) for case in grid]
+    keys = ["dispute_count", "days_since_last_dispute", "transaction_amount", "category",
+            "history_high_risk", "credit_score"]
+    assert [rules.evaluate(dict(zip(keys, case))) for case in grid] == expected
+
+    columns = {key: np.array([case[i] for case in grid]) for i, key in enumerate(keys)}
+    columns["has_last_dispute"] = np.array([case[1] is not None for case in grid])
+    columns["days_since_last_dispute"] = np.array([case[1] or 0 for case in grid])
+    priority_codes, high_risk = rules.evaluate_batch(columns)
+    assert list(zip([PRIORITIES[code] for code in priority_codes], high_risk.tolist())) == expected
+
+
+def test_rules_hot_reload(tmp_path):
+    path = tmp_path / "rules.json"
+    config = {"dispute_count_tiers": [{"min_count": 2, "priority": "Medium"}],
+              "escalations": [], "high_risk_when": [{"amount_over": 1000}]}
+    path.write_text(json.dumps(config))
+    engine = RuleEngine(str(path), check_interval=0)
+    features = {"dispute_count": 1, "days_since_last_dispute": None, "transaction_amount": 600,
+                "category": "Other", "history_high_risk": False, "credit_score": 700}
+    assert engine.rules.evaluate(features) == ("Low", False)
+
+    config["dispute_count_tiers"][0]["min_count"] = 1
+    config["high_risk_when"] = [{"amount_over": 500, "category": "Other"}]
+    path.write_text(json.dumps(config))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert engine.rules.evaluate(features) == ("Medium", True)
+
+    # An invalid file keeps the previous rules in force
+    path.write_text(json.dumps({"dispute_count_tiers": [], "escalations": [{"when": {"moon_phase": 1}, "to": "High"}]}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2))
+    assert engine.rules.evaluate(features) == ("Medium", True)
+
+
+def test_rules_reject_unknown_priority():
+    with pytest.raises(ValueError):
+        CompiledRules({"dispute_count_tiers": [{"min_count": 1, "priority": "Urgent"}]})
+
+
+def test_stage_metrics(client, monkeypatch):
+    monkeypatch.setattr(dispute_app, 'instrumentation', Instrumentation(enabled=True))
+    for dispute in DISPUTES[:3]:
+        client.post('/process-dispute', json=dispute)
+    client.post('/process-dispute', json=DISPUTES[0])
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    for stage in ('parse', 'cache_lookup', 'serialize'):
+        assert f'dispute_stage_duration_seconds_count{{stage="{stage}"}} 4' in body
+    # The cached retry skips the scoring stages
+    for stage in ('categorize', 'history', 'date_math', 'rules', 'recommendation'):
+        assert f'dispute_stage_duration_seconds_count{{stage="{stage}"}} 3' in body
+        assert f'dispute_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} 3' in body
+        assert f'dispute_stage_duration_quantile_seconds{{stage="{stage}",quantile="0.99"}}' in body
+
+
+def test_stage_metrics_disabled(client, monkeypatch):
+    instrumentation = Instrumentation(enabled=False)
+    monkeypatch.setattr(dispute_app, 'instrumentation', instrumentation)
+    assert instrumentation.start() is NULL_TIMER
+    client.post('/process-dispute', json=DISPUTES[0])
+    assert 'stage=' not in client.get('/metrics').get_data(as_text=True)
+
+
+def test_latency_histogram_quantiles():
+    histogram = LatencyHistogram()
+    for duration_ns in range(1000, 101_000, 1000):
+        histogram.observe(duration_ns)
+    # Bucket upper bounds are at most 25% above the true quantile
+    for q, exact in ((0.5, 50_000), (0.95, 95_000), (0.99, 99_000)):
+        estimate = LatencyHistogram.quantile(histogram.counts, histogram.count, q)
+        assert exact <= estimate <= exact * 1.25
+
+
+def test_rescore_cli_matches_api(client, tmp_path):
+    history_db = str(tmp_path / "history.db")
+    CustomerHistoryStore(history_db, seed=dispute_app.SEED_CUSTOMER_HISTORY).get("C001")
+    expected = [client.post('/process-dispute', json=d).get_json() for d in DISPUTES]
+
+    ndjson_input = tmp_path / "disputes.ndjson"
+    bad_type = json.dumps(dict(DISPUTES[0], customer_id=["x"]))
+    ndjson_input.write_text("\n".join([json.dumps(d) for d in DISPUTES[:3]] + ["not json", "", bad_type]
+                                      + [json.dumps(d) for d in DISPUTES[3:]]) + "\n")
+    ndjson_output = tmp_path / "rescored.ndjson"
+    rescore.main([str(ndjson_input), "-o", str(ndjson_output), "--workers", "2", "--chunk-size", "2",
+                  "--history-db", history_db, "-q"])
+    results = [json.loads(line) for line in ndjson_output.read_text().splitlines()]
+    assert results[3] == {"line": 4, "error": results[3]["error"]}
+    assert results[4] == {"line": 6, "error": "Invalid dispute: customer_id must be a string"}
+    assert results[:3] + results[5:] == expected
+
+    csv_input = tmp_path / "disputes.csv"
+    fields = ["customer_id", "dispute_description", "transaction_amount", "submission_date"]
+    with open(csv_input, "w", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(DISPUTES)
+        writer.writerow({"customer_id": "C009", "transaction_amount": "lots"})
+    csv_output = tmp_path / "rescored.csv"
+    rescore.main([str(csv_input), "-o", str(csv_output), "--workers", "2", "--history-db", history_db, "-q"])
+    with open(csv_output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["customer_id"], r["category"], r["priority"], r["high_risk"] == "True", r["recommendation"])
+            for r in rows[:-1]] == [(e["customer_id"], e["category"], e["priority"], e["high_risk"], e["recommendation"])
+                             for e in expected]
+    assert rows[-1]["line"] == str(len(DISPUTES) + 2) and rows[-1]["error"].startswith("Invalid dispute")
+
+
+@pytest.fixture
+def dedup_index(monkeypatch):
+    index = NearDuplicateIndex()
+    monkeypatch.setattr(dispute_app, 'dedup_index', index)
+    return index
+
+
+def test_near_duplicates_share_a_cluster(client, dedup_index):
+    first = client.post('/process-dispute', json={
+        "customer_id": "C101", "dispute_description": "Unauthorized transaction at STORE #1234 for $499.99",
+        "transaction_amount": 499.99}).get_json()
+    assert first['cluster_id'] and first['similarity'] is None
+
+    duplicate = client.post('/process-dispute', json={
+        "customer_id": "C102", "dispute_description": "unauthorized transaction at store #1235 for $499.99",
+        "transaction_amount": 499.99}).get_json()
+    assert duplicate['cluster_id'] == first['cluster_id']
+    assert 0.8 <= duplicate['similarity'] < 1
+
+    unrelated = client.post('/process-disputes', json=[{
+        "customer_id": "C103", "dispute_description": "I have a question about my statement",
+        "transaction_amount": 10}]).get_json()[0]
+    assert unrelated['cluster_id'] != first['cluster_id'] and unrelated['similarity'] is None
+    assert client.get('/stats').get_json()['near_duplicates']['matches'] == 1
+
+
+def test_near_duplicate_index_expiry_and_capacity(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup.time, 'monotonic', lambda: now[0])
+    index = NearDuplicateIndex(ttl_seconds=60, max_entries=2)
+    cluster, _ = index.add("refund never arrived for order 1")
+    assert index.add("refund never arrived for order 2")[0] == cluster
+
+    # Both earlier descriptions have expired, so this one starts a new cluster
+    now[0] += 61
+    new_cluster, similarity = index.add("refund never arrived for order 3")
+    assert new_cluster != cluster and similarity is None
+    assert index.stats()['expirations'] == 2
+
+    index.add("something else entirely")
+    index.add("and another unrelated one")
+    stats = index.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert index.add("") == (None, None)
+
+
+def test_velocity_windows_roll_over():
+    now = [1_000_000.0]
+    tracker = VelocityTracker(initial_capacity=1, clock=lambda: now[0])
+    for _ in range(3):
+        velocity = tracker.record("C001", 100)
+        now[0] += 600
+    assert velocity == {"disputes_1h": 3, "disputes_24h": 3, "disputes_7d": 3, "disputes_30d": 3,
+                        "amount_1h": 300.0, "amount_24h": 300.0, "amount_7d": 300.0, "amount_30d": 300.0}
+    tracker.record("C002", 50)
+
+    now[0] += 2 * 3600
+    assert tracker.get("C001")["disputes_1h"] == 0 and tracker.get("C001")["disputes_24h"] == 3
+    now[0] += 2 * 86_400
+    assert tracker.get("C001")["disputes_24h"] == 0 and tracker.get("C001")["amount_7d"] == 300.0
+    now[0] += 7 * 86_400
+    assert tracker.get("C001")["disputes_7d"] == 0 and tracker.get("C001")["disputes_30d"] == 3
+    now[0] += 30 * 86_400
+    assert tracker.get("C001") == tracker.get("C003") == velocity_module.EMPTY_VELOCITY
+    assert tracker.stats()["customers"] == 2
+
+
+def test_velocity_rule_conditions(client, monkeypatch, tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "dispute_count_tiers": [],
+        "escalations": [{"when": {"disputes_in_1h_at_least": 3}, "to": "High"}],
+        "high_risk_when": [{"amount_in_24h_over": 1000}],
+    }))
+    monkeypatch.setattr(dispute_app, 'rule_engine', RuleEngine(str(path)))
+    monkeypatch.setattr(dispute_app, 'velocity_tracker', VelocityTracker())
+
+    dispute = {"customer_id": "C050", "dispute_description": "Charged twice"}
+    results = [client.post('/process-dispute', json=dict(dispute, transaction_amount=amount)).get_json()
+               for amount in (400, 401, 402)]
+    assert [(r['priority'], r['high_risk']) for r in results] == [("Low", False), ("Low", False), ("High", True)]
+
+    # The batch path sees the same rolling counts, including earlier disputes in the batch
+    batch = client.post('/process-disputes', json=[dict(dispute, customer_id="C051", transaction_amount=600)] * 2)
+    assert [(r['priority'], r['high_risk']) for r in batch.get_json()] == [("Low", False), ("Low", True)]
+
+
+def test_velocity_amounts_exact_and_rejected_disputes_not_recorded(client, monkeypatch):
+    tracker = VelocityTracker()
+    monkeypatch.setattr(dispute_app, 'velocity_tracker', tracker)
+    for _ in range(3):
+        tracker.record("C060", 1_234_567.89)
+    assert tracker.get("C060")["amount_24h"] == 3_703_703.67
+
+    dispute = {"customer_id": "C061", "dispute_description": "Charged twice", "transaction_amount": "12"}
+    assert client.post('/process-dispute', json=dispute).status_code == 400
+    valid = dict(dispute, transaction_amount=12)
+    assert client.post('/process-disputes', json=[valid, dispute]).status_code == 400
+    assert tracker.get("C061") == velocity_module.EMPTY_VELOCITY
@@ -0,0 +1,256 @@
+import atexit
+import glob
+import heapq
+import itertools
+import os
+import pickle
+import threading
+import time
+import uuid
+
+
+PRIORITY_RANK = {"Low": 0, "Medium": 1, "High": 2}
+
+# Entries pickled per chunk when compacting; other threads can run between chunks
+_CHUNK_SIZE = 10_000
+
+
+class TriageQueue:
+    """
+    In-process priority queue of processed disputes with claim/ack semantics.
+
+    Disputes are ordered by priority, then high-risk first, then larger amounts,
+    then earlier submission, using a binary heap for O(log n) enqueue and claim.
+    A claimed dispute is hidden for a visibility timeout; if it is not
+    acknowledged in time it becomes claimable again. Disputes carrying a
+    dispute_id are queued once: enqueueing the same id again while it is
+    pending or claimed is a no-op.
+
+    Enqueues and acks are appended to a journal, so persisting them costs one
+    small write each whatever the queue size. The journal is compacted into
+    a snapshot in the background once it holds as many records as the queue
+    holds items, so compaction work stays proportional to the operations
+    journaled. On start the snapshot is loaded and the journal replayed.
+
+    The queue lives in one process: run a single (multi-threaded) worker when
+    using it, or give each worker its own snapshot file.
+    """
+
+    def __init__(self, snapshot_path=None, visibility_timeout=300, compact_min_records=10_000):
+        """
+        Initialize the queue, restoring the last snapshot and journal if there are any.
+
+        Args:
+            snapshot_path: File to snapshot state to (the journal is written next
+                to it), or None to keep it in memory only
+            visibility_timeout: Default seconds a claimed dispute stays hidden
+            compact_min_records: Journal records below which it is never compacted
+        """
+        self.snapshot_path = snapshot_path
+        self.visibility_timeout = visibility_timeout
+        self.compact_min_records = compact_min_records
+        # Heap entries are (-priority, not high_risk, -amount, submission_day, seq, item);
+        # seq is unique, so items themselves are never compared
+        self._heap = []
+        # receipt -> (deadline, entry), plus a heap of (deadline, receipt) to find expired claims
+        self._in_flight = {}
+        self._deadlines = []
+        # dispute_id of every pending or claimed dispute that has one
+        self._ids = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._generation = 0
+        self._journal = None
+        self._journal_records = 0
+
+        if snapshot_path:
+            self._restore()
+            self._journal = open(self._journal_path(self._generation), "ab")
+            atexit.register(self.snapshot)
+
+    def _journal_path(self, generation):
+        return f"{self.snapshot_path}.{generation}.journal"
+
+    def _append(self, record):
+        """Write a journal record. Caller holds the lock."""
+        if self._journal is None:
+            return
+        pickle.dump(record, self._journal, protocol=pickle.HIGHEST_PROTOCOL)
+        self._journal.flush()
+        self._journal_records += 1
+
+    def enqueue(self, item, submission_day):
+        """
+        Add a processed dispute to the queue.
+
+        Args:
+            item: Processed dispute; must contain priority, high_risk and transaction_amount
+            submission_day: Submission date as days since 1970-01-01, used as tie-breaker
+
+        Returns:
+            bool: False if a dispute with the same dispute_id is already pending or claimed
+        """
+        dispute_id = item.get("dispute_id")
+        with self._lock:
+            if dispute_id is not None:
+                if dispute_id in self._ids:
+                    return False
+                self._ids.add(dispute_id)
+            entry = (-PRIORITY_RANK[item["priority"]], not item["high_risk"], -item["transaction_amount"],
+                     submission_day, next(self._seq), item)
+            heapq.heappush(self._heap, entry)
+            self._append(("enqueue", entry))
+        self._maybe_compact()
+        return True
+
+    def _requeue_expired(self, now):
+        """Make claims whose visibility timeout has passed claimable again. Caller holds the lock."""
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, receipt = heapq.heappop(self._deadlines)
+            claim = self._in_flight.pop(receipt, None)
+            if claim is not None:
+                heapq.heappush(self._heap, claim[1])
+
+    def claim(self, visibility_timeout=None):
+        """
+        Claim the highest-priority dispute.
+
+        Claims are not journaled: a claim in flight at shutdown is claimable
+        again after a restart anyway.
+
+        Returns:
+            dict: {"receipt", "visible_until", "dispute"}, or None if the queue is empty
+        """
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        now = time.time()
+        # Before anything is popped, so a bad timeout can't lose the dispute
+        deadline = now + timeout
+        receipt = uuid.uuid4().hex
+        with self._lock:
+            self._requeue_expired(now)
+            if not self._heap:
+                return None
+            entry = heapq.heappop(self._heap)
+            self._in_flight[receipt] = (deadline, entry)
+            heapq.heappush(self._deadlines, (deadline, receipt))
+        return {"receipt": receipt, "visible_until": deadline, "dispute": entry[-1]}
+
+    def ack(self, receipt):
+        """
+        Acknowledge a claimed dispute as done, removing it from the queue.
+
+        Returns:
+            bool: False if the receipt is unknown or its claim has already expired
+        """
+        with self._lock:
+            self._requeue_expired(time.time())
+            claim = self._in_flight.pop(receipt, None)
+            if claim is None:
+                return False
+            entry = claim[1]
+            self._ids.discard(entry[-1].get("dispute_id"))
+            self._append(("ack", entry[4]))
+        self._maybe_compact()
+        return True
+
+    def stats(self):
+        with self._lock:
+            self._requeue_expired(time.time())
+            return {"pending": len(self._heap), "in_flight": len(self._in_flight)}
+
+    def snapshot(self):
+        """
+        Compact the journal: write every pending and claimed dispute to snapshot_path, then drop the journal.
+
+        New operations go to a fresh journal from the moment the state is
+        copied, so nothing is lost if the process stops while writing.
+        """
+        if not self.snapshot_path:
+            return
+        with self._compacting:
+            with self._lock:
+                if not self._journal_records:
+                    return
+                # Entries are immutable tuples, so shallow copies are consistent
+                # and pickling can happen outside the lock
+                entries = self._heap + [entry for _, entry in self._in_flight.values()]
+                old_generation = self._generation
+                generation = self._generation = old_generation + 1
+                self._journal.close()
+                self._journal = open(self._journal_path(generation), "ab")
+                self._journal_records = 0
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"generation": generation, "entries": len(entries)}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                # In chunks, so other threads get the GIL between them
+                for start in range(0, len(entries), _CHUNK_SIZE):
+                    pickle.dump(entries[start:start + _CHUNK_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+            self._remove_journals(old_generation, generation)
+
+    def _remove_journals(self, start, stop):
+        for generation in range(start, stop):
+            try:
+                os.remove(self._journal_path(generation))
+            except FileNotFoundError:
+                pass
+
+    def _maybe_compact(self):
+        """Start a background compaction once the journal holds as many records as the queue holds items."""
+        if self._journal_records < max(self.compact_min_records, len(self._heap) + len(self._in_flight)):
+            return
+        if self._compacting.locked():
+            return
+        threading.Thread(target=self.snapshot, name="triage-queue-compaction", daemon=True).start()
+
+    def _restore(self):
+        """Load the last snapshot and replay the journal. Claims in flight at shutdown become claimable again."""
+        entries = {}
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                header = pickle.load(f)
+                if "pending" in header:
+                    # Snapshot written before the queue kept a journal
+                    for entry in header["pending"] + [entry for _, entry in header["in_flight"]]:
+                        entries[entry[4]] = entry
+                else:
+                    self._generation = header["generation"]
+                    while len(entries) < header["entries"]:
+                        entries.update((entry[4], entry) for entry in pickle.load(f))
+        except FileNotFoundError:
+            pass
+
+        # Journals from the snapshot's generation on; a newer one exists if the
+        # process stopped between starting a compaction and writing its snapshot
+        pattern = f"{glob.escape(self.snapshot_path)}.*.journal"
+        generations = sorted(int(path.rsplit(".", 2)[-2]) for path in glob.glob(pattern))
+        self._remove_journals(min(generations, default=0), self._generation)
+        max_seq = max(entries, default=-1)
+        for generation in (g for g in generations if g >= self._generation):
+            path = self._journal_path(generation)
+            with open(path, "rb") as f:
+                while True:
+                    complete = f.tell()
+                    try:
+                        operation, value = pickle.load(f)
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError):
+                        # A record cut short by a crash; drop it, so new records follow the last good one
+                        f.close()
+                        os.truncate(path, complete)
+                        break
+                    if operation == "enqueue":
+                        entries[value[4]] = value
+                        max_seq = max(max_seq, value[4])
+                    else:
+                        entries.pop(value, None)
+                    self._journal_records += 1
+            self._generation = generation
+
+        self._heap = list(entries.values())
+        heapq.heapify(self._heap)
+        self._ids = {entry[-1]["dispute_id"] for entry in self._heap if entry[-1].get("dispute_id") is not None}
+        self._seq = itertools.count(max_seq + 1)
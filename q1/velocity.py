@@ -0,0 +1,162 @@
+import threading
+import time
+
+import numpy as np
+
+
+# Bucket rings as (bucket width in seconds, number of buckets); each bucket
+# holds the dispute count and disputed amount of one time slot
+RINGS = ((300, 12), (3600, 24), (86_400, 30))
+
+# Window name -> (ring, number of most recent buckets summed). A window spans
+# the current bucket plus the ones before it, so it covers up to one bucket
+# width less than its nominal length.
+WINDOWS = {
+    "1h": (0, 12),
+    "24h": (1, 24),
+    "7d": (2, 7),
+    "30d": (2, 30),
+}
+
+FEATURES = [f"disputes_{window}" for window in WINDOWS] + [f"amount_{window}" for window in WINDOWS]
+
+# Velocity of a customer with no recent disputes
+EMPTY_VELOCITY = dict.fromkeys(FEATURES, 0)
+
+RING_WIDTHS = [width for width, _ in RINGS]
+RING_SIZES = [size for _, size in RINGS]
+_OFFSETS = [sum(RING_SIZES[:ring]) for ring in range(len(RINGS) + 1)]
+
+
+def _window_matrices():
+    """
+    0/1 matrices selecting each window's buckets from a customer row.
+
+    Windows covering a whole ring sum all of it; the 7-day window sums part of
+    the daily ring, and which part depends on where its current bucket is.
+    So there is one matrix per position of the current daily bucket, and the
+    window sums of a row are a single matrix product.
+    """
+    last_ring = len(RINGS) - 1
+    if any(buckets < RING_SIZES[ring] for ring, buckets in WINDOWS.values() if ring != last_ring):
+        raise ValueError("Only windows over the last ring may cover part of it")
+    matrices = np.zeros((RING_SIZES[last_ring], _OFFSETS[-1], len(WINDOWS)), dtype=np.float32)
+    for position in range(RING_SIZES[last_ring]):
+        for column, (ring, buckets) in enumerate(WINDOWS.values()):
+            size = RING_SIZES[ring]
+            current = position if ring == last_ring else size - 1
+            matrices[position, (current - np.arange(buckets)) % size + _OFFSETS[ring], column] = 1
+    return matrices
+
+
+_WINDOW_MATRICES = _window_matrices()
+
+
+class VelocityTracker:
+    """
+    Rolling per-customer dispute counts and amounts over 1h, 24h, 7d and 30d.
+
+    Every customer owns one fixed-size row of 5-minute, hourly and daily
+    bucket rings, holding the number of disputes and the disputed amount of
+    each time slot. Recording a dispute advances each ring to the current
+    time slot, clearing buckets that fell out of it, and adds to the current
+    bucket, so an update touches a constant number of cells and memory per
+    customer never grows with their number of disputes.
+    """
+
+    def __init__(self, initial_capacity=1024, clock=time.time):
+        """
+        Initialize the tracker.
+
+        Args:
+            initial_capacity: Customer rows allocated up front; doubled as needed
+            clock: Function returning the current time in seconds
+        """
+        self.clock = clock
+        self._slots = {}
+        # [customer, bucket]. Counts are float32, exact up to 2**24 per bucket;
+        # amounts are float64, so sums of money stay exact to the cent
+        self._counts = np.zeros((initial_capacity, _OFFSETS[-1]), dtype=np.float32)
+        self._amounts = np.zeros((initial_capacity, _OFFSETS[-1]), dtype=np.float64)
+        # Time slot of the newest bucket of each ring, per customer
+        self._heads = np.zeros((initial_capacity, len(RINGS)), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _slot(self, customer_id):
+        """Return the customer's row, allocating one if needed. Caller holds the lock."""
+        slot = self._slots.get(customer_id)
+        if slot is None:
+            slot = self._slots[customer_id] = len(self._slots)
+            if slot == len(self._counts):
+                self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+                self._amounts = np.concatenate([self._amounts, np.zeros_like(self._amounts)])
+                self._heads = np.concatenate([self._heads, np.zeros_like(self._heads)])
+        return slot
+
+    def _advance(self, slot, current):
+        """Move the rings of a row forward to the `current` time slots. Caller holds the lock."""
+        counts, amounts, heads = self._counts[slot], self._amounts[slot], self._heads[slot]
+        for ring, size in enumerate(RING_SIZES):
+            head = heads[ring]
+            if current[ring] <= head:
+                continue
+            offset = _OFFSETS[ring]
+            if current[ring] - head >= size:
+                cleared = slice(offset, offset + size)
+            else:
+                cleared = np.arange(head + 1, current[ring] + 1) % size + offset
+            counts[cleared] = 0
+            amounts[cleared] = 0
+            heads[ring] = current[ring]
+
+    def _features(self, slot, current):
+        matrix = _WINDOW_MATRICES[current[-1] % len(_WINDOW_MATRICES)]
+        counts = self._counts[slot] @ matrix
+        amounts = self._amounts[slot] @ matrix.astype(np.float64)
+        return dict(zip(FEATURES, counts.astype(np.int64).tolist() + amounts.round(2).tolist()))
+
+    def record(self, customer_id, amount, timestamp=None):
+        """
+        Count a dispute and return the customer's velocity including it.
+
+        Args:
+            customer_id: Customer the dispute belongs to
+            amount: Disputed amount
+            timestamp: Time of the dispute in seconds (default: now); disputes
+                older than a ring's span are left out of that ring
+
+        Returns:
+            Dict of the FEATURES, e.g. disputes_24h and amount_7d
+        """
+        amount = float(amount)
+        now = self.clock()
+        current = [int(now // width) for width in RING_WIDTHS]
+        buckets = current if timestamp is None else [int(timestamp // width) for width in RING_WIDTHS]
+        with self._lock:
+            slot = self._slot(customer_id)
+            self._advance(slot, current)
+            counts, amounts = self._counts[slot], self._amounts[slot]
+            for bucket, head, size, offset in zip(buckets, current, RING_SIZES, _OFFSETS):
+                if 0 <= head - bucket < size:
+                    counts[bucket % size + offset] += 1
+                    amounts[bucket % size + offset] += amount
+            return self._features(slot, current)
+
+    def get(self, customer_id):
+        """Return the customer's current velocity without recording anything."""
+        now = self.clock()
+        current = [int(now // width) for width in RING_WIDTHS]
+        with self._lock:
+            slot = self._slots.get(customer_id)
+            if slot is None:
+                return dict(EMPTY_VELOCITY)
+            self._advance(slot, current)
+            return self._features(slot, current)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "customers": len(self._slots),
+                "capacity": len(self._counts),
+                "bytes_per_customer": self._counts[0].nbytes + self._amounts[0].nbytes + self._heads[0].nbytes,
+            }
@@ -0,0 +1,190 @@
+"""
+Amortization schedules and portfolio cash flows.
+
+Every loan type is scheduled by the same rule: each month's payment is the
+interest on the opening balance, plus, once any interest-only period is
+over, the principal that pays the balance off in equal installments over
+the remaining amortization months at the current rate. The last month of
+the term pays whatever is left (a balloon loan's balloon, an interest-only
+loan's principal). Recomputing the installment every month is what makes
+variable rates work; at a constant rate it's the usual annuity.
+
+Since the share of the balance left after each month depends only on that
+month's rate and position, balances are a cumulative product over months:
+schedules of many loans are computed at once as arrays of loans x months,
+without a loop over months.
+"""
+import numpy as np
+
+# Amortization period of balloon loans when not given
+DEFAULT_BALLOON_AMORTIZATION_MONTHS = 360
+
+_SCHEDULE_COLUMNS = ("payments", "principal", "interest", "balances")
+
+
+def monthly_rate_path(annual_rate, loan_term, rate_path=None, rate_reset_months=12):
+    """
+    Monthly rates (as fractions) of a loan over its term.
+
+    Args:
+        annual_rate: Annual rate in percent until the first reset
+        loan_term: Term in months
+        rate_path: Annual rates in percent after each reset; the last one holds
+        rate_reset_months: Months between resets
+    """
+    annual = np.full(loan_term, float(annual_rate))
+    if rate_path:
+        resets = np.arange(loan_term) // rate_reset_months
+        path = np.concatenate([[annual_rate], rate_path])
+        annual = path[np.minimum(resets, len(path) - 1)]
+    return annual / 1200
+
+
+def loan_periods(loan_type, loan_term, interest_only_months=None, balloon_amortization_months=None):
+    """Interest-only months and amortization months of a loan."""
+    if loan_type == "interest_only":
+        interest_only = loan_term if interest_only_months is None else interest_only_months
+        return interest_only, loan_term - interest_only
+    if loan_type == "balloon":
+        amortization = balloon_amortization_months or max(DEFAULT_BALLOON_AMORTIZATION_MONTHS, loan_term)
+        return 0, amortization
+    return 0, loan_term
+
+
+def amortize(principal, rates, terms, interest_only, amortization):
+    """
+    Schedules of many loans at once.
+
+    Args:
+        principal: Loan amounts, shape (n,)
+        rates: Monthly rates as fractions, shape (n, months); only the first
+            terms[i] months of row i are used
+        terms: Terms in months, shape (n,)
+        interest_only: Interest-only months at the start of each loan, shape (n,)
+        amortization: Months the principal is amortized over after the
+            interest-only period (at least the rest of the term), shape (n,)
+
+    Returns:
+        Dict of payments, principal, interest and balances (at month end),
+        each of shape (n, months) and zero past each loan's term
+    """
+    principal = np.asarray(principal, dtype=float)
+    terms = np.asarray(terms)
+    interest_only = np.asarray(interest_only)[:, None]
+    month = np.arange(1, rates.shape[1] + 1)
+    active = month <= terms[:, None]
+    amortizing = active & (month > interest_only)
+
+    # Installments left, this month's included
+    remaining = np.where(amortizing, np.asarray(amortization)[:, None] - (month - 1 - interest_only), 1)
+    remaining = np.maximum(remaining, 1)
+    # Share of the opening balance left after paying interest and an equal
+    # installment: 1 + r - r / (1 - (1 + r)^-m), or 1 - 1/m without interest
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = -np.expm1(-remaining * np.log1p(rates))
+        kept = np.where(rates > 0, 1 + rates - rates / annuity, 1 - 1 / remaining)
+    kept = np.where(amortizing, kept, 1.0)
+    # The last payment clears the balance
+    kept[month[None, :] >= terms[:, None]] = 0.0
+
+    balances = principal[:, None] * np.cumprod(kept, axis=1)
+    opening = np.concatenate([principal[:, None], balances[:, :-1]], axis=1)
+    interest = np.where(active, opening * rates, 0.0)
+    principal_paid = np.where(active, opening - balances, 0.0)
+    return {
+        "payments": interest + principal_paid,
+        "principal": principal_paid,
+        "interest": interest,
+        "balances": balances,
+    }
+
+
+def loan_schedule(loan_amount, loan_term, loan_type, annual_rate, rate_path=None, rate_reset_months=12,
+                  interest_only_months=None, balloon_amortization_months=None):
+    """
+    Monthly schedule of one loan, amounts rounded to cents.
+
+    Args:
+        loan_amount: Principal
+        loan_term: Term in months
+        loan_type: "fixed", "variable", "interest_only" or "balloon"
+        annual_rate: Annual rate in percent (until the first reset of a variable loan)
+        rate_path: Annual rates in percent after each reset (variable loans)
+        rate_reset_months: Months between resets (variable loans)
+        interest_only_months: Months before the principal amortizes (interest-only
+            loans; default: the whole term, with the principal due at the end)
+        balloon_amortization_months: Months a balloon loan's installments are
+            computed over (default: 360); the rest is due at the end of the term
+    """
+    rates = monthly_rate_path(annual_rate, loan_term, rate_path if loan_type == "variable" else None,
+                              rate_reset_months)
+    interest_only, amortization = loan_periods(loan_type, loan_term, interest_only_months,
+                                                balloon_amortization_months)
+    columns = amortize([loan_amount], rates[None, :], [loan_term], [interest_only], [amortization])
+    schedule = {
+        "loan_type": loan_type,
+        "months": list(range(1, loan_term + 1)),
+        **{name: np.round(columns[name][0], 2).tolist() for name in _SCHEDULE_COLUMNS},
+        "annual_rates": np.round(rates * 1200, 4).tolist(),
+    }
+    schedule["total_paid"] = round(float(columns["payments"].sum()), 2)
+    schedule["total_interest"] = round(float(columns["interest"].sum()), 2)
+    return schedule
+
+
+def portfolio_cash_flow(loans, chunk_size=2_000):
+    """
+    Expected monthly cash flow of a portfolio, assuming scheduled repayment.
+
+    Loans are scheduled in chunks of similar terms, so each chunk is one
+    array operation of roughly chunk_size x term cells.
+
+    Args:
+        loans: Objects with the loan_schedule() arguments as attributes, plus
+            start_month (months before the loan's first month)
+
+    Returns:
+        Dict of per-month totals over the portfolio (payments, principal,
+        interest, outstanding balance, active loans) and overall totals
+    """
+    if not loans:
+        return {"months": [], "payments": [], "principal": [], "interest": [], "balances": [],
+                "active_loans": [], "total_paid": 0.0, "total_interest": 0.0}
+    terms = np.array([loan.loan_term for loan in loans])
+    starts = np.array([loan.start_month for loan in loans])
+    principal = np.array([loan.loan_amount for loan in loans], dtype=float)
+    annual_rates = np.array([loan.annual_rate for loan in loans], dtype=float)
+    periods = np.array([loan_periods(loan.loan_type, loan.loan_term, loan.interest_only_months,
+                                      loan.balloon_amortization_months) for loan in loans]).reshape(-1, 2)
+    # Only variable loans with a rate path need a row of their own
+    rate_paths = {index: loan for index, loan in enumerate(loans) if loan.loan_type == "variable" and loan.rate_path}
+
+    horizon = int((starts + terms).max())
+    totals = {name: np.zeros(horizon + 1) for name in _SCHEDULE_COLUMNS}
+    active_loans = np.zeros(horizon + 1)
+
+    order = np.argsort(terms, kind="stable")
+    for begin in range(0, len(order), chunk_size):
+        chunk = order[begin:begin + chunk_size]
+        months = int(terms[chunk].max())
+        rates = np.repeat(annual_rates[chunk, None] / 1200, months, axis=1)
+        for row, index in enumerate(chunk):
+            loan = rate_paths.get(index)
+            if loan is not None:
+                rates[row, :loan.loan_term] = monthly_rate_path(loan.annual_rate, loan.loan_term, loan.rate_path,
+                                                                loan.rate_reset_months)
+        columns = amortize(principal[chunk], rates, terms[chunk], periods[chunk, 0], periods[chunk, 1])
+
+        # Portfolio month of each cell; cells past a loan's term add zeros
+        portfolio_month = np.minimum(starts[chunk, None] + np.arange(1, months + 1), horizon).ravel()
+        for name in _SCHEDULE_COLUMNS:
+            totals[name] += np.bincount(portfolio_month, weights=columns[name].ravel(), minlength=horizon + 1)
+        active = (np.arange(1, months + 1) <= terms[chunk, None]).ravel()
+        active_loans += np.bincount(portfolio_month, weights=active, minlength=horizon + 1)
+
+    result = {"months": list(range(1, horizon + 1))}
+    result.update({name: np.round(totals[name][1:], 2).tolist() for name in _SCHEDULE_COLUMNS})
+    result["active_loans"] = active_loans[1:].astype(int).tolist()
+    result["total_paid"] = round(float(totals["payments"].sum()), 2)
+    result["total_interest"] = round(float(totals["interest"].sum()), 2)
+    return result
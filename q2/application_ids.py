@@ -0,0 +1,128 @@
+"""
+Time-ordered, collision-free application IDs.
+
+An ID is 128 bits, written as 26 Crockford base32 characters like a ULID:
+
+    | 48 bits: ms since the Unix epoch | 16 bits: machine | 22 bits: thread | 42 bits: sequence |
+
+The thread bits are the thread's native ID. On Linux thread IDs share one
+space with process IDs (at most 2^22), so no two live threads on a machine
+have the same one, whichever process (e.g. uvicorn worker) they belong to.
+The machine bits tell machines (or containers, whose thread IDs overlap)
+apart. They default to a 16-bit hash of the host name, which is only
+likely to be unique (~2% chance of a clash among 50 hosts), so deployments
+with many containers must set APPLICATION_ID_MACHINE to a distinct value
+on each. Each thread keeps its own last timestamp and sequence, so its IDs
+strictly increase and generating one takes no lock and touches no shared
+state. IDs of different threads differ in their node (machine and thread)
+bits.
+
+The encoding preserves order, so IDs sort by the millisecond they were
+generated in, as strings as well as numbers.
+"""
+import os
+import socket
+import threading
+import time
+import zlib
+
+MACHINE_BITS = 16
+THREAD_BITS = 22
+SEQUENCE_BITS = 42
+NODE_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = SEQUENCE_BITS + THREAD_BITS + MACHINE_BITS
+
+# Crockford's base32 digits, in ASCII order, so encoded IDs sort like their values
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# Every pair of digits, indexed by the 10 bits it encodes
+_PAIRS = [first + second for first in ALPHABET for second in ALPHABET]
+_PAIR_SHIFTS = range(120, -1, -10)
+
+
+def default_machine_id():
+    """
+    APPLICATION_ID_MACHINE if set (0-65535), else a hash of the host name.
+
+    Two hosts whose names hash alike may generate the same IDs, so set
+    APPLICATION_ID_MACHINE wherever uniqueness across replicas matters.
+    """
+    value = os.environ.get("APPLICATION_ID_MACHINE")
+    if value:
+        machine = int(value)
+        if not 0 <= machine < 1 << MACHINE_BITS:
+            raise ValueError(f"APPLICATION_ID_MACHINE must be between 0 and {(1 << MACHINE_BITS) - 1}")
+        return machine
+    return zlib.crc32(socket.gethostname().encode()) & ((1 << MACHINE_BITS) - 1)
+
+
+def encode(value):
+    """Write a 128-bit ID as 26 base32 characters, as ULIDs are written."""
+    return "".join([_PAIRS[value >> shift & 1023] for shift in _PAIR_SHIFTS])
+
+
+def decode(text):
+    """Read an ID written by encode() back into its 128-bit value."""
+    value = 0
+    for digit in text:
+        value = value << 5 | ALPHABET.index(digit)
+    return value
+
+
+def timestamp_ms(value):
+    """Milliseconds since the Unix epoch at which an ID was generated."""
+    return value >> TIMESTAMP_SHIFT
+
+
+class IdGenerator:
+    """Generates time-ordered IDs unique across threads, processes and machines."""
+
+    def __init__(self, machine_id=None):
+        """
+        Args:
+            machine_id: Machine bits (default: default_machine_id()); give
+                every machine or container generating IDs its own
+        """
+        self.machine_id = default_machine_id() if machine_id is None else machine_id
+        self._local = threading.local()
+        # A forked child keeps the forking thread's state, but runs in a thread of its own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _start_thread(self):
+        thread = threading.get_native_id() & ((1 << THREAD_BITS) - 1)
+        # [last timestamp, its last sequence number, node bits]
+        self._local.state = state = [-1, 0, (self.machine_id << THREAD_BITS | thread) << NODE_SHIFT]
+        return state
+
+    def next_value(self):
+        """Return a new ID as a 128-bit integer."""
+        try:
+            state = self._local.state
+        except AttributeError:
+            state = self._start_thread()
+        now = time.time_ns() // 1_000_000
+        if now > state[0]:
+            state[0] = now
+            state[1] = 0
+        else:
+            # Same millisecond, or the clock went back: keep the last timestamp so IDs still increase
+            state[1] += 1
+            if state[1] >> SEQUENCE_BITS:
+                state[0] += 1
+                state[1] = 0
+        return state[0] << TIMESTAMP_SHIFT | state[2] | state[1]
+
+    def next_id(self):
+        """Return a new ID as 26 sortable characters."""
+        return encode(self.next_value())
+
+
+# One generator per process, shared by every caller
+application_ids = IdGenerator()
+
+
+def new_application_id():
+    """Return a new application ID, e.g. LOAN-06GQ5ZJ4ZW8C40000000000000."""
+    return f"LOAN-{application_ids.next_id()}"
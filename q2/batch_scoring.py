@@ -0,0 +1,319 @@
+"""
+Vectorized loan eligibility scoring.
+
+Applies the same model as calculate_eligibility_score and generate_recommendation
+in loan_eligibility_api.py to many applications at once: applications are
+turned into NumPy columns and every factor is computed with array operations.
+Results match the scalar path.
+
+For very large runs (e.g. overnight pre-approval campaigns), build the columns
+directly from the source data and call score_columns.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from application_ids import new_application_id
+from dispute_features import extract_dispute_features
+
+
+# Category codes used in the columns
+EMPLOYMENT_CODES = {"employed": 0, "self_employed": 1, "unemployed": 2, "retired": 3, "student": 4}
+PURPOSE_CODES = {"home_purchase": 0, "education": 1, "vehicle": 2, "personal": 3, "business": 4,
+                 "debt_consolidation": 5, "other": 6}
+LOAN_TYPE_CODES = {"fixed": 0, "variable": 1, "interest_only": 2, "balloon": 3}
+
+APPROVAL_STATUSES = ("Denied", "Conditionally Approved", "Approved")
+
+# Base interest rate by loan type code
+_BASE_RATES = np.array([5.0, 5.0 - 0.25, 5.0 + 0.5, 5.0 + 0.75])
+
+def _round(values, digits):
+    """
+    Round like the built-in round().
+
+    np.round scales, rounds and scales back, which can land on the other side
+    of a value lying (almost) halfway between two decimals; those few values
+    are rounded with round() instead, so results match the scalar path exactly.
+    """
+    rounded = np.round(values, digits)
+    scaled = values * 10.0 ** digits
+    near_halfway = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    rounded[near_halfway] = [round(value, digits) for value in values[near_halfway].tolist()]
+    return rounded
+
+
+# Column names, in the order rows are built
+CUSTOMER_COLUMNS = ["credit_score", "income", "employment_status", "employment_duration", "debt_to_income_ratio",
+                    "previous_defaults", "total_disputes", "recent_disputes", "rejected_disputes",
+                    "past_year_disputes"]
+LOAN_COLUMNS = ["loan_amount", "loan_type", "loan_purpose", "loan_term"]
+SUPPORT_COLUMNS = ["has_co_applicant", "co_applicant_income", "co_applicant_credit_score", "has_collateral",
+                   "collateral_value"]
+COLUMNS = CUSTOMER_COLUMNS + LOAN_COLUMNS + SUPPORT_COLUMNS
+
+
+def _customer_row(customer, now):
+    """Values of the CUSTOMER_COLUMNS for one customer."""
+    dti = customer.debt_to_income_ratio
+    if dti is None:
+        dti = customer.total_debts / customer.income if customer.income > 0 else 0.0
+    return (customer.credit_score, customer.income, EMPLOYMENT_CODES[customer.employment_status],
+            customer.employment_duration, dti, customer.previous_defaults,
+            *extract_dispute_features(customer.dispute_history, now))
+
+
+def _support_row(co_applicant, collateral):
+    """Values of the SUPPORT_COLUMNS for an optional co-applicant and collateral."""
+    return (co_applicant is not None,
+            co_applicant.income if co_applicant else 0.0,
+            co_applicant.credit_score if co_applicant else 0,
+            collateral is not None,
+            collateral.value if collateral else 0.0)
+
+
+def applications_to_columns(requests, now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Turn LoanEligibilityRequest objects into the column arrays score_columns expects.
+
+    Args:
+        requests: Sequence of LoanEligibilityRequest
+        now: Reference time for dispute recency (default: now)
+    """
+    now = now or datetime.now()
+    rows = []
+    for request in requests:
+        loan = request.loan_application
+        rows.append((
+            *_customer_row(request.customer, now),
+            loan.loan_amount, LOAN_TYPE_CODES[loan.loan_type], PURPOSE_CODES[loan.loan_purpose], loan.loan_term,
+            *_support_row(loan.co_applicant, loan.collateral),
+        ))
+    if not rows:
+        return {name: np.array([]) for name in COLUMNS}
+    return {name: np.array(column) for name, column in zip(COLUMNS, zip(*rows))}
+
+
+def scenario_columns(customer, loan_amounts, loan_terms, loan_types, loan_purposes, co_applicant=None,
+                     collateral=None, now: Optional[datetime] = None):
+    """
+    Columns for every combination of loan amount, term, type and purpose for one customer.
+
+    The customer's values, dispute features included, are computed once and
+    broadcast over the grid.
+
+    Args:
+        customer: CustomerData
+        loan_amounts, loan_terms, loan_types, loan_purposes: Values of each grid axis
+        co_applicant: Optional CoApplicantInfo, the same for every scenario
+        collateral: Optional CollateralInfo, the same for every scenario
+        now: Reference time for dispute recency (default: now)
+
+    Returns:
+        (columns, shape): flat columns in C order of a grid indexed
+        [amount, term, type, purpose], and the grid's shape
+    """
+    now = now or datetime.now()
+    amounts, terms, types, purposes = (axis.ravel() for axis in np.meshgrid(
+        np.asarray(loan_amounts, dtype=float),
+        np.asarray(loan_terms),
+        [LOAN_TYPE_CODES[loan_type] for loan_type in loan_types],
+        [PURPOSE_CODES[purpose] for purpose in loan_purposes],
+        indexing="ij"))
+    fixed = (*_customer_row(customer, now), *_support_row(co_applicant, collateral))
+    columns = {name: np.full(len(amounts), value) for name, value in zip(CUSTOMER_COLUMNS + SUPPORT_COLUMNS, fixed)}
+    columns.update(loan_amount=amounts, loan_term=terms, loan_type=types, loan_purpose=purposes)
+    return columns, (len(loan_amounts), len(loan_terms), len(loan_types), len(loan_purposes))
+
+
+def score_columns(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Score applications given as column arrays.
+
+    Args:
+        columns: Equal-length arrays as produced by applications_to_columns;
+            categorical columns hold EMPLOYMENT_CODES, LOAN_TYPE_CODES and
+            PURPOSE_CODES, dispute columns hold counts
+
+    Returns:
+        Arrays eligibility_score, dispute_score, approval_status (index into
+        APPROVAL_STATUSES), max_loan_amount and interest_rate
+    """
+    credit_score = columns["credit_score"].astype(float)
+    income = columns["income"].astype(float)
+    loan_amount = columns["loan_amount"].astype(float)
+    employment = columns["employment_status"]
+    purpose = columns["loan_purpose"]
+    has_co_applicant = columns["has_co_applicant"].astype(bool)
+    co_income = columns["co_applicant_income"].astype(float)
+    co_credit_score = columns["co_applicant_credit_score"]
+    has_collateral = columns["has_collateral"].astype(bool)
+
+    # Each factor is computed with the same operations, in the same order, as
+    # the scalar path, so the unrounded totals are identical
+    credit_factor = (credit_score - 300) / 550 * 30
+    income_factor = np.minimum(income / np.where(loan_amount == 0, 1, loan_amount), 10) / 10 * 20
+    employment_factor = np.where(
+        (employment == EMPLOYMENT_CODES["employed"]) | (employment == EMPLOYMENT_CODES["self_employed"]),
+        np.minimum(columns["employment_duration"] / 60, 1) * 15,
+        np.where(employment == EMPLOYMENT_CODES["retired"], 10, 0))
+    dti_factor = (1 - columns["debt_to_income_ratio"].astype(float)) * 15
+    history_factor = 10 - (np.minimum(columns["previous_defaults"], 5) * 2)
+
+    dispute_score = 10.0 - np.minimum(columns["total_disputes"] * 0.5, 3.0)
+    dispute_score = dispute_score - np.minimum(columns["recent_disputes"] * 1.0, 4.0)
+    dispute_score = np.maximum(dispute_score - np.minimum(columns["rejected_disputes"] * 1.5, 5.0), 0)
+
+    total = credit_factor + income_factor + employment_factor + dti_factor + history_factor + dispute_score
+    total = total * np.select([(purpose == PURPOSE_CODES["home_purchase"]) | (purpose == PURPOSE_CODES["education"]),
+                               purpose == PURPOSE_CODES["business"]], [1.05, 0.95], 1.0)
+    total = total * np.where(columns["loan_term"] > 120, 0.97, 1.0)
+
+    co_factor = 1.0 + np.select([co_credit_score > 700, co_credit_score < 600], [0.05, -0.05], 0.0)
+    co_factor = co_factor + np.where(income + co_income > income * 1.5, 0.05, 0.0)
+    co_factor = np.maximum(np.minimum(co_factor, 1.15), 0.9)
+    total = total * np.where(has_co_applicant, co_factor, 1.0)
+
+    coverage = columns["collateral_value"] / loan_amount
+    collateral_factor = np.minimum(1.0 + np.select([coverage >= 1.0, coverage >= 0.7], [0.1, 0.05], 0.0), 1.1)
+    total = total * np.where(has_collateral, collateral_factor, 1.0)
+
+    score = np.minimum(_round(total, 1), 100)
+
+    income_limit = np.where(has_co_applicant, (income + co_income) * 4, income * 5)
+    max_loan = np.minimum(income_limit * (0.5 + (credit_score - 300) / 550), loan_amount * 1.2)
+    interest_rate = _round(_BASE_RATES[columns["loan_type"]] + (100 - score) / 20 + (850 - credit_score) / 100, 2)
+
+    return {
+        "eligibility_score": score,
+        "dispute_score": dispute_score,
+        "approval_status": (score >= 60).astype(np.int8) + (score >= 80),
+        "max_loan_amount": max_loan,
+        "interest_rate": interest_rate,
+    }
+
+
+def score_applications(requests, now: Optional[datetime] = None, scorer=None) -> List[dict]:
+    """
+    Score LoanEligibilityRequest objects, returning LoanEligibilityResponse fields as dicts.
+
+    Args:
+        requests: Sequence of LoanEligibilityRequest
+        now: Reference time for dispute recency (default: now)
+        scorer: Vectorized model scoring the columns (default: score_columns)
+    """
+    if not requests:
+        return []
+    columns = applications_to_columns(requests, now)
+    return build_responses(requests, columns, (scorer or score_columns)(columns))
+
+
+def build_responses(requests, columns: Dict[str, np.ndarray], scores: Dict[str, np.ndarray]) -> List[dict]:
+    """
+    LoanEligibilityResponse fields of scored applications, as dicts.
+
+    Args:
+        requests: Sequence of LoanEligibilityRequest
+        columns: Their columns, from applications_to_columns
+        scores: Their scores, from score_columns
+    """
+    responses = []
+    for i, request in enumerate(requests):
+        customer, loan = request.customer, request.loan_application
+        score = float(scores["eligibility_score"][i])
+        status = int(scores["approval_status"][i])
+        max_loan = float(scores["max_loan_amount"][i])
+        interest_rate = float(scores["interest_rate"][i])
+        past_year_disputes = int(columns["past_year_disputes"][i])
+        dispute_message = (f" Your recent dispute history ({past_year_disputes} in the past year) "
+                           "is affecting your eligibility." if past_year_disputes else "")
+
+        if status == 2:
+            recommendation = ("Congratulations! You are highly eligible for this loan. We recommend proceeding "
+                              f"with your application for ${loan.loan_amount:,.2f}.")
+        elif status == 1:
+            if loan.loan_amount > max_loan:
+                recommendation = (f"You qualify for a loan, but we recommend reducing the amount to ${max_loan:,.2f} "
+                                  f"for better terms. Your credit profile suggests an interest rate of "
+                                  f"{interest_rate}%.{dispute_message}")
+            else:
+                recommendation = (f"You qualify for this loan with an estimated interest rate of {interest_rate}%. "
+                                  "Consider improving your credit score or reducing debt to get better "
+                                  f"terms.{dispute_message}")
+        elif score >= 40:
+            recommendation = ("We cannot approve your application at this time. Consider improving your credit "
+                              f"score (current: {customer.credit_score}), reducing existing debt, or applying for "
+                              f"a smaller loan amount.{dispute_message}")
+        else:
+            recommendation = ("Your application does not meet our current lending criteria. Major factors include "
+                              f"credit score ({customer.credit_score}), debt-to-income ratio "
+                              f"({columns['debt_to_income_ratio'][i]:.2%}), and loan amount "
+                              f"(${loan.loan_amount:,.2f}).{dispute_message}")
+
+        responses.append({
+            "eligibility_score": score,
+            "recommendation": recommendation,
+            "approval_status": APPROVAL_STATUSES[status],
+            "max_loan_amount": max_loan if status else None,
+            "suggested_interest_rate": interest_rate if status else None,
+            "dispute_impact": {
+                "dispute_score": round(float(scores["dispute_score"][i]), 1),
+                "total_disputes": int(columns["total_disputes"][i]),
+                "recent_disputes": int(columns["recent_disputes"][i]),
+                "rejected_disputes": int(columns["rejected_disputes"][i]),
+            },
+            "application_id": new_application_id(),
+        })
+    return responses
+
+
+def sweep_scenarios(customer, loan_amounts, loan_terms, loan_types, loan_purposes, co_applicant=None,
+                    collateral=None, top_n=5, now: Optional[datetime] = None, scorer=None) -> dict:
+    """
+    Score one customer over a grid of loan amounts, terms, types and purposes.
+
+    The grid is scored with scorer, a vectorized model (default: score_columns).
+
+    Returns:
+        Dict with the grid axes, the eligibility_scores and suggested_interest_rates
+        surfaces indexed [amount, term, type, purpose] (rates are None where the
+        application would be denied), the top_n best_options and the
+        customer's dispute_impact. Options are ranked by approval status, then
+        largest loan amount, then lowest rate.
+    """
+    columns, shape = scenario_columns(customer, loan_amounts, loan_terms, loan_types, loan_purposes,
+                                      co_applicant, collateral, now)
+    scores = (scorer or score_columns)(columns)
+    status = scores["approval_status"]
+    approved = np.flatnonzero(status)
+    best = approved[np.lexsort((scores["interest_rate"][approved], -columns["loan_amount"][approved],
+                                -status[approved]))][:top_n]
+
+    return {
+        "loan_amounts": list(loan_amounts),
+        "loan_terms": list(loan_terms),
+        "loan_types": list(loan_types),
+        "loan_purposes": list(loan_purposes),
+        "eligibility_scores": scores["eligibility_score"].reshape(shape).tolist(),
+        "suggested_interest_rates": np.where(status > 0, scores["interest_rate"], None).reshape(shape).tolist(),
+        "best_options": [
+            {
+                "loan_amount": float(columns["loan_amount"][i]),
+                "loan_term": int(columns["loan_term"][i]),
+                "loan_type": loan_types[i // shape[3] % shape[2]],
+                "loan_purpose": loan_purposes[i % shape[3]],
+                "eligibility_score": float(scores["eligibility_score"][i]),
+                "approval_status": APPROVAL_STATUSES[status[i]],
+                "max_loan_amount": float(scores["max_loan_amount"][i]),
+                "suggested_interest_rate": float(scores["interest_rate"][i]),
+            }
+            for i in best.tolist()
+        ],
+        "dispute_impact": {
+            "dispute_score": round(float(scores["dispute_score"][0]), 1),
+            "total_disputes": int(columns["total_disputes"][0]),
+            "recent_disputes": int(columns["recent_disputes"][0]),
+            "rejected_disputes": int(columns["rejected_disputes"][0]),
+        },
+    }
@@ -0,0 +1,511 @@
+"""
+Micro-benchmarks for the loan eligibility scoring paths.
+
+Usage:
+    python benchmark.py [batch] [disputes] [scenarios] [registry] [codec] [backend] [amortization] [risk] [shadow] [stats] [ids]
+"""
+from datetime import datetime, timedelta
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import batch_scoring
+from application_ids import application_ids, new_application_id
+from amortization import loan_schedule, portfolio_cash_flow
+from dispute_features import extract_dispute_features
+from scoring_backend import InlineBackend, ProcessPoolBackend
+from streaming_stats import RollingSketches
+from loan_eligibility_api import LoanEligibilityRequest, calculate_eligibility_score, generate_recommendation
+from sample_data import check_unique_ids, random_application
+
+
+def _best_of(fn, repeat=3):
+    """Return the best wall time of fn() in seconds over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _random_columns(n, seed=0):
+    """Columns of n random applications, as score_columns expects them."""
+    rng = np.random.default_rng(seed)
+    return {
+        "credit_score": rng.integers(300, 851, n),
+        "income": rng.uniform(10_000, 250_000, n),
+        "employment_status": rng.integers(0, len(batch_scoring.EMPLOYMENT_CODES), n),
+        "employment_duration": rng.integers(0, 121, n),
+        "debt_to_income_ratio": rng.uniform(0, 1, n),
+        "previous_defaults": rng.integers(0, 8, n),
+        "total_disputes": rng.integers(0, 12, n),
+        "recent_disputes": rng.integers(0, 6, n),
+        "rejected_disputes": rng.integers(0, 4, n),
+        "past_year_disputes": rng.integers(0, 6, n),
+        "loan_amount": rng.uniform(1_000, 800_000, n),
+        "loan_type": rng.integers(0, len(batch_scoring.LOAN_TYPE_CODES), n),
+        "loan_purpose": rng.integers(0, len(batch_scoring.PURPOSE_CODES), n),
+        "loan_term": rng.choice([12, 60, 120, 121, 360], n),
+        "has_co_applicant": rng.random(n) < 0.3,
+        "co_applicant_income": rng.uniform(0, 150_000, n),
+        "co_applicant_credit_score": rng.integers(300, 851, n),
+        "has_collateral": rng.random(n) < 0.3,
+        "collateral_value": rng.uniform(0, 1_000_000, n),
+    }
+
+
+def bench_batch(sizes=(1_000, 100_000, 1_000_000), n_distinct=10_000, max_scalar_rows=20_000):
+    """Scalar scoring loop vs. vectorized batch scoring at increasing batch sizes."""
+    rng = random.Random(42)
+    distinct = [LoanEligibilityRequest.parse_obj(random_application(rng)) for _ in range(n_distinct)]
+
+    def scalar(requests):
+        for request in requests:
+            score, _ = calculate_eligibility_score(request.customer, request.loan_application)
+            generate_recommendation(score, request.customer, request.loan_application)
+
+    print("Batch eligibility scoring (ms per batch; scalar beyond "
+          f"{max_scalar_rows:,} rows extrapolated from a {max_scalar_rows:,}-row run)")
+    print(f"{'rows':>10} {'scalar':>10} {'batch':>10} {'speed-up':>9} {'columns only':>13}")
+    scalar_per_row = None
+    for size in sizes:
+        # Requests repeat every n_distinct rows, so large batches fit in memory
+        requests = (distinct * (size // n_distinct + 1))[:size]
+        if size <= max_scalar_rows:
+            scalar_seconds = _best_of(lambda: scalar(requests), repeat=1 if size > 1000 else 3)
+            scalar_per_row = scalar_seconds / size
+        else:
+            scalar_seconds = scalar_per_row * size
+        batch_seconds = _best_of(lambda: batch_scoring.score_applications(requests), repeat=1)
+        columns = _random_columns(size)
+        columns_seconds = _best_of(lambda: batch_scoring.score_columns(columns))
+        print(f"{size:>10,} {scalar_seconds * 1e3:>10.1f} {batch_seconds * 1e3:>10.1f} "
+              f"{scalar_seconds / batch_seconds:>8.1f}x {columns_seconds * 1e3:>13.1f}")
+
+
+def bench_disputes(history_sizes=(10, 100, 1000), n_requests=200):
+    """Per-request dispute handling: two passes with a clock read per record vs. one shared pass."""
+    rng = random.Random(5)
+    today = datetime.now()
+
+    def two_passes(history):
+        # The dispute factor and the recommendation each walked the history;
+        # the recommendation also read the clock once per record
+        current_date = datetime.now()
+        recent = rejected = 0
+        for dispute in history:
+            try:
+                dispute_date = datetime.fromisoformat(dispute.submission_date.replace('Z', '+00:00'))
+                if (current_date - dispute_date).days <= 365:
+                    recent += 1
+                if dispute.status == "rejected":
+                    rejected += 1
+            except (ValueError, TypeError):
+                continue
+        return sum(1 for d in history if datetime.now().timestamp() - datetime.fromisoformat(
+            d.submission_date.replace('Z', '+00:00')).timestamp() < 86400 * 365)
+
+    print("Dispute history handling (us per request)")
+    print(f"{'disputes':>10} {'two passes':>11} {'one pass':>9} {'speed-up':>9} {'full scoring':>13}")
+    for size in history_sizes:
+        application = random_application(rng)
+        application["customer"]["dispute_history"] = [
+            {"dispute_id": f"D{i}", "description": "Disputed charge",
+             "submission_date": (today - timedelta(days=rng.uniform(0, 1500))).isoformat(),
+             "status": rng.choice(["resolved", "pending", "rejected"])}
+            for i in range(size)
+        ]
+        request = LoanEligibilityRequest.parse_obj(application)
+        history = request.customer.dispute_history
+        requests = [request] * n_requests
+
+        def score(request):
+            features = extract_dispute_features(request.customer.dispute_history)
+            score, _ = calculate_eligibility_score(request.customer, request.loan_application, features)
+            generate_recommendation(score, request.customer, request.loan_application, features)
+
+        old = _best_of(lambda: [two_passes(history) for _ in range(n_requests)]) / n_requests * 1e6
+        new = _best_of(lambda: [extract_dispute_features(history) for _ in range(n_requests)]) / n_requests * 1e6
+        full = _best_of(lambda: [score(r) for r in requests]) / n_requests * 1e6
+        print(f"{size:>10,} {old:>11.1f} {new:>9.1f} {old / new:>8.1f}x {full:>13.1f}")
+
+
+def bench_scenarios(grids=((10, 10, 4), (50, 50, 4), (100, 100, 4)), n_runs=20):
+    """Latency of a what-if sweep over amount x term x type grids, in-process and through the endpoint."""
+    from fastapi.testclient import TestClient
+    from loan_eligibility_api import ScenarioSweepRequest, app
+
+    client = TestClient(app)
+    customer = random_application(random.Random(8))["customer"]
+
+    print("Scenario sweep (ms per sweep)")
+    print(f"{'grid':>12} {'scenarios':>10} {'scoring':>9} {'endpoint':>9} {'scalar estimate':>16}")
+    scalar_per_row = None
+    for amounts, terms, types in grids:
+        body = {"customer": customer,
+                "loan_amounts": {"start": 5_000, "stop": 750_000, "num": amounts},
+                "loan_terms": {"start": 12, "stop": 480, "num": terms},
+                "loan_types": ["fixed", "variable", "interest_only", "balloon"][:types],
+                "loan_purposes": ["home_purchase"]}
+        request = ScenarioSweepRequest.parse_obj(body)
+        scoring = _best_of(lambda: batch_scoring.sweep_scenarios(
+            request.customer, request.loan_amounts, request.loan_terms, request.loan_types, request.loan_purposes),
+            repeat=n_runs)
+        endpoint = _best_of(lambda: client.post("/loan-eligibility/scenarios", json=body), repeat=n_runs)
+
+        if scalar_per_row is None:
+            single = LoanEligibilityRequest.parse_obj({"customer": customer, "loan_application": {
+                "loan_amount": 100_000, "loan_term": 60, "loan_type": "fixed", "loan_purpose": "home_purchase",
+                "customer_id": customer["customer_id"]}})
+            scalar_per_row = _best_of(lambda: [generate_recommendation(calculate_eligibility_score(
+                single.customer, single.loan_application)[0], single.customer, single.loan_application)
+                for _ in range(1000)]) / 1000
+        size = amounts * terms * types
+        print(f"{f'{amounts}x{terms}x{types}':>12} {size:>10,} {scoring * 1e3:>9.1f} {endpoint * 1e3:>9.1f} "
+              f"{scalar_per_row * size * 1e3:>16.1f}")
+
+
+def bench_registry(history_sizes=(0, 100, 1000), n_requests=200):
+    """Request latency with the full customer profile vs. a registered customer."""
+    from fastapi.testclient import TestClient
+    import loan_eligibility_api
+    from customer_registry import CustomerRegistry
+
+    loan_eligibility_api.customer_registry = CustomerRegistry(
+        ":memory:", loan_eligibility_api.CustomerData.parse_raw, loan_eligibility_api.compute_registered_factors)
+    client = TestClient(loan_eligibility_api.app)
+    rng = random.Random(9)
+    today = datetime.now()
+
+    print("Eligibility request latency (ms per request, through the test client)")
+    print(f"{'disputes':>10} {'full profile':>13} {'registered':>11}")
+    for size in history_sizes:
+        application = random_application(rng, f"CUST{size}")
+        application["customer"]["dispute_history"] = [
+            {"dispute_id": f"D{i}", "description": "Disputed charge",
+             "submission_date": (today - timedelta(days=rng.uniform(0, 1500))).isoformat(),
+             "status": rng.choice(["resolved", "pending", "rejected"])}
+            for i in range(size)
+        ]
+        client.put(f"/customers/CUST{size}", json=application["customer"])
+        loan = application["loan_application"]
+
+        full = _best_of(lambda: [client.post("/loan-eligibility", json=application) for _ in range(n_requests)])
+        registered = _best_of(lambda: [client.post(f"/customers/CUST{size}/loan-eligibility", json=loan)
+                                       for _ in range(n_requests)])
+        print(f"{size:>10,} {full / n_requests * 1e3:>13.2f} {registered / n_requests * 1e3:>11.2f}")
+
+
+def bench_codec(history_sizes=(0, 100, 1000), n_requests=200):
+    """Request decoding and response encoding of /loan-eligibility vs. /loan-eligibility/fast."""
+    import asyncio
+    import json
+
+    from fastapi.routing import serialize_response
+    from fastapi.testclient import TestClient
+    import loan_eligibility_api as api
+
+    client = TestClient(api.app)
+    route = next(r for r in api.app.routes if getattr(r, "path", None) == "/loan-eligibility")
+    loop = asyncio.new_event_loop()
+    rng = random.Random(10)
+    today = datetime.now()
+
+    def regular_decode(body):
+        value, errors = route.body_field.validate(json.loads(body), {}, loc=("body",))
+        return value
+
+    def regular_encode(fields):
+        content = loop.run_until_complete(serialize_response(
+            field=route.response_field, response_content=api.LoanEligibilityResponse(**fields)))
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    print("Request decoding / response encoding (us per request) and round trip (ms, through the test client)")
+    print(f"{'disputes':>10} {'decode':>9} {'fast':>9} {'encode':>9} {'fast':>9} {'request':>9} {'fast':>9}")
+    for size in history_sizes:
+        application = random_application(rng)
+        application["customer"]["dispute_history"] = [
+            {"dispute_id": f"D{i}", "description": "Disputed charge",
+             "submission_date": (today - timedelta(days=rng.uniform(0, 1500))).isoformat(),
+             "status": rng.choice(["resolved", "pending", "rejected"])}
+            for i in range(size)
+        ]
+        body = json.dumps(application).encode()
+        request = api.LoanEligibilityRequest.parse_obj(application)
+        score, impact = calculate_eligibility_score(request.customer, request.loan_application)
+        fields = dict(api.recommendation_fields(score, request.customer, request.loan_application),
+                      dispute_impact=impact, application_id="LOAN-12345")
+
+        def per_request(fn, arg, repeat=n_requests):
+            return _best_of(lambda: [fn(arg) for _ in range(repeat)]) / repeat
+
+        timings = [
+            per_request(regular_decode, body) * 1e6, per_request(api.decode_eligibility_request, body) * 1e6,
+            per_request(regular_encode, fields) * 1e6, per_request(api.encode_eligibility_response, fields) * 1e6,
+            per_request(lambda b: client.post("/loan-eligibility", content=b), body, 50) * 1e3,
+            per_request(lambda b: client.post("/loan-eligibility/fast", content=b), body, 50) * 1e3,
+        ]
+        print(f"{size:>10,} " + " ".join(f"{t:>9.1f}" for t in timings))
+    loop.close()
+
+
+def bench_backend(history_sizes=(100, 1000), n_requests=100, concurrency=16):
+    """Event loop lag while scoring concurrent requests inline vs. in a process pool."""
+    import loan_eligibility_api as api
+
+    print(f"{'disputes':>10} {'backend':>20} {'total ms':>9} {'lag p99':>9} {'lag max':>9} "
+          f"{'wait p95':>9} {'compute':>9}")
+    for size in history_sizes:
+        application = random_application(random.Random(size), "BENCH")
+        application["customer"]["dispute_history"] = [
+            dict(dispute_id=f"DSP{i}", description="Disputed charge", status="rejected",
+                 submission_date=(datetime.now() - timedelta(days=i % 900)).isoformat())
+            for i in range(size)
+        ]
+        request = LoanEligibilityRequest.parse_obj(application)
+
+        for backend in (InlineBackend(), ProcessPoolBackend(max_queue_depth=n_requests)):
+            async def run():
+                lags = []
+                done = asyncio.Event()
+
+                async def ticker():
+                    # How late a 1 ms timer fires is how long other requests' I/O would wait
+                    while not done.is_set():
+                        start = time.perf_counter()
+                        await asyncio.sleep(0.001)
+                        lags.append(time.perf_counter() - start - 0.001)
+
+                async def client(n):
+                    for _ in range(n):
+                        await backend.run(api.evaluate_application, request.customer, request.loan_application)
+                        await asyncio.sleep(0)
+
+                tick = asyncio.create_task(ticker())
+                start = time.perf_counter()
+                await asyncio.gather(*(client(n_requests // concurrency) for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+                done.set()
+                await tick
+                return elapsed, sorted(lags)
+
+            asyncio.run(run())  # warm up the pool
+            elapsed, lags = asyncio.run(run())
+            stats = backend.stats()
+            backend.shutdown()
+            print(f"{size:>10,} {type(backend).__name__:>20} {elapsed * 1e3:>9.1f} "
+                  f"{lags[int(0.99 * (len(lags) - 1))] * 1e3:>9.2f} {lags[-1] * 1e3:>9.2f} "
+                  f"{stats['queue_wait']['p95_ms']:>9.2f} {stats['compute']['p50_ms']:>9.2f}")
+
+
+def _loop_schedule(amount, term, annual_rate):
+    """A fixed-rate schedule computed month by month, as clients did."""
+    rate = annual_rate / 1200
+    payment = amount * rate / (1 - (1 + rate) ** -term)
+    balance, rows = amount, []
+    for month in range(1, term + 1):
+        interest = balance * rate
+        principal = balance if month == term else payment - interest
+        balance -= principal
+        rows.append((month, interest + principal, principal, interest, balance))
+    return rows
+
+
+def bench_amortization(portfolio_sizes=(1_000, 10_000)):
+    """One 360-month schedule, and portfolio cash flow: per-month loops vs. array operations."""
+    from loan_eligibility_api import PortfolioLoan
+
+    loop = _best_of(lambda: _loop_schedule(250_000, 360, 6.5), 20)
+    vectorized = _best_of(lambda: loan_schedule(250_000, 360, "fixed", 6.5), 20)
+    print(f"360-month schedule: loop {loop * 1e3:.2f} ms, vectorized {vectorized * 1e3:.2f} ms")
+
+    print(f"{'loans':>10} {'loop ms':>10} {'vector ms':>10} {'speed-up':>9}")
+    rng = random.Random(0)
+    for size in portfolio_sizes:
+        loans = [
+            PortfolioLoan(loan_amount=rng.uniform(1_000, 500_000), loan_term=rng.choice([12, 60, 120, 360]),
+                          loan_type="fixed", annual_rate=rng.uniform(2, 15), start_month=rng.randint(0, 24))
+            for _ in range(size)
+        ]
+
+        def loop_portfolio():
+            totals = {}
+            for loan in loans:
+                for month, payment, *_ in _loop_schedule(loan.loan_amount, loan.loan_term, loan.annual_rate):
+                    totals[loan.start_month + month] = totals.get(loan.start_month + month, 0.0) + payment
+            return totals
+
+        looped = _best_of(loop_portfolio, 1)
+        vectorized = _best_of(lambda: portfolio_cash_flow(loans), 3)
+        print(f"{size:>10,} {looped * 1e3:>10.1f} {vectorized * 1e3:>10.1f} {looped / vectorized:>8.1f}x")
+
+
+def _loop_default_risk(application, paths, rng):
+    """The fixed-loan default simulation of risk_simulation, one path and month at a time."""
+    import risk_simulation as rs
+
+    term, amount, rate = int(application["loan_term"]), application["loan_amount"], application["interest_rate"] / 1200
+    payment = amount * rate / (1 - (1 + rate) ** -term)
+    income = (application["income"] + application["co_applicant_income"]) / 12
+    hazard = 1 - (1 - rs.baseline_default_probability(application["eligibility_score"])) ** (1 / 12)
+    loss_probability = rs.INCOME_LOSS_PROBABILITY[int(application["employment_status"])]
+    losses = []
+    for _ in range(paths):
+        level, balance, loss = income, amount, 0.0
+        debts = application["debt_to_income_ratio"] * application["income"] / 12 * rng.lognormvariate(
+            -rs.DEBT_VOLATILITY ** 2 / 2, rs.DEBT_VOLATILITY)
+        for month in range(term):
+            if month % 12 == 0:
+                level *= rng.lognormvariate(-rs.INCOME_VOLATILITY ** 2 / 2, rs.INCOME_VOLATILITY)
+                current = level * (rs.INCOME_LOSS_FACTOR if rng.random() < loss_probability else 1.0)
+            if debts + payment > rs.DEFAULT_DEBT_SERVICE_RATIO * current or rng.random() < hazard:
+                loss = balance * (1 - rs.UNSECURED_RECOVERY)
+                break
+            balance -= payment - balance * rate
+        losses.append(loss)
+    return losses
+
+
+def bench_risk(paths=(1_000, 10_000), batch_sizes=(10, 50), budget_ms=250, n_runs=5):
+    """Default-risk simulation: per-path loops vs. vectorized blocks, and latency under a time budget."""
+    from fastapi.testclient import TestClient
+
+    import risk_simulation
+    from batch_scoring import applications_to_columns, score_columns
+    from loan_eligibility_api import app
+
+    application = random_application(random.Random(1), "BENCH")
+    # An affordable loan, so paths run for most of the term instead of defaulting at once
+    application["customer"].update(income=120_000, credit_score=760, total_debts=12_000, debt_to_income_ratio=None,
+                                   employment_status="employed", employment_duration=48, previous_defaults=0)
+    application["loan_application"].update(loan_amount=250_000, loan_type="fixed", loan_term=360,
+                                           co_applicant=None, collateral=None)
+    columns = applications_to_columns([LoanEligibilityRequest.parse_obj(application)])
+    inputs = risk_simulation.risk_inputs(columns, score_columns(columns))
+    row = {name: column[0] for name, column in inputs.items()}
+
+    print(f"{'paths':>10} {'loop ms':>10} {'vector ms':>10} {'speed-up':>9}")
+    for n in paths:
+        looped = _best_of(lambda: _loop_default_risk(row, min(n, 1_000), random.Random(0)), 1) * max(n / 1_000, 1)
+        vectorized = _best_of(lambda: risk_simulation.simulate_default_risk(
+            inputs, np.random.SeedSequence(0).spawn(1), n, float("inf")), 3)
+        print(f"{n:>10,} {looped * 1e3:>10.1f} {vectorized * 1e3:>10.1f} {looped / vectorized:>8.1f}x")
+
+    client = TestClient(app)
+    print(f"{'batch':>10} {'budget ms':>10} {'max ms':>10} {'paths/app':>10}")
+    for size in batch_sizes:
+        body = {"applications": [random_application(random.Random(i), f"C{i}") for i in range(size)],
+                "simulation": {"paths": 10_000, "time_budget_ms": budget_ms}}
+        latencies, simulated = [], []
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            results = client.post("/loan-eligibility/risk/batch", json=body).json()
+            latencies.append(time.perf_counter() - start)
+            simulated += [result["risk"]["paths"] for result in results]
+        print(f"{size:>10,} {budget_ms:>10} {max(latencies) * 1e3:>10.1f} {np.mean(simulated):>10,.0f}")
+
+
+def bench_shadow(n_requests=300, history_sizes=(0, 100)):
+    """/loan-eligibility latency without and with a shadow model, and the cost of starting a shadow call."""
+    import tempfile
+
+    from fastapi.testclient import TestClient
+
+    import loan_eligibility_api as api
+    from model_registry import ShadowScorer
+
+    client = TestClient(api.app)
+    scorer = api.shadow_scorer = ShadowScorer(ProcessPoolBackend(workers=1, niceness=19),
+                                              tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False).name)
+    print(f"{'disputes':>10} {'shadow':>8} {'p50 ms':>8} {'p99 ms':>8} {'shed':>6}")
+    for size in history_sizes:
+        application = random_application(random.Random(size), "BENCH")
+        application["customer"]["dispute_history"] = [
+            dict(dispute_id=f"DSP{i}", description="Disputed charge", status="resolved",
+                 submission_date=(datetime.now() - timedelta(days=i)).isoformat())
+            for i in range(size)
+        ]
+        for shadow in (None, "v1"):
+            api.model_registry.set_shadow(shadow)
+            for _ in range(20):
+                client.post("/loan-eligibility", json=application)
+            scorer.flush()
+            shed = scorer.shed
+            latencies = []
+            for _ in range(n_requests):
+                start = time.perf_counter()
+                client.post("/loan-eligibility", json=application)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print(f"{size:>10,} {shadow or 'off':>8} {latencies[len(latencies) // 2] * 1e3:>8.2f} "
+                  f"{latencies[int(len(latencies) * 0.99)] * 1e3:>8.2f} {scorer.shed - shed:>6}")
+    api.model_registry.set_shadow(None)
+
+    request = LoanEligibilityRequest.parse_obj(random_application(random.Random(0), "BENCH"))
+    result = api.evaluate_application(request.customer, request.loan_application)
+    model = api.model_registry.get("v1")
+    submit = _best_of(lambda: [scorer.submit(model, (request.customer, request.loan_application), "v1", result,
+                                             {"application_id": "LOAN-1"}) for _ in range(8)], 5) / 8
+    print(f"starting a shadow call: {submit * 1e6:.0f} us")
+    scorer.close()
+    api.scoring_backend.shutdown()
+
+
+def bench_stats(n_values=1_000_000, n_labels=21):
+    """Cost of recording a value into the rolling sketches, their size after an hour of traffic, and a window query."""
+    rng = random.Random(0)
+    labels = [(f"status{i % 3}", f"purpose{i}") for i in range(n_labels)]
+    values = [(labels[rng.randrange(n_labels)], rng.uniform(0, 100)) for _ in range(n_values)]
+    sketches = RollingSketches(slot_seconds=60, slots=60)
+    start = time.perf_counter()
+    for i, (label, value) in enumerate(values):
+        # Spread the values over two hours, so the oldest slots expire
+        sketches.add("eligibility_score", label, value, now=i * 7200 / n_values)
+    elapsed = time.perf_counter() - start
+    buckets = sum(len(sketch.buckets) for slot in sketches._slots.values() for sketch in slot.values())
+    query = _best_of(lambda: sketches.window(3600, now=7200))
+    print(f"recording a value: {elapsed / n_values * 1e6:.2f} us; "
+          f"{len(sketches._slots)} slots, {buckets:,} buckets after {n_values:,} values; "
+          f"1h window query: {query * 1e3:.1f} ms")
+
+
+def bench_ids(total=200_000_000, threads=4):
+    """Cost of an application ID, and a uniqueness stress test over `total` IDs across processes and threads."""
+    n = 1_000_000
+    value = _best_of(lambda: [application_ids.next_value() for _ in range(n)]) / n
+    string = _best_of(lambda: [new_application_id() for _ in range(n)]) / n
+    print(f"ID as an integer: {value * 1e6:.2f} us, as a string: {string * 1e6:.2f} us")
+
+    processes = max(os.cpu_count() or 1, 4)
+    count = total // (processes * threads)
+    start = time.perf_counter()
+    streams = check_unique_ids(processes, threads, count)
+    elapsed = time.perf_counter() - start
+    print(f"{len(streams) * count:,} IDs in {processes} processes x {threads} threads: all unique, "
+          f"{elapsed:.0f} s ({len(streams) * count / elapsed / 1e6:.1f}M IDs/s)")
+
+
+BENCHMARKS = {
+    "batch": bench_batch,
+    "disputes": bench_disputes,
+    "scenarios": bench_scenarios,
+    "registry": bench_registry,
+    "codec": bench_codec,
+    "backend": bench_backend,
+    "amortization": bench_amortization,
+    "risk": bench_risk,
+    "shadow": bench_shadow,
+    "stats": bench_stats,
+    "ids": bench_ids,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
@@ -0,0 +1,309 @@
+"""
+Registered customer profiles with precomputed customer-only score parts.
+
+Profiles are validated once when registered and stored in SQLite together
+with the parts of the eligibility score that depend only on the customer, so
+scoring a loan application for a registered customer needs neither the full
+profile in the request nor recomputing those parts.
+"""
+import queue
+import random
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from dispute_features import DisputeFeatures
+
+
+class CustomerFactors(NamedTuple):
+    """Score parts that depend only on the customer."""
+    credit_factor: float
+    employment_factor: float
+    dti_factor: float
+    history_factor: float
+    dispute_factor: float
+    dispute_features: DisputeFeatures
+    # When dispute_features next change as disputes age (naive local time), or None
+    valid_until: Optional[datetime]
+
+
+_MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customer_profiles (
+    customer_id TEXT PRIMARY KEY,
+    profile TEXT NOT NULL,
+    credit_factor REAL NOT NULL,
+    employment_factor REAL NOT NULL,
+    dti_factor REAL NOT NULL,
+    history_factor REAL NOT NULL,
+    dispute_factor REAL NOT NULL,
+    total_disputes INTEGER NOT NULL,
+    recent_disputes INTEGER NOT NULL,
+    rejected_disputes INTEGER NOT NULL,
+    past_year_disputes INTEGER NOT NULL,
+    valid_until TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+"""
+
+_FACTOR_COLUMNS = ("credit_factor, employment_factor, dti_factor, history_factor, dispute_factor, total_disputes, "
+                   "recent_disputes, rejected_disputes, past_year_disputes, valid_until")
+
+
+def _factor_values(factors):
+    valid_until = factors.valid_until.isoformat() if factors.valid_until else None
+    return (*factors[:5], *factors.dispute_features, valid_until)
+
+
+def _to_factors(row):
+    valid_until = datetime.fromisoformat(row[9]) if row[9] else None
+    return CustomerFactors(*row[:5], DisputeFeatures(*row[5:9]), valid_until)
+
+
+def _new_version():
+    # Random rather than incrementing, so a profile deleted and registered
+    # again never gets back the version of the one cached before
+    return random.getrandbits(63)
+
+
+class CustomerRegistry:
+    """
+    Customer profiles stored in SQLite, with a bounded LRU cache of parsed profiles and factors.
+
+    The schema is set up once, when the registry is created; calls then
+    borrow connections from a small pool. Factors are recomputed when a
+    profile is registered or updated, and when a cached record reaches its
+    valid_until time, so they always equal what scoring the profile from
+    scratch would give.
+
+    Several processes (e.g. uvicorn workers) may share one database file.
+    Every registration gives the row a new version, and a cached entry is
+    only used while its row still has the version it was read with, so a
+    profile updated or deleted by another process is never served from the
+    cache. Unknown customers are not cached, so one registered elsewhere is
+    found on the next lookup.
+    """
+
+    def __init__(self, path, parse_profile, compute_factors, cache_size=10_000, pool_size=8):
+        """
+        Initialize the registry.
+
+        Args:
+            path: SQLite database file, or ":memory:" for a private in-memory database
+            parse_profile: Function turning a stored profile (JSON) back into a CustomerData
+            compute_factors: Function computing the CustomerFactors of a CustomerData at
+                a reference time, compute_factors(customer, now)
+            cache_size: Maximum number of customers kept in the LRU cache
+            pool_size: Most idle connections kept for reuse
+        """
+        if path == ":memory:":
+            # A named shared-cache database, so every connection sees the same
+            # data. The anchor connection keeps it alive for the registry's lifetime.
+            self._uri = f"file:registry-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._uri = f"file:{path}"
+        self.path = path
+        self.parse_profile = parse_profile
+        self.compute_factors = compute_factors
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Serializes writers, so a refresh can't overwrite a newer profile
+        self._write_lock = threading.Lock()
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._anchor = self._setup()
+
+    def _open(self):
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _setup(self):
+        """Create and migrate the schema; returns the connection for :memory: registries, else None."""
+        conn = self._open()
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        if not self._has_version_column(conn):
+            self._add_version_column(conn)
+        if self.path == ":memory:":
+            return conn
+        self._release(conn)
+        return None
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a connection from the pool, opening one if none is idle."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @staticmethod
+    def _has_version_column(conn):
+        return any(row[1] == "version" for row in conn.execute("PRAGMA table_info(customer_profiles)"))
+
+    def _add_version_column(self, conn):
+        """Version the rows of databases created before they were versioned."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while this one waited for the lock
+            if not self._has_version_column(conn):
+                conn.execute("ALTER TABLE customer_profiles ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _cache_get(self, customer_id):
+        with self._cache_lock:
+            entry = self._cache.get(customer_id, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(customer_id)
+            return entry
+
+    def _cache_put(self, customer_id, entry, replace=True):
+        with self._cache_lock:
+            if not replace and customer_id in self._cache:
+                return
+            self._cache[customer_id] = entry
+            self._cache.move_to_end(customer_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _load(self, customer_id):
+        """Return the stored (profile, factors, version) of a customer, or None if unknown."""
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT profile, {_FACTOR_COLUMNS}, version FROM customer_profiles WHERE customer_id = ?",
+                (customer_id,),
+            ).fetchone()
+        return (self.parse_profile(row[0]), _to_factors(row[1:11]), row[11]) if row else None
+
+    def _stored_version(self, customer_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT version FROM customer_profiles WHERE customer_id = ?", (customer_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, customer, now: Optional[datetime] = None):
+        """
+        Register or update a customer profile, recomputing its factors.
+
+        Args:
+            customer: Validated CustomerData
+            now: Reference time for dispute recency (default: now)
+
+        Returns:
+            The customer's CustomerFactors
+        """
+        factors = self.compute_factors(customer, now or datetime.now())
+        version = _new_version()
+        with self._write_lock, self._connection() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO customer_profiles (customer_id, profile, {_FACTOR_COLUMNS}, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (customer.customer_id, customer.json(), *_factor_values(factors), version),
+            )
+            self._cache_put(customer.customer_id, (customer, factors, version))
+        return factors
+
+    def get(self, customer_id, now: Optional[datetime] = None):
+        """
+        Return (profile, factors) of a registered customer, or None if unknown.
+
+        Factors whose valid_until has passed are recomputed and stored first.
+        Returned profiles are shared with the cache and must not be modified.
+        """
+        entry = self._cache_get(customer_id)
+        if entry is not _MISSING and entry[2] != self._stored_version(customer_id):
+            # Updated or deleted by another process since it was cached
+            with self._cache_lock:
+                self.invalidations += 1
+                if self._cache.get(customer_id) is entry:
+                    del self._cache[customer_id]
+            entry = _MISSING
+        if entry is _MISSING:
+            entry = self._load(customer_id)
+            if entry is None:
+                return None
+            # A concurrent put() may have cached a newer profile since the row
+            # was read, so never overwrite an existing entry here
+            self._cache_put(customer_id, entry, replace=False)
+
+        valid_until = entry[1].valid_until
+        if valid_until is not None:
+            now = now or datetime.now()
+            if now >= valid_until:
+                entry = self._refresh(customer_id, entry, now)
+        return entry[:2]
+
+    def _refresh(self, customer_id, stale, now):
+        """Recompute the factors of a cached entry whose features have changed."""
+        with self._write_lock:
+            with self._cache_lock:
+                current = self._cache.get(customer_id)
+            if current is not stale and current is not None:
+                return current  # already refreshed or replaced
+            customer, _, version = stale
+            factors = self.compute_factors(customer, now)
+            # Only if the stored profile is still the one the factors were computed from
+            with self._connection() as conn:
+                updated = conn.execute(
+                    f"UPDATE customer_profiles SET ({_FACTOR_COLUMNS}) = (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "WHERE customer_id = ? AND version = ?", (*_factor_values(factors), customer_id, version),
+                ).rowcount
+            entry = (customer, factors, version)
+            # A deleted or replaced profile is left alone; the caller still gets the refreshed factors
+            if updated:
+                self._cache_put(customer_id, entry)
+            self.refreshes += 1
+            return entry
+
+    def delete(self, customer_id):
+        """Remove a customer's profile. Returns whether it was registered."""
+        with self._write_lock, self._connection() as conn:
+            deleted = conn.execute(
+                "DELETE FROM customer_profiles WHERE customer_id = ?", (customer_id,)
+            ).rowcount
+            with self._cache_lock:
+                self._cache.pop(customer_id, None)
+        return bool(deleted)
+
+    def stats(self):
+        """Return cache hit/miss counters."""
+        with self._cache_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "invalidations": self.invalidations,
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+            }
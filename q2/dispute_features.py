@@ -0,0 +1,87 @@
+"""
+Dispute history features.
+
+A customer's dispute history is walked once per request, against a single
+reference time, into a DisputeFeatures record; the dispute factor of the
+score and the dispute message of the recommendation both read from it.
+Counts only change as disputes age past a year, so features_valid_until()
+tells how long a record computed now stays exact.
+"""
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+_YEAR = timedelta(days=365)
+
+
+class DisputeFeatures(NamedTuple):
+    """Counts derived from a dispute history."""
+    total_disputes: int
+    # Disputes at most 365 days old (by whole days), as used by the score
+    recent_disputes: int
+    rejected_disputes: int
+    # Disputes less than 365 days old, as quoted in the recommendation
+    past_year_disputes: int
+
+
+NO_DISPUTES = DisputeFeatures(0, 0, 0, 0)
+
+
+def extract_dispute_features(dispute_history, now: Optional[datetime] = None) -> DisputeFeatures:
+    """
+    Walk a dispute history once and count its disputes.
+
+    Records whose submission_date doesn't parse only count towards the total.
+    Timezone-aware dates can't be compared with the naive reference time, so
+    they are only counted as past-year disputes (by timestamp).
+
+    Args:
+        dispute_history: List of DisputeRecord, or None
+        now: Reference time (default: now)
+    """
+    if not dispute_history:
+        return NO_DISPUTES
+    now = now or datetime.now()
+    now_timestamp = None
+    recent = rejected = past_year = 0
+    for dispute in dispute_history:
+        try:
+            dispute_date = datetime.fromisoformat(dispute.submission_date.replace('Z', '+00:00'))
+        except (ValueError, TypeError):
+            continue
+        if dispute_date.tzinfo is not None:
+            if now_timestamp is None:
+                now_timestamp = now.timestamp()
+            if now_timestamp - dispute_date.timestamp() < _YEAR.total_seconds():
+                past_year += 1
+            continue
+        age = now - dispute_date
+        if age < _YEAR:
+            past_year += 1
+        if age.days <= 365:
+            recent += 1
+        if dispute.status == "rejected":
+            rejected += 1
+    return DisputeFeatures(len(dispute_history), recent, rejected, past_year)
+
+
+def features_valid_until(dispute_history, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Return when the features of a dispute history next change, or None if never.
+
+    Features extracted at `now` are the same for any reference time before the
+    returned (naive, local) time: a dispute leaves the past year when it is
+    365 days old, and stops counting as recent once it is 366 whole days old.
+    """
+    now = now or datetime.now()
+    changes = []
+    for dispute in dispute_history or ():
+        try:
+            dispute_date = datetime.fromisoformat(dispute.submission_date.replace('Z', '+00:00'))
+        except (ValueError, TypeError):
+            continue
+        if dispute_date.tzinfo is not None:
+            changes.append(datetime.fromtimestamp(dispute_date.timestamp() + _YEAR.total_seconds()))
+        else:
+            changes += [dispute_date + _YEAR, dispute_date + _YEAR + timedelta(days=1)]
+    future = [change for change in changes if change > now]
+    return min(future) if future else None
@@ -0,0 +1,282 @@
+"""
+Fast request decoding and response encoding for pydantic models.
+
+compile_decoder() turns a request model into a plain function that takes the
+raw body, parses it with orjson and checks it field by field into compact
+namedtuple structs, calling the model's own validators and root validators.
+Type checks are strict: a value is accepted only when it already has the
+field's type (or is an int for a float field), the case where pydantic would
+pass it through unchanged. Anything else, including every invalid request,
+is handed to pydantic and FastAPI's body handling, so coercions and
+validation errors are exactly those of a regular route.
+
+compile_encoder() turns a response model into a function that coerces a dict
+of response fields as the response model would, and serializes it with orjson.
+"""
+import email.message
+import json
+from collections import namedtuple
+from enum import Enum
+
+import orjson
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Extra
+from pydantic.class_validators import make_generic_validator
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
+from pydantic.fields import SHAPE_DICT, SHAPE_LIST, SHAPE_SINGLETON, ModelField
+
+
+class _Reject(Exception):
+    """The strict path can't vouch for a value; pydantic decides instead."""
+
+
+_MISSING = object()
+
+
+def _check_str(value):
+    if type(value) is not str:
+        raise _Reject
+    return value
+
+
+def _check_int(value):
+    if type(value) is not int:
+        raise _Reject
+    return value
+
+
+def _check_float(value):
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
+    raise _Reject
+
+
+def _check_bool(value):
+    if type(value) is not bool:
+        raise _Reject
+    return value
+
+
+_SCALAR_CHECKS = {str: _check_str, int: _check_int, float: _check_float, bool: _check_bool}
+
+
+def _check_enum(enum):
+    members = enum._value2member_map_
+
+    def check(value):
+        if type(value) is not str or value not in members:
+            raise _Reject
+        return members[value]
+    return check
+
+
+def _compile_type(field, model_checks):
+    """Strict check and conversion for the values of a field, ignoring None."""
+    type_ = field.type_
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        check = _compile_model(type_, model_checks)
+    elif isinstance(type_, type) and issubclass(type_, Enum):
+        check = _check_enum(type_)
+    elif type_ in _SCALAR_CHECKS:
+        check = _SCALAR_CHECKS[type_]
+    else:
+        raise TypeError(f"fast decoding doesn't support fields of type {field.outer_type_!r}")
+
+    if field.shape == SHAPE_SINGLETON:
+        return check
+    if field.shape == SHAPE_LIST and not field.sub_fields[0].allow_none:
+        def check_list(value):
+            if type(value) is not list:
+                raise _Reject
+            return [check(item) for item in value]
+        return check_list
+    raise TypeError(f"fast decoding doesn't support fields of type {field.outer_type_!r}")
+
+
+_STRUCTS = {}
+
+
+def _struct_of(model):
+    """
+    The namedtuple struct of a model's fields.
+
+    Structs are created once per model and published as attributes of this
+    module, so they pickle (e.g. to a scoring worker process) like any
+    module-level class.
+    """
+    struct = _STRUCTS.get(model)
+    if struct is None:
+        name = f"{model.__name__}Struct"
+        if name in globals():
+            name = f"{name}{len(_STRUCTS)}"
+        struct = namedtuple(name, list(model.__fields__), module=__name__)
+        globals()[name] = _STRUCTS[model] = struct
+    return struct
+
+
+def _compile_model(model, model_checks):
+    """Strict decoder of a dict into a namedtuple struct of the model's fields."""
+    if model in model_checks:
+        return model_checks[model]
+    config = model.__config__
+    if (config.extra != Extra.ignore or model.__pre_root_validators__ or config.anystr_strip_whitespace
+            or config.anystr_lower or config.anystr_upper or config.min_anystr_length or config.max_anystr_length):
+        raise TypeError(f"fast decoding doesn't support the configuration of {model.__name__}")
+
+    struct = _struct_of(model)
+    plan = []
+    for name, field in model.__fields__.items():
+        validators = []
+        for validator in field.class_validators.values():
+            if validator.pre or validator.each_item or validator.always:
+                raise TypeError(f"fast decoding doesn't support the validators of {model.__name__}.{name}")
+            validators.append(make_generic_validator(validator.func))
+        plan.append((field.alias, name, field, field.required, field.allow_none, None, validators))
+    root_validators = [validator for _, validator in model.__post_root_validators__]
+
+    def decode(data):
+        if type(data) is not dict:
+            raise _Reject
+        values = {}
+        for alias, name, field, required, allow_none, check, validators in plan:
+            value = data.get(alias, _MISSING)
+            if value is _MISSING:
+                if required:
+                    raise _Reject
+                values[name] = field.get_default()
+                continue
+            if value is None:
+                # pydantic doesn't run (post) validators on None either
+                if not allow_none:
+                    raise _Reject
+                values[name] = None
+                continue
+            value = check(value)
+            for validator in validators:
+                value = validator(model, value, values, field, config)
+            values[name] = value
+        for validator in root_validators:
+            values = validator(model, values)
+        return struct._make(values.values())
+
+    def decode_required(data):
+        # Models with only required, non-nullable fields and no validators, like
+        # the records of a long list, skip the per-field bookkeeping
+        if type(data) is not dict:
+            raise _Reject
+        try:
+            return tuple.__new__(struct, [check(data[alias]) for alias, check in required_checks])
+        except KeyError:
+            raise _Reject from None
+
+    simple = not root_validators and all(required and not allow_none and not validators
+                                         for _, _, _, required, allow_none, _, validators in plan)
+    # Registered before compiling field types, so recursive models terminate
+    model_checks[model] = decode_required if simple else decode
+    plan[:] = [(alias, name, field, required, allow_none, _compile_type(field, model_checks), validators)
+               for alias, name, field, required, allow_none, _, validators in plan]
+    required_checks = [(alias, check) for alias, _, _, _, _, check, _ in plan]
+    return model_checks[model]
+
+
+def _is_json(content_type):
+    """Whether FastAPI would parse a body with this content type as JSON."""
+    if not content_type:
+        return True
+    message = email.message.Message()
+    message["content-type"] = content_type
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
+
+
+def compile_decoder(model):
+    """
+    Compile a decoder of raw request bodies for a pydantic request model.
+
+    Returns:
+        decode(body, content_type): the struct (or, when pydantic had to
+        decide, the model instance) of a valid body; raises
+        RequestValidationError with the errors FastAPI would report otherwise
+    """
+    strict_decode = _compile_model(model, {})
+    body_field = ModelField.infer(name="request", value=..., annotation=model, class_validators={},
+                                  config=model.__config__)
+
+    def decode(body, content_type=None):
+        if body:
+            if _is_json(content_type):
+                try:
+                    data = orjson.loads(body)
+                except orjson.JSONDecodeError:
+                    # orjson is stricter than json (e.g. NaN, huge integers,
+                    # non-UTF-8 encodings); parse like FastAPI does, errors included
+                    try:
+                        data = json.loads(body)
+                    except json.JSONDecodeError as e:
+                        raise RequestValidationError([ErrorWrapper(e, ("body", e.pos))], body=e.doc) from e
+                    except Exception as e:
+                        raise HTTPException(status_code=400, detail="There was an error parsing the body") from e
+                else:
+                    try:
+                        return strict_decode(data)
+                    except (_Reject, ValueError, TypeError, AssertionError):
+                        pass
+            else:
+                data = body
+        else:
+            data = None
+
+        if data is None:
+            raise RequestValidationError([ErrorWrapper(MissingError(), loc=("body",))], body=data)
+        value, errors = body_field.validate(data, {}, loc=("body",))
+        if errors:
+            raise RequestValidationError(errors if isinstance(errors, list) else [errors], body=data)
+        return value
+
+    return decode
+
+
+def _coerce_float(value):
+    return float(value)
+
+
+def _compile_output(field):
+    """Coercion of a response value to the field's type, ignoring None."""
+    if field.type_ is float:
+        coerce = _coerce_float
+    elif field.type_ in (str, int, bool):
+        coerce = field.type_
+    else:
+        raise TypeError(f"fast encoding doesn't support fields of type {field.outer_type_!r}")
+    if field.shape == SHAPE_SINGLETON:
+        return coerce
+    if field.shape == SHAPE_DICT and field.key_field.type_ is str:
+        return lambda value: {key: coerce(item) for key, item in value.items()}
+    raise TypeError(f"fast encoding doesn't support fields of type {field.outer_type_!r}")
+
+
+def compile_encoder(model):
+    """
+    Compile an encoder of response fields for a pydantic response model.
+
+    Returns:
+        encode(fields): JSON bytes of the fields dict, coerced to the model's
+        field types and in its field order, as FastAPI would return them
+    """
+    plan = [(name, field.alias, field.get_default(), _compile_output(field))
+            for name, field in model.__fields__.items()]
+
+    def encode(fields):
+        content = {}
+        for name, alias, default, coerce in plan:
+            value = fields.get(name, default)
+            content[alias] = None if value is None else coerce(value)
+        return orjson.dumps(content)
+
+    return encode
@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, validator, root_validator
 from typing import Optional, List, Dict, Union
 import uvicorn
-import random
+import os
+import time
 from enum import Enum
 from datetime import datetime, date
 
+from amortization import loan_schedule, portfolio_cash_flow
+from application_ids import new_application_id
+from batch_scoring import (
+    applications_to_columns, build_responses, score_applications, score_columns, sweep_scenarios,
+)
+from customer_registry import CustomerFactors, CustomerRegistry
+from dispute_features import DisputeFeatures, extract_dispute_features, features_valid_until
+from fast_codec import compile_decoder, compile_encoder
+from model_registry import ModelRegistry, ShadowScorer
+from risk_simulation import risk_inputs, simulate_default_risk, simulation_chunks
+from scoring_backend import BackendSaturated, InlineBackend, ProcessPoolBackend
+from streaming_stats import DDSketch, LatencyMiddleware, RollingSketches, SharedSketches
+
 app = FastAPI(title="Loan Eligibility API", 
               description="API that accepts customer data and returns a loan eligibility score with recommendations")
 
@@ -127,12 +143,268 @@ class LoanEligibilityResponse(BaseModel):
     max_loan_amount: Optional[float] = None
     suggested_interest_rate: Optional[float] = None
     dispute_impact: Optional[Dict[str, float]] = None
-    application_id: Optional[str] = None  # Would be assigned by the database in production
+    application_id: Optional[str] = None  # Assigned by application_ids
 
 class LoanEligibilityRequest(BaseModel):
     customer: CustomerData
     loan_application: LoanApplicationRequest
 
+# Largest number of scenarios a single sweep may evaluate
+MAX_SCENARIOS = 100_000
+# Most best options a sweep may list
+MAX_TOP_N = 100
+
+class ValueRange(BaseModel):
+    start: float
+    stop: float
+    num: int = 10  # evenly spaced values, both ends included
+    
+    @validator('num')
+    def num_must_be_positive(cls, v):
+        # Capped before values() expands the range; no grid can use more
+        if v <= 0 or v > MAX_SCENARIOS:
+            raise ValueError(f'num must be between 1 and {MAX_SCENARIOS}')
+        return v
+    
+    def values(self) -> List[float]:
+        if self.num == 1:
+            return [self.start]
+        step = (self.stop - self.start) / (self.num - 1)
+        return [self.start + step * i for i in range(self.num)]
+
+class ScenarioSweepRequest(BaseModel):
+    customer: CustomerData
+    loan_amounts: Union[List[float], ValueRange]
+    loan_terms: Union[List[int], ValueRange]  # in months; range values are rounded to whole months
+    loan_types: List[LoanType] = list(LoanType)
+    loan_purposes: List[LoanPurpose]
+    collateral: Optional[CollateralInfo] = None
+    co_applicant: Optional[CoApplicantInfo] = None
+    top_n: int = 5
+    
+    @validator('loan_amounts')
+    def expand_loan_amounts(cls, v):
+        values = v.values() if isinstance(v, ValueRange) else v
+        if any(amount <= 0 for amount in values):
+            raise ValueError('Loan amounts must be greater than zero')
+        return values
+    
+    @validator('loan_terms')
+    def expand_loan_terms(cls, v):
+        values = list(dict.fromkeys(round(term) for term in v.values())) if isinstance(v, ValueRange) else v
+        if any(term <= 0 for term in values):
+            raise ValueError('Loan terms must be greater than zero')
+        return values
+    
+    @validator('top_n')
+    def top_n_range(cls, v):
+        if not 0 <= v <= MAX_TOP_N:
+            raise ValueError(f'top_n must be between 0 and {MAX_TOP_N}')
+        return v
+    
+    @root_validator(skip_on_failure=True)
+    def check_grid_size(cls, values):
+        axes = [values['loan_amounts'], values['loan_terms'], values['loan_types'], values['loan_purposes']]
+        if not all(axes):
+            raise ValueError('Every scenario axis needs at least one value')
+        size = len(axes[0]) * len(axes[1]) * len(axes[2]) * len(axes[3])
+        if size > MAX_SCENARIOS:
+            raise ValueError(f'A sweep may evaluate at most {MAX_SCENARIOS} scenarios, got {size}')
+        return values
+
+class ScenarioOption(BaseModel):
+    loan_amount: float
+    loan_term: int
+    loan_type: LoanType
+    loan_purpose: LoanPurpose
+    eligibility_score: float
+    approval_status: str
+    max_loan_amount: float
+    suggested_interest_rate: float
+
+class ScenarioSweepResponse(BaseModel):
+    loan_amounts: List[float]
+    loan_terms: List[int]
+    loan_types: List[LoanType]
+    loan_purposes: List[LoanPurpose]
+    eligibility_scores: List[List[List[List[float]]]]  # indexed [amount][term][type][purpose]
+    suggested_interest_rates: List[List[List[List[Optional[float]]]]]  # None where denied
+    best_options: List[ScenarioOption]
+    dispute_impact: Dict[str, float]
+
+# Longest loan term a schedule is computed for (100 years)
+MAX_SCHEDULE_MONTHS = 1200
+
+class AmortizationRequest(BaseModel):
+    loan_amount: float
+    loan_term: int  # in months
+    loan_type: LoanType
+    annual_rate: float  # in percent, e.g. a suggested_interest_rate
+    rate_path: Optional[List[float]] = None  # variable loans: annual rates after each reset, the last one holds
+    rate_reset_months: int = 12  # variable loans: months between resets
+    interest_only_months: Optional[int] = None  # interest-only loans; default: the whole term
+    balloon_amortization_months: Optional[int] = None  # balloon loans; default: 360
+    
+    @validator('loan_amount')
+    def loan_amount_must_be_positive(cls, v):
+        if v <= 0:
+            raise ValueError('Loan amount must be greater than zero')
+        return v
+    
+    @validator('loan_term')
+    def loan_term_range(cls, v):
+        if v <= 0 or v > MAX_SCHEDULE_MONTHS:
+            raise ValueError(f'Loan term must be between 1 and {MAX_SCHEDULE_MONTHS} months')
+        return v
+    
+    @validator('annual_rate')
+    def annual_rate_not_negative(cls, v):
+        if v < 0:
+            raise ValueError('Annual rate must not be negative')
+        return v
+    
+    @validator('rate_reset_months')
+    def rate_reset_months_must_be_positive(cls, v):
+        if v <= 0:
+            raise ValueError('Rate reset interval must be greater than zero')
+        return v
+    
+    @root_validator(skip_on_failure=True)
+    def check_loan_type_options(cls, values):
+        loan_type, term = values['loan_type'], values['loan_term']
+        if values['rate_path'] is not None:
+            if loan_type != LoanType.VARIABLE:
+                raise ValueError('A rate path only applies to variable loans')
+            if any(rate < 0 for rate in values['rate_path']):
+                raise ValueError('Rates in the rate path must not be negative')
+        interest_only = values['interest_only_months']
+        if interest_only is not None:
+            if loan_type != LoanType.INTEREST_ONLY:
+                raise ValueError('Interest-only months only apply to interest-only loans')
+            if interest_only < 0 or interest_only > term:
+                raise ValueError('Interest-only months must be between 0 and the loan term')
+        amortization = values['balloon_amortization_months']
+        if amortization is not None:
+            if loan_type != LoanType.BALLOON:
+                raise ValueError('Balloon amortization months only apply to balloon loans')
+            if amortization < term:
+                raise ValueError('Balloon amortization months must be at least the loan term')
+        return values
+
+class AmortizationResponse(BaseModel):
+    loan_type: LoanType
+    months: List[int]
+    payments: List[float]
+    principal: List[float]
+    interest: List[float]
+    balances: List[float]  # at the end of each month
+    annual_rates: List[float]
+    total_paid: float
+    total_interest: float
+
+# Most loans a portfolio cash flow may combine
+MAX_PORTFOLIO_LOANS = 10_000
+
+class PortfolioLoan(AmortizationRequest):
+    start_month: int = 0  # months before the loan's first month, relative to the portfolio's first month
+    
+    @validator('start_month')
+    def start_month_in_range(cls, v):
+        # Keeps the portfolio horizon within twice the longest schedule
+        if v < 0 or v > MAX_SCHEDULE_MONTHS:
+            raise ValueError(f'Start month must be between 0 and {MAX_SCHEDULE_MONTHS}')
+        return v
+
+class PortfolioCashFlowRequest(BaseModel):
+    loans: List[PortfolioLoan]
+    
+    @validator('loans')
+    def loans_within_limit(cls, v):
+        if len(v) > MAX_PORTFOLIO_LOANS:
+            raise ValueError(f'A portfolio may have at most {MAX_PORTFOLIO_LOANS} loans')
+        return v
+
+class PortfolioCashFlowResponse(BaseModel):
+    months: List[int]
+    payments: List[float]
+    principal: List[float]
+    interest: List[float]
+    balances: List[float]  # outstanding at the end of each month
+    active_loans: List[int]
+    total_paid: float
+    total_interest: float
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+# Most paths a risk simulation may run per application
+MAX_SIMULATION_PATHS = 100_000
+# Longest time budget a risk simulation request may ask for
+MAX_SIMULATION_TIME_BUDGET_MS = _env_int('SIMULATION_MAX_TIME_BUDGET_MS') or 60_000
+# Fewest applications per chunk when a simulation is split across workers
+SIMULATION_CHUNK_SIZE = 8
+
+class SimulationOptions(BaseModel):
+    paths: int = 10_000  # per application
+    seed: Optional[int] = None  # results are reproducible unless the time budget cuts them short
+    time_budget_ms: int = 500  # for the whole request; applications not started by then are not simulated
+    
+    @validator('paths')
+    def paths_range(cls, v):
+        if v <= 0 or v > MAX_SIMULATION_PATHS:
+            raise ValueError(f'Paths must be between 1 and {MAX_SIMULATION_PATHS}')
+        return v
+    
+    @validator('seed')
+    def seed_not_negative(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('Seed must not be negative')
+        return v
+    
+    @validator('time_budget_ms')
+    def time_budget_range(cls, v):
+        if v <= 0 or v > MAX_SIMULATION_TIME_BUDGET_MS:
+            raise ValueError(f'Time budget must be between 1 and {MAX_SIMULATION_TIME_BUDGET_MS} ms')
+        return v
+
+def check_simulated_term(application: LoanEligibilityRequest):
+    # Simulations schedule the loan over its whole term, so it is capped like amortization schedules
+    if application.loan_application.loan_term > MAX_SCHEDULE_MONTHS:
+        raise ValueError(f'Loan term must be at most {MAX_SCHEDULE_MONTHS} months to simulate')
+
+class RiskSimulationRequest(BaseModel):
+    application: LoanEligibilityRequest
+    simulation: SimulationOptions = SimulationOptions()
+    
+    @validator('application')
+    def loan_term_simulable(cls, v):
+        check_simulated_term(v)
+        return v
+
+class BatchRiskSimulationRequest(BaseModel):
+    applications: List[LoanEligibilityRequest]
+    simulation: SimulationOptions = SimulationOptions()
+    
+    @validator('applications', each_item=True)
+    def loan_terms_simulable(cls, v):
+        check_simulated_term(v)
+        return v
+
+class RiskSimulationResult(BaseModel):
+    paths: int  # simulated; fewer than requested when truncated by the time budget
+    truncated: bool
+    # The estimates are None when the time budget ran out before the application started
+    probability_of_default: Optional[float]  # over the loan term
+    probability_of_default_band: Optional[List[float]]  # 90% interval
+    expected_loss: Optional[float]
+    expected_loss_rate: Optional[float]  # expected loss as a share of the loan amount
+    loss_percentiles: Optional[Dict[str, float]]  # p50, p90, p95 and p99 of the simulated loss
+
+class RiskSimulationResponse(BaseModel):
+    eligibility: LoanEligibilityResponse
+    risk: RiskSimulationResult
+
 @app.post("/loan-eligibility", response_model=LoanEligibilityResponse)
 async def calculate_loan_eligibility(request: LoanEligibilityRequest):
     """
@@ -149,39 +421,151 @@ async def calculate_loan_eligibility(request: LoanEligibilityRequest):
         else:
             request.customer.debt_to_income_ratio = 0.0
     
-    # Calculate eligibility score
-    score, dispute_impact = calculate_eligibility_score(request.customer, request.loan_application)
-    
-    # Generate recommendation and approval status
-    result = generate_recommendation(score, request.customer, request.loan_application)
-    
-    # Add dispute impact information
-    result.dispute_impact = dispute_impact
-    
-    # Generate a mock application ID (in a real system, this would be from the database)
-    result.application_id = f"LOAN-{random.randint(10000, 99999)}"
-    
-    return result
+    # Score on the scoring backend, off the event loop
+    return LoanEligibilityResponse(**await score_application(request.customer, request.loan_application))
+
+decode_eligibility_request = compile_decoder(LoanEligibilityRequest)
+encode_eligibility_response = compile_encoder(LoanEligibilityResponse)
 
-def calculate_eligibility_score(customer: CustomerData, loan_application: LoanApplicationRequest) -> tuple:
+@app.post("/loan-eligibility/fast", response_model=LoanEligibilityResponse, openapi_extra={
+    "requestBody": {
+        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/LoanEligibilityRequest"}}},
+        "required": True,
+    },
+})
+async def calculate_loan_eligibility_fast(request: Request):
     """
-    Calculate eligibility score based on AI logic
+    Calculate loan eligibility score, like /loan-eligibility but with faster decoding and encoding
+
+    The body is parsed with orjson and checked into compact structs by
+    precompiled validation rules; the response is encoded with orjson.
+    Validation errors and results are the same as /loan-eligibility.
+    """
+    eligibility_request = decode_eligibility_request(await request.body(), request.headers.get("content-type"))
+    customer, loan_application = eligibility_request.customer, eligibility_request.loan_application
+    if customer.customer_id != loan_application.customer_id:
+        raise HTTPException(status_code=400, detail="Customer ID mismatch between customer and loan application")
     
-    This is a model that weighs different factors:
-    - Credit score: 30%
-    - Income to loan amount ratio: 20%
-    - Employment stability: 15%
-    - Debt to income ratio: 15%
-    - Previous loan history: 10%
-    - Dispute history: 10%
+    result = await score_application(customer, loan_application)
+    return Response(encode_eligibility_response(result), media_type="application/json")
+
+@app.post("/loan-eligibility/batch", response_model=List[LoanEligibilityResponse])
+def calculate_loan_eligibility_batch(requests: List[LoanEligibilityRequest]):
+    """
+    Calculate loan eligibility for many applications at once
+
+    Scores match /loan-eligibility for each application; factors are computed
+    with vector operations over the whole batch. Declared without async so the
+    scoring runs in the threadpool instead of blocking the event loop.
+    """
+    for index, request in enumerate(requests):
+        if request.customer.customer_id != request.loan_application.customer_id:
+            raise HTTPException(status_code=400,
+                                detail=f"Customer ID mismatch between customer and loan application at index {index}")
+
+    results = score_applications(requests, scorer=model_registry.production.score_columns)
+    record_scores([request.loan_application for request in requests], results)
+    return results
+
+@app.post("/loan-eligibility/scenarios", response_model=ScenarioSweepResponse)
+def sweep_loan_scenarios(request: ScenarioSweepRequest):
     """
+    Evaluate one customer over a grid of loan amounts, terms, types and purposes
+
+    Every combination is scored as /loan-eligibility would score it, in one
+    vectorized pass; the best approved options are listed first by approval
+    status, then by largest amount, then by lowest rate.
+    """
+    result = sweep_scenarios(request.customer, request.loan_amounts, request.loan_terms, request.loan_types,
+                             request.loan_purposes, request.co_applicant, request.collateral, request.top_n,
+                             scorer=model_registry.production.score_columns)
+    # The surfaces hold one value per scenario; validating and re-encoding them
+    # through the response model would take several times longer than scoring
+    return JSONResponse(result)
+
+def simulate_applications(requests: List[LoanEligibilityRequest], options: SimulationOptions) -> List[dict]:
+    """
+    Score applications and simulate their default risk
+
+    Scores come from the vectorized batch scorer; the simulation is split into
+    chunks of applications run in parallel on the simulation backend.
+    """
+    for index, request in enumerate(requests):
+        if request.customer.customer_id != request.loan_application.customer_id:
+            raise HTTPException(status_code=400,
+                                detail=f"Customer ID mismatch between customer and loan application at index {index}")
+    if not requests:
+        return []
+    deadline = time.time() + options.time_budget_ms / 1000
+    columns = applications_to_columns(requests)
+    scores = model_registry.production.score_columns(columns)
+    chunk_size = max(SIMULATION_CHUNK_SIZE, -(-len(requests) // simulation_backend.workers))
+    futures = []
+    try:
+        for inputs, seeds in simulation_chunks(risk_inputs(columns, scores), options.seed, chunk_size):
+            futures.append(simulation_backend.submit(simulate_default_risk, inputs, seeds, options.paths, deadline))
+    except BackendSaturated:
+        # Don't run the chunks already queued for a request that fails
+        for future in futures:
+            future.cancel()
+        raise
+    risks = [risk for future in futures for risk in future.result()]
+    eligibilities = build_responses(requests, columns, scores)
+    record_scores([request.loan_application for request in requests], eligibilities)
+    return [{"eligibility": eligibility, "risk": risk} for eligibility, risk in zip(eligibilities, risks)]
+
+@app.post("/loan-eligibility/risk", response_model=RiskSimulationResponse)
+def simulate_loan_risk(request: RiskSimulationRequest):
+    """
+    Calculate loan eligibility together with a Monte Carlo view of default risk
+
+    Income, existing debt service and (for variable loans) the rate path are
+    perturbed over thousands of paths of the loan term; the response adds the
+    probability of default with a 90% band, and the expected loss with
+    percentiles of the simulated loss.
+    """
+    return simulate_applications([request.application], request.simulation)[0]
+
+@app.post("/loan-eligibility/risk/batch", response_model=List[RiskSimulationResponse])
+def simulate_loan_risk_batch(request: BatchRiskSimulationRequest):
+    """
+    Calculate eligibility and simulated default risk for many applications at once
+
+    The time budget applies to the whole batch, which is split across the
+    simulation backend's workers.
+    """
+    return simulate_applications(request.applications, request.simulation)
+
+@app.post("/amortization-schedule", response_model=AmortizationResponse)
+def amortization_schedule(request: AmortizationRequest):
+    """
+    Monthly amortization schedule of a fixed, variable, interest-only or balloon loan
+
+    All months are computed in one vectorized pass. Variable loans follow
+    rate_path, recomputing the installment at every reset; the last month of
+    interest-only and balloon loans pays the remaining principal.
+    """
+    return JSONResponse(loan_schedule(request.loan_amount, request.loan_term, request.loan_type.value,
+                                      request.annual_rate, request.rate_path, request.rate_reset_months,
+                                      request.interest_only_months, request.balloon_amortization_months))
+
+@app.post("/portfolio/cash-flow", response_model=PortfolioCashFlowResponse)
+def calculate_portfolio_cash_flow(request: PortfolioCashFlowRequest):
+    """
+    Expected monthly cash flow across many approved loans, assuming scheduled repayment
+
+    Loans are scheduled together as arrays of loans x months and summed per
+    portfolio month, each loan shifted by its start_month.
+    """
+    return JSONResponse(portfolio_cash_flow(request.loans))
+
+def calculate_customer_factors(customer: CustomerData, dispute_features: DisputeFeatures,
+                               valid_until: Optional[datetime] = None) -> CustomerFactors:
+    """Calculate the parts of the eligibility score that depend only on the customer"""
+    
     # Credit score factor (30% of total)
     credit_factor = (customer.credit_score - 300) / 550 * 30  # Normalized to 0-30 range
     
-    # Income to loan ratio factor (20% of total)
-    income_loan_ratio = min(customer.income / (loan_application.loan_amount or 1), 10) / 10
-    income_factor = income_loan_ratio * 20
-    
     # Employment stability factor (15% of total)
     employment_factor = 0
     if customer.employment_status in [EmploymentStatus.EMPLOYED, EmploymentStatus.SELF_EMPLOYED]:
@@ -197,7 +581,39 @@ def calculate_eligibility_score(customer: CustomerData, loan_application: LoanAp
     history_factor = 10 - (min(customer.previous_defaults, 5) * 2)  # Each default reduces score, max 5 defaults
     
     # Dispute history factor (10% of total)
-    dispute_factor, dispute_impact = calculate_dispute_factor(customer.dispute_history)
+    dispute_factor, _ = calculate_dispute_factor(dispute_features)
+    
+    return CustomerFactors(credit_factor, employment_factor, dti_factor, history_factor, dispute_factor,
+                           dispute_features, valid_until)
+
+def calculate_eligibility_score(customer: CustomerData, loan_application: LoanApplicationRequest,
+                                dispute_features: Optional[DisputeFeatures] = None,
+                                customer_factors: Optional[CustomerFactors] = None) -> tuple:
+    """
+    Calculate eligibility score based on AI logic
+    
+    This is a model that weighs different factors:
+    - Credit score: 30%
+    - Income to loan amount ratio: 20%
+    - Employment stability: 15%
+    - Debt to income ratio: 15%
+    - Previous loan history: 10%
+    - Dispute history: 10%
+    
+    The customer-only parts are taken from customer_factors (e.g. precomputed by
+    the customer registry) if given; dispute_features are extracted from the
+    customer's dispute history if not given either.
+    """
+    if customer_factors is None:
+        if dispute_features is None:
+            dispute_features = extract_dispute_features(customer.dispute_history)
+        customer_factors = calculate_customer_factors(customer, dispute_features)
+    credit_factor, employment_factor, dti_factor, history_factor, dispute_factor, dispute_features, _ = customer_factors
+    dispute_impact = dispute_impact_of(dispute_factor, dispute_features)
+    
+    # Income to loan ratio factor (20% of total)
+    income_loan_ratio = min(customer.income / (loan_application.loan_amount or 1), 10) / 10
+    income_factor = income_loan_ratio * 20
     
     # Calculate total score (0-100)
     total_score = credit_factor + income_factor + employment_factor + dti_factor + history_factor + dispute_factor
@@ -262,42 +678,17 @@ def calculate_collateral_factor(collateral: CollateralInfo, loan_amount: float)
     # Cap the adjustment
     return min(factor, 1.1)
 
-def calculate_dispute_factor(dispute_history: List[DisputeRecord]) -> tuple:
+def calculate_dispute_factor(dispute_features: DisputeFeatures) -> tuple:
     """Calculate the impact of dispute history on eligibility score"""
     
-    if not dispute_history:
-        return 10.0, {"dispute_score": 10.0, "total_disputes": 0, "recent_disputes": 0, "rejected_disputes": 0}
+    total_disputes, recent_disputes, rejected_disputes, _ = dispute_features
+    if not total_disputes:
+        return 10.0, dispute_impact_of(10.0, dispute_features)
     
     # Start with maximum score
     max_score = 10.0
     current_score = max_score
     
-    # Count types of disputes
-    total_disputes = len(dispute_history)
-    recent_disputes = 0
-    rejected_disputes = 0
-    
-    # Check for recent disputes (within last 12 months)
-    current_date = datetime.now()
-    
-    for dispute in dispute_history:
-        try:
-            # Try to parse the submission date
-            dispute_date = datetime.fromisoformat(dispute.submission_date.replace('Z', '+00:00'))
-            
-            # Check if dispute is recent (within last 12 months)
-            days_difference = (current_date - dispute_date).days
-            if days_difference <= 365:
-                recent_disputes += 1
-            
-            # Check dispute status
-            if dispute.status == DisputeStatus.REJECTED:
-                rejected_disputes += 1
-                
-        except (ValueError, TypeError):
-            # If date parsing fails, continue to next dispute
-            continue
-    
     # Calculate penalty based on number and recency of disputes
     # Each dispute reduces score, with higher impact for recent and rejected disputes
     
@@ -320,17 +711,25 @@ def calculate_dispute_factor(dispute_history: List[DisputeRecord]) -> tuple:
     current_score = max(current_score, 0)
     
     # Return the dispute factor and details about the impact
-    impact = {
-        "dispute_score": round(current_score, 1),
-        "total_disputes": total_disputes,
-        "recent_disputes": recent_disputes,
-        "rejected_disputes": rejected_disputes
+    return current_score, dispute_impact_of(current_score, dispute_features)
+
+def dispute_impact_of(dispute_factor: float, dispute_features: DisputeFeatures) -> Dict[str, float]:
+    """Details about the impact of dispute history, as returned in dispute_impact"""
+    return {
+        "dispute_score": round(dispute_factor, 1),
+        "total_disputes": dispute_features.total_disputes,
+        "recent_disputes": dispute_features.recent_disputes,
+        "rejected_disputes": dispute_features.rejected_disputes
     }
-    
-    return current_score, impact
 
-def generate_recommendation(score: float, customer: CustomerData, loan_application: LoanApplicationRequest) -> LoanEligibilityResponse:
+def generate_recommendation(score: float, customer: CustomerData, loan_application: LoanApplicationRequest,
+                            dispute_features: Optional[DisputeFeatures] = None) -> LoanEligibilityResponse:
     """Generate human-readable recommendation based on eligibility score"""
+    return LoanEligibilityResponse(**recommendation_fields(score, customer, loan_application, dispute_features))
+
+def recommendation_fields(score: float, customer: CustomerData, loan_application: LoanApplicationRequest,
+                          dispute_features: Optional[DisputeFeatures] = None) -> dict:
+    """Fields of the LoanEligibilityResponse generate_recommendation returns, as a dict"""
     
     # Calculate maximum loan amount based on income and credit score
     income_based_limit = customer.income * 5  # Up to 5x annual income
@@ -359,11 +758,11 @@ def generate_recommendation(score: float, customer: CustomerData, loan_applicati
     interest_rate = round(base_rate + risk_adjustment + credit_adjustment, 2)
     
     # Add dispute history impact to recommendation
+    if dispute_features is None:
+        dispute_features = extract_dispute_features(customer.dispute_history)
     dispute_message = ""
-    if customer.dispute_history and len(customer.dispute_history) > 0:
-        recent_disputes = sum(1 for d in customer.dispute_history if datetime.now().timestamp() - datetime.fromisoformat(d.submission_date.replace('Z', '+00:00')).timestamp() < 86400 * 365)
-        if recent_disputes > 0:
-            dispute_message = f" Your recent dispute history ({recent_disputes} in the past year) is affecting your eligibility."
+    if dispute_features.past_year_disputes > 0:
+        dispute_message = f" Your recent dispute history ({dispute_features.past_year_disputes} in the past year) is affecting your eligibility."
     
     if score >= 80:
         approval_status = "Approved"
@@ -381,7 +780,7 @@ def generate_recommendation(score: float, customer: CustomerData, loan_applicati
         else:
             recommendation = f"Your application does not meet our current lending criteria. Major factors include credit score ({customer.credit_score}), debt-to-income ratio ({customer.debt_to_income_ratio:.2%}), and loan amount (${loan_application.loan_amount:,.2f}).{dispute_message}"
     
-    return LoanEligibilityResponse(
+    return dict(
         eligibility_score=score,
         recommendation=recommendation,
         approval_status=approval_status,
@@ -389,6 +788,227 @@ def generate_recommendation(score: float, customer: CustomerData, loan_applicati
         suggested_interest_rate=interest_rate if score >= 60 else None
     )
 
+def compute_registered_factors(customer: CustomerData, now: datetime) -> CustomerFactors:
+    """Customer factors for the registry, valid until the dispute features next change"""
+    return calculate_customer_factors(customer, extract_dispute_features(customer.dispute_history, now),
+                                      features_valid_until(customer.dispute_history, now))
+
+customer_registry = CustomerRegistry(
+    os.environ.get('CUSTOMER_REGISTRY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'customer_registry.db')),
+    CustomerData.parse_raw,
+    compute_registered_factors,
+    cache_size=int(os.environ.get('CUSTOMER_REGISTRY_CACHE_SIZE', 10000)),
+)
+
+@app.put("/customers/{customer_id}", response_model=CustomerData)
+def register_customer(customer_id: str, customer: CustomerData):
+    """
+    Register or update a customer profile
+
+    The profile is validated and stored with its customer-only score factors
+    precomputed; updating it recomputes them.
+    """
+    if customer.customer_id != customer_id:
+        raise HTTPException(status_code=400, detail="Customer ID mismatch between path and profile")
+    customer_registry.put(customer)
+    return customer
+
+@app.get("/customers/{customer_id}", response_model=CustomerData)
+def get_customer(customer_id: str):
+    entry = customer_registry.get(customer_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Customer not registered")
+    return entry[0]
+
+@app.delete("/customers/{customer_id}", status_code=204)
+def delete_customer(customer_id: str):
+    if not customer_registry.delete(customer_id):
+        raise HTTPException(status_code=404, detail="Customer not registered")
+    return Response(status_code=204)
+
+@app.post("/customers/{customer_id}/loan-eligibility", response_model=LoanEligibilityResponse)
+async def calculate_registered_loan_eligibility(customer_id: str, loan_application: LoanApplicationRequest):
+    """
+    Calculate loan eligibility for a registered customer from the loan application alone
+
+    Scores are the same as /loan-eligibility with the registered profile.
+    Every lookup queries SQLite (a cached profile is checked against its
+    stored version) and may refresh stale factors, so it runs in the
+    threadpool rather than on the event loop; scoring runs on the scoring
+    backend.
+    """
+    if loan_application.customer_id != customer_id:
+        raise HTTPException(status_code=400, detail="Customer ID mismatch between path and loan application")
+    entry = await run_in_threadpool(customer_registry.get, customer_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Customer not registered")
+    customer, factors = entry
+    
+    return LoanEligibilityResponse(**await score_application(customer, loan_application, factors))
+
+def evaluate_application(customer: CustomerData, loan_application: LoanApplicationRequest,
+                         customer_factors: Optional[CustomerFactors] = None) -> dict:
+    """
+    Score an application into the LoanEligibilityResponse fields other than application_id
+
+    This is the unit of work of the scoring backend, so it must stay a
+    module-level function of picklable arguments.
+    """
+    # Walk the dispute history once; the score and the recommendation share the result
+    if customer_factors is not None:
+        dispute_features = customer_factors.dispute_features
+    else:
+        dispute_features = extract_dispute_features(customer.dispute_history)
+    score, dispute_impact = calculate_eligibility_score(customer, loan_application, dispute_features, customer_factors)
+    result = recommendation_fields(score, customer, loan_application, dispute_features)
+    result["dispute_impact"] = dispute_impact
+    return result
+
+if os.environ.get('SCORING_BACKEND', 'process') == 'inline':
+    scoring_backend = InlineBackend()
+    simulation_backend = InlineBackend()
+else:
+    scoring_backend = ProcessPoolBackend(
+        workers=_env_int('SCORING_WORKERS'),
+        max_in_flight=_env_int('SCORING_MAX_IN_FLIGHT'),
+        max_queue_depth=_env_int('SCORING_MAX_QUEUE_DEPTH'),
+    )
+    # A pool of its own, so long simulations never hold the slots that scoring requests need
+    simulation_backend = ProcessPoolBackend(
+        workers=_env_int('SIMULATION_WORKERS'),
+        max_queue_depth=_env_int('SIMULATION_MAX_QUEUE_DEPTH'),
+    )
+
+# Scoring models by version. Register a candidate with
+# model_registry.register("<version>", <module-level function like evaluate_application>),
+# then compare it on live traffic with SHADOW_MODEL. To serve it with SCORING_MODEL,
+# also pass its vectorized form as score_columns, for the batch, scenario and risk endpoints.
+model_registry = ModelRegistry()
+model_registry.register("v1", evaluate_application, score_columns=score_columns)
+if os.environ.get('SCORING_MODEL'):
+    model_registry.set_production(os.environ['SCORING_MODEL'])
+model_registry.set_shadow(os.environ.get('SHADOW_MODEL'))
+
+shadow_scorer = ShadowScorer(
+    # A pool of its own, at the lowest CPU priority, so shadow scoring never takes capacity from production
+    ProcessPoolBackend(workers=_env_int('SHADOW_WORKERS') or 1, max_queue_depth=_env_int('SHADOW_MAX_QUEUE_DEPTH'),
+                       niceness=19),
+    os.environ.get('SHADOW_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shadow_scores.jsonl')),
+)
+
+# Streaming sketches of eligibility scores (by approval status and loan purpose) and
+# request latencies (by route), kept in one-minute slots for an hour
+stats_sketches = RollingSketches(slot_seconds=60, slots=60)
+STATS_WINDOWS = (60, 900, 3600)
+app.add_middleware(LatencyMiddleware, sketches=stats_sketches, routes=app.routes)
+
+# Workers sharing a directory publish their sketches there, and /stats merges them
+shared_sketches = (
+    SharedSketches(stats_sketches, os.environ['STATS_SHARED_DIR'], _env_int('STATS_SHARE_SECONDS') or 10)
+    if os.environ.get('STATS_SHARED_DIR') else None
+)
+
+async def score_application(customer: CustomerData, loan_application: LoanApplicationRequest,
+                            customer_factors: Optional[CustomerFactors] = None) -> dict:
+    """
+    Score an application with the production model, and start the shadow model on it if there is one
+
+    Returns the LoanEligibilityResponse fields. The shadow model scores the
+    application from scratch (without customer_factors) after the response
+    is ready, without the request waiting for it.
+    """
+    production = model_registry.production
+    result = await scoring_backend.run(production.score, customer, loan_application, customer_factors)
+    
+    # Time-ordered and unique across workers, without a database round trip
+    result["application_id"] = new_application_id()
+    
+    shadow = model_registry.shadow
+    if shadow is not None:
+        shadow_scorer.submit(shadow, (customer, loan_application), production.version, result,
+                             {"application_id": result["application_id"], "customer_id": customer.customer_id})
+    stats_sketches.add("eligibility_score", (result["approval_status"], loan_application.loan_purpose.value),
+                       result["eligibility_score"])
+    return result
+
+def record_scores(loan_applications: List[LoanApplicationRequest], results: List[dict]):
+    """Record the eligibility scores of a batch by approval status and loan purpose"""
+    scores_by_labels = {}
+    for loan_application, result in zip(loan_applications, results):
+        labels = (result["approval_status"], loan_application.loan_purpose.value)
+        scores_by_labels.setdefault(labels, []).append(result["eligibility_score"])
+    stats_sketches.add_many("eligibility_score", scores_by_labels)
+
+@app.exception_handler(BackendSaturated)
+async def scoring_backend_saturated(request: Request, exc: BackendSaturated):
+    return JSONResponse(status_code=503, content={"detail": "Scoring capacity exhausted, retry shortly"},
+                        headers={"Retry-After": "1"})
+
+@app.on_event("startup")
+def start_sketch_sharing():
+    if shared_sketches is not None:
+        shared_sketches.start()
+
+@app.on_event("shutdown")
+def shutdown_scoring_backend():
+    scoring_backend.shutdown()
+    simulation_backend.shutdown()
+    shadow_scorer.close()
+    if shared_sketches is not None:
+        shared_sketches.close()
+
+@app.get("/models")
+async def get_models():
+    """Registered scoring model versions, and the ones in production and in shadow"""
+    shadow = model_registry.shadow
+    return {"versions": model_registry.versions(), "production": model_registry.production.version,
+            "shadow": shadow.version if shadow else None}
+
+def summarize_window(sketches: RollingSketches, seconds: int) -> dict:
+    """Score and latency distributions over the last `seconds`, with the approval status mix"""
+    by_status, by_purpose, by_status_and_purpose, latency = {}, {}, {}, {}
+    overall = None
+    for (metric, labels), sketch in sorted(sketches.window(seconds).items()):
+        if metric == "latency_ms":
+            latency[labels[0]] = sketch.summary()
+            continue
+        status, purpose = labels
+        by_status_and_purpose.setdefault(status, {})[purpose] = sketch.summary()
+        for groups, key in ((by_status, status), (by_purpose, purpose)):
+            groups.setdefault(key, DDSketch(sketch.relative_accuracy, sketch.max_buckets)).merge(sketch)
+        if overall is None:
+            overall = DDSketch(sketch.relative_accuracy, sketch.max_buckets)
+        overall.merge(sketch)
+    total = overall.count if overall else 0
+    return {
+        "eligibility_score": {
+            "all": overall.summary() if overall else {"count": 0},
+            "by_approval_status": {status: sketch.summary() for status, sketch in by_status.items()},
+            "by_loan_purpose": {purpose: sketch.summary() for purpose, sketch in by_purpose.items()},
+            "by_approval_status_and_loan_purpose": by_status_and_purpose,
+        },
+        "approval_status_mix": {status: round(sketch.count / total, 4) for status, sketch in by_status.items()},
+        "latency_ms": latency,
+    }
+
+@app.get("/stats")
+def get_stats(window: Optional[List[int]] = Query(None, gt=0)):
+    """
+    Scoring backend load and timings (queue wait versus compute), shadow scoring and customer cache counters,
+    and score and latency distributions over rolling windows
+
+    Pass window (in seconds, repeatable) to choose the windows; the default
+    is the last minute, 15 minutes and hour. With STATS_SHARED_DIR set, the
+    distributions cover every worker sharing the directory.
+    """
+    sketches = shared_sketches.merged() if shared_sketches is not None else stats_sketches
+    windows = window or STATS_WINDOWS
+    return {"scoring_backend": scoring_backend.stats(), "simulation_backend": simulation_backend.stats(),
+            "shadow_scoring": shadow_scorer.stats(),
+            "customer_registry": customer_registry.stats(),
+            "distributions": {f"{seconds}s": dict(summarize_window(sketches, seconds), window_seconds=seconds)
+                              for seconds in windows}}
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Loan Eligibility API. Use /docs to see the API documentation."}
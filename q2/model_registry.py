@@ -0,0 +1,178 @@
+"""
+Versioned scoring models, and shadow scoring of a candidate model.
+
+A model is a function scoring one application into the fields of a
+LoanEligibilityResponse, model(customer, loan_application, customer_factors=None).
+The registry names models by version and tells which one serves production
+and which one, if any, runs in shadow. The batch, scenario and risk endpoints
+score many applications at once, so a model serving production also needs a
+vectorized form scoring NumPy columns, like batch_scoring.score_columns.
+
+A ShadowScorer runs the shadow model on its own backend after the production
+result is known, without the request waiting for it, and appends both
+results to a JSON lines file for offline comparison. When its backend is
+saturated, shadow calls are dropped rather than queued.
+"""
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+
+from scoring_backend import BackendSaturated
+
+# Result fields written to the shadow log
+LOGGED_FIELDS = ("eligibility_score", "approval_status", "max_loan_amount", "suggested_interest_rate")
+
+
+class Model(NamedTuple):
+    version: str
+    score: Callable
+    # The same model over columns of applications, score_columns(columns), or None
+    score_columns: Optional[Callable] = None
+
+
+class ModelRegistry:
+    """Scoring models by version, with a production model and an optional shadow model."""
+
+    def __init__(self):
+        self._models = {}
+        self.production = None
+        self.shadow = None
+
+    def register(self, version, score, production=False, score_columns=None):
+        """
+        Register a model.
+
+        Args:
+            version: Unique version name
+            score: Module-level scoring function (it may run in a worker process)
+            production: Serve it in production (the first model registered is served by default)
+            score_columns: Vectorized form of score, required to serve production
+        """
+        if version in self._models:
+            raise ValueError(f"Model version {version!r} is already registered")
+        self._models[version] = Model(version, score, score_columns)
+        if production or self.production is None:
+            self.set_production(version)
+        return score
+
+    def get(self, version):
+        """Return the model of a version. Raises ValueError if unknown."""
+        try:
+            return self._models[version]
+        except KeyError:
+            raise ValueError(f"Unknown model version {version!r}; registered versions: "
+                             f"{', '.join(self._models)}") from None
+
+    def set_production(self, version):
+        """Serve a version in production. Raises ValueError if it has no vectorized form."""
+        model = self.get(version)
+        if model.score_columns is None:
+            raise ValueError(f"Model version {version!r} can't serve production: the batch, scenario and risk "
+                             "endpoints need its score_columns")
+        self.production = model
+
+    def set_shadow(self, version):
+        """Run a version in shadow, or stop shadow scoring with None."""
+        self.shadow = self.get(version) if version else None
+
+    def versions(self):
+        return list(self._models)
+
+
+class ShadowScorer:
+    """Runs shadow models on a dedicated backend and logs them next to production."""
+
+    def __init__(self, backend, log_path):
+        """
+        Initialize the shadow scorer.
+
+        Args:
+            backend: ScoringBackend shadow calls run on; its limits decide
+                when shadow calls are shed
+            log_path: JSON lines file records are appended to
+        """
+        self.backend = backend
+        self.log_path = log_path
+        self.submitted = 0
+        self.shed = 0
+        self.failed = 0
+        self.logged = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._logged = threading.Condition(self._lock)
+        self._log = None
+
+    def submit(self, model, args, production_version, production_result, context):
+        """
+        Start scoring args with a shadow model, logging it against the production result.
+
+        Returns immediately; returns False if the call was shed.
+
+        Args:
+            model: Shadow Model
+            args: Arguments of the model
+            production_version: Version that produced production_result
+            production_result: Response fields returned to the client
+            context: Fields identifying the request in the log (e.g. application_id)
+        """
+        try:
+            future = self.backend.submit(model.score, *args)
+        except BackendSaturated:
+            with self._lock:
+                self.shed += 1
+            return False
+        production = dict(version=production_version, **{name: production_result.get(name) for name in LOGGED_FIELDS})
+        with self._lock:
+            self.submitted += 1
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._record(done, model.version, production, context))
+        return True
+
+    def _record(self, future, version, production, context):
+        try:
+            result = future.result()
+            shadow = dict(version=version, **{name: result.get(name) for name in LOGGED_FIELDS})
+        except Exception as e:
+            shadow = {"version": version, "error": f"{type(e).__name__}: {e}"}
+        record = dict(logged_at=datetime.now(timezone.utc).isoformat(), **context, production=production,
+                      shadow=shadow)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            try:
+                if self._log is None:
+                    self._log = open(self.log_path, "a", encoding="utf-8")
+                self._log.write(line)
+                self._log.flush()
+                if "error" in shadow:
+                    self.failed += 1
+                else:
+                    self.logged += 1
+            finally:
+                self._pending.discard(future)
+                self._logged.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the shadow calls started so far are logged. Returns whether they are."""
+        with self._logged:
+            pending = set(self._pending)
+            return self._logged.wait_for(lambda: not pending & self._pending, timeout)
+
+    def close(self):
+        self.flush()
+        self.backend.shutdown()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "shed": self.shed,
+                "logged": self.logged,
+                "failed": self.failed,
+                "pending": len(self._pending),
+                "log_path": str(self.log_path),
+            }
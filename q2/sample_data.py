@@ -0,0 +1,106 @@
+"""
+Sample data shared by the tests and the benchmarks.
+
+random_application builds random eligibility requests, and check_unique_ids
+generates application IDs across forked processes and threads and checks
+that none repeats.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import application_ids
+
+
+def random_application(rng, customer_id="CUST1"):
+    """A random eligibility request as a JSON-compatible dict."""
+    today = datetime.now()
+    disputes = [
+        {
+            "dispute_id": f"DSP{i}",
+            "description": "Disputed charge",
+            # Half a day off whole days, so recency can't flip between two runs
+            "submission_date": (today - timedelta(days=rng.randint(0, 900) + 0.5)).isoformat(),
+            "status": rng.choice(["resolved", "pending", "rejected"]),
+        }
+        for i in range(rng.choice([0, 0, 1, 2, 5, 12]))
+    ]
+    application = {
+        "customer": {
+            "customer_id": customer_id,
+            "name": "Test Customer",
+            "email": "test@example.com",
+            "income": rng.uniform(10_000, 250_000),
+            "credit_score": rng.randint(300, 850),
+            "employment_status": rng.choice(["employed", "self_employed", "unemployed", "retired", "student"]),
+            "employment_duration": rng.randint(0, 120),
+            "total_debts": rng.uniform(0, 10_000),
+            "previous_defaults": rng.choice([0, 0, 1, 3, 7]),
+            "dispute_history": disputes,
+        },
+        "loan_application": {
+            "loan_amount": rng.uniform(1_000, 800_000),
+            "loan_type": rng.choice(["fixed", "variable", "interest_only", "balloon"]),
+            "loan_purpose": rng.choice(["home_purchase", "education", "vehicle", "personal", "business",
+                                        "debt_consolidation", "other"]),
+            "loan_term": rng.choice([12, 60, 120, 121, 360]),
+            "customer_id": customer_id,
+        },
+    }
+    if rng.random() < 0.3:
+        application["loan_application"]["co_applicant"] = {
+            "name": "Co Applicant", "income": rng.uniform(0, 150_000), "credit_score": rng.randint(300, 850),
+            "relationship": "spouse",
+        }
+    if rng.random() < 0.3:
+        application["loan_application"]["collateral"] = {
+            "type": "real_estate", "value": rng.uniform(0, 1_000_000),
+        }
+    return application
+
+
+def _generate_ids(count, keep=False):
+    """
+    Generate count IDs in this thread, checking that they increase and all carry the thread's node bits.
+
+    Returns (node bits, first ID, last ID, the IDs if keep else None).
+    """
+    next_value = application_ids.application_ids.next_value
+    node_mask = ((1 << application_ids.MACHINE_BITS + application_ids.THREAD_BITS) - 1) << application_ids.NODE_SHIFT
+    first = last = next_value()
+    node = first & node_mask
+    values = [first] if keep else None
+    for _ in range(count - 1):
+        value = next_value()
+        if value <= last or value & node_mask != node:
+            raise AssertionError(f"ID {value:x} after {last:x} in the thread with node bits {node:x}")
+        last = value
+        if keep:
+            values.append(value)
+    return node, first, last, values
+
+
+def _generate_ids_in_threads(threads, count, keep=False):
+    """Generate count IDs in each of `threads` threads, including the calling one."""
+    with ThreadPoolExecutor(max(threads - 1, 1)) as pool:
+        futures = [pool.submit(_generate_ids, count, keep) for _ in range(threads - 1)]
+        return [_generate_ids(count, keep)] + [future.result() for future in futures]
+
+
+def check_unique_ids(processes, threads, count, keep=False):
+    """
+    Generate count IDs in each of `threads` threads of `processes` forked processes, and check they are unique.
+
+    Each thread's IDs increase and carry its node bits, so IDs are unique if
+    threads with the same node bits (a thread ID reused) generated disjoint
+    ranges. Returns the threads' (node bits, first ID, last ID, IDs or None).
+    """
+    # The workers fork from a thread that has generated IDs already
+    application_ids.application_ids.next_value()
+    with ProcessPoolExecutor(processes) as pool:
+        streams = [stream for streams in pool.map(_generate_ids_in_threads, [threads] * processes,
+                                                  [count] * processes, [keep] * processes)
+                   for stream in streams]
+    streams.sort(key=lambda stream: stream[:3])
+    for (node, _, last, _), (next_node, next_first, _, _) in zip(streams, streams[1:]):
+        assert node != next_node or last < next_first
+    return streams
@@ -0,0 +1,252 @@
+"""
+Backends that run eligibility scoring off the event loop.
+
+A backend runs scoring calls somewhere else than the async request handler,
+bounding how much work it accepts: at most max_in_flight calls execute at
+once and at most max_queue_depth more wait for a slot. Calls beyond that are
+rejected with BackendSaturated (a 503 for the client) instead of piling up.
+Each backend records how long calls waited for a slot and how long they took
+to compute.
+"""
+import asyncio
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+class BackendSaturated(Exception):
+    """The backend is at its in-flight and queue limits."""
+
+
+class _Samples:
+    """Count, total and recent samples of a duration, for percentiles."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self._recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self._recent)
+
+        def percentile(q):
+            return round(recent[min(int(q * len(recent)), len(recent) - 1)] * 1e3, 3) if recent else 0.0
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+def _timed_call(fn, args):
+    """Run fn(*args) in a worker, returning its result and compute time."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class ScoringBackend(ABC):
+    """
+    Runs scoring calls with in-flight and queue limits and timing metrics.
+
+    Subclasses implement _execute(), which starts a call and must eventually
+    call _finished() exactly once; everything else, limits included, is
+    shared.
+    """
+
+    # Calls that can compute in parallel, for splitting work across them
+    workers = 1
+
+    def __init__(self, max_in_flight, max_queue_depth):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.rejected = 0
+        self.failed = 0
+        self._running = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._queue_wait = _Samples()
+        self._compute = _Samples()
+        self._total = _Samples()
+
+    def submit(self, fn, *args) -> Future:
+        """
+        Start or queue fn(*args), returning a Future of its result.
+
+        Raises:
+            BackendSaturated: max_in_flight calls are executing and
+                max_queue_depth more are waiting
+        """
+        call = (Future(), fn, args, time.perf_counter())
+        with self._lock:
+            if self._running < self.max_in_flight:
+                self._running += 1
+            elif len(self._queue) < self.max_queue_depth:
+                self._queue.append(call)
+                return call[0]
+            else:
+                self.rejected += 1
+                raise BackendSaturated()
+        self._start(call)
+        return call[0]
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the backend and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _start(self, call):
+        while call is not None:
+            future, fn, args, queued_at = call
+            # A running future can no longer be cancelled, so it is always safe to settle
+            if future.set_running_or_notify_cancel():
+                break
+            # Cancelled while queued (e.g. its awaiting task timed out): skip it
+            call = self._next_call()
+        else:
+            return
+        started_at = time.perf_counter()
+        self._queue_wait.add(started_at - queued_at)
+        try:
+            self._execute(fn, args, lambda outcome: self._finished(future, queued_at, outcome))
+        except BaseException as e:
+            self._finished(future, queued_at, e)
+
+    def _next_call(self):
+        """Hand the caller's slot to the first queued call, or release it if none is waiting."""
+        with self._lock:
+            if self._queue:
+                return self._queue.popleft()
+            self._running -= 1
+            return None
+
+    @abstractmethod
+    def _execute(self, fn, args, done):
+        """Start fn(*args); call done((result, compute_seconds)) or done(exception) when it ends."""
+
+    def _finished(self, future, queued_at, outcome):
+        with self._lock:
+            if isinstance(outcome, BaseException):
+                self.failed += 1
+            else:
+                self._compute.add(outcome[1])
+            self._total.add(time.perf_counter() - queued_at)
+        next_call = self._next_call()
+        # Settle the caller's future last, so the slot is already handed on;
+        # the next call starts whatever happens to it
+        try:
+            if not future.done():
+                if isinstance(outcome, BaseException):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome[0])
+        finally:
+            self._start(next_call)
+
+    def shutdown(self):
+        """Release the backend's resources."""
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "running": self._running,
+                "queued": len(self._queue),
+                "max_in_flight": self.max_in_flight,
+                "max_queue_depth": self.max_queue_depth,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "queue_wait": self._queue_wait.summary(),
+                "compute": self._compute.summary(),
+                "total": self._total.summary(),
+            }
+
+
+class InlineBackend(ScoringBackend):
+    """
+    Runs scoring in the calling thread, as the API did before backends.
+
+    Cheap models don't need a pool; this keeps the limits and metrics
+    without any hand-off.
+    """
+
+    def __init__(self, max_in_flight=64, max_queue_depth=0):
+        super().__init__(max_in_flight, max_queue_depth)
+
+    def _execute(self, fn, args, done):
+        try:
+            outcome = _timed_call(fn, args)
+        except Exception as e:
+            outcome = e
+        done(outcome)
+
+
+class ProcessPoolBackend(ScoringBackend):
+    """
+    Runs scoring in a pool of worker processes.
+
+    The event loop only serializes requests and results; a slow score keeps a
+    worker busy instead of stalling every other request. Functions and
+    arguments must be picklable. The pool is started on first use, so
+    importing the API doesn't fork.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, max_queue_depth=None, niceness=0):
+        """
+        Initialize the backend.
+
+        Args:
+            workers: Worker processes (default: one per core)
+            max_in_flight: Calls executing at once (default: workers)
+            max_queue_depth: Calls waiting for a slot before new ones are
+                rejected (default: 8 per worker)
+            niceness: Added to the workers' nice value, so background work
+                yields the CPU to everything else (POSIX only)
+        """
+        workers = workers or os.cpu_count() or 1
+        super().__init__(max_in_flight or workers,
+                         max_queue_depth if max_queue_depth is not None else 8 * workers)
+        self.workers = workers
+        self.niceness = niceness
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if self.niceness and hasattr(os, "nice"):
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=os.nice,
+                                                     initargs=(self.niceness,))
+                else:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _execute(self, fn, args, done):
+        def forward(inner):
+            try:
+                outcome = inner.result()
+            except BaseException as e:
+                outcome = e
+            done(outcome)
+
+        self._get_pool().submit(_timed_call, fn, args).add_done_callback(forward)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def stats(self):
+        return dict(super().stats(), workers=self.workers)
+
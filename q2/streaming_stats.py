@@ -0,0 +1,370 @@
+"""
+Streaming quantiles of scores and latencies over rolling time windows.
+
+Values are summarized in DDSketches: a value is counted in the logarithmic
+bucket its magnitude falls in (negative values in buckets of their own), so
+every quantile is returned within a fixed relative error, and two sketches
+merge by adding bucket counts. RollingSketches keeps
+one sketch per metric and label set in each time slot (e.g. a minute); a
+window is the merge of its most recent slots, and slots older than the
+longest window are dropped. Memory is bounded by slots x label sets x 2 x
+max_buckets, whatever the traffic.
+
+Sketches serialize to JSON-compatible dicts, so processes serving the same
+API (e.g. uvicorn workers) can share snapshots and merge them into one view
+(SharedSketches).
+"""
+import json
+import math
+import os
+import threading
+import time
+
+# Values closer to zero than this are counted as zero
+_MIN_VALUE = 1e-9
+
+
+class DDSketch:
+    """Quantile sketch of values with bounded relative error."""
+
+    def __init__(self, relative_accuracy=0.02, max_buckets=128):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            relative_accuracy: Relative error of returned quantiles
+            max_buckets: Most buckets kept for positive values, and for
+                negative ones; beyond that the buckets closest to zero are
+                merged, trading accuracy near zero for memory
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        # Buckets of negative values, by the index of their magnitude
+        self.negative_buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        if -_MIN_VALUE < value < _MIN_VALUE:
+            self.zero_count += weight
+        else:
+            buckets = self.buckets if value > 0 else self.negative_buckets
+            index = math.ceil(math.log(abs(value)) / self._log_gamma)
+            buckets[index] = buckets.get(index, 0) + weight
+            if len(buckets) > self.max_buckets:
+                self._collapse(buckets)
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _collapse(self, buckets):
+        lowest = sorted(buckets)[:len(buckets) - self.max_buckets + 1]
+        for index in lowest[:-1]:
+            buckets[lowest[-1]] += buckets.pop(index)
+
+    def merge(self, other):
+        """Add the values of another sketch with the same relative accuracy."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for buckets, others in ((self.buckets, other.buckets), (self.negative_buckets, other.negative_buckets)):
+            for index, count in others.items():
+                buckets[index] = buckets.get(index, 0) + count
+            if len(buckets) > self.max_buckets:
+                self._collapse(buckets)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Return the q-quantile (0 <= q <= 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Negative values from the largest magnitude down, then zeros, then positive values
+        for index in sorted(self.negative_buckets, reverse=True):
+            seen += self.negative_buckets[index]
+            if seen > rank:
+                return self._bucket_value(-1, index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return self._bucket_value(1, index)
+        return self.max
+
+    def _bucket_value(self, sign, index):
+        # Midpoint (in relative terms) of the bucket's range
+        value = sign * 2 * self._gamma ** index / (self._gamma + 1)
+        return min(max(value, self.min), self.max)
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99), digits=2):
+        """Count, mean, extremes and quantiles, as a JSON-compatible dict."""
+        if not self.count:
+            return {"count": 0}
+        summary = {"count": self.count, "mean": round(self.sum / self.count, digits),
+                   "min": round(self.min, digits), "max": round(self.max, digits)}
+        for q in quantiles:
+            summary[f"p{q * 100:g}"] = round(self.quantile(q), digits)
+        return summary
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "negative_buckets": {str(index): count for index, count in self.negative_buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["max_buckets"])
+        sketch.buckets = {int(index): count for index, count in data["buckets"].items()}
+        # Absent from snapshots of sketches that only held non-negative values
+        sketch.negative_buckets = {int(index): count for index, count in data.get("negative_buckets", {}).items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+
+class RollingSketches:
+    """DDSketches per metric and label set, kept in time slots and queried over rolling windows."""
+
+    def __init__(self, slot_seconds=60, slots=60, relative_accuracy=0.02, max_buckets=128):
+        """
+        Initialize the sketches.
+
+        Args:
+            slot_seconds: Time covered by a slot; windows are whole numbers of slots
+            slots: Slots kept, so the longest window is slots x slot_seconds
+            relative_accuracy: Relative error of the sketches' quantiles
+            max_buckets: Most buckets per sketch
+        """
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, now):
+        """This slot's sketches, dropping expired slots when a new one starts. Call under the lock."""
+        index = int(now // self.slot_seconds)
+        sketches = self._slots.get(index)
+        if sketches is None:
+            sketches = self._slots[index] = {}
+            for expired in [slot for slot in self._slots if slot <= index - self.slots]:
+                del self._slots[expired]
+        return sketches
+
+    def _sketch(self, sketches, metric, labels):
+        key = (metric, labels)
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = DDSketch(self.relative_accuracy, self.max_buckets)
+        return sketch
+
+    def add(self, metric, labels, value, now=None):
+        """
+        Record a value.
+
+        Args:
+            metric: Metric name
+            labels: Tuple of label values; keep their combinations few, as
+                each one gets its own sketch
+            value: Value, e.g. a score or a latency
+            now: time.time() of the value (default: now)
+        """
+        with self._lock:
+            self._sketch(self._slot(time.time() if now is None else now), metric, labels).add(value)
+
+    def add_many(self, metric, values_by_labels, now=None):
+        """Record values given as {labels: [values]} under a single lock."""
+        with self._lock:
+            sketches = self._slot(time.time() if now is None else now)
+            for labels, values in values_by_labels.items():
+                sketch = self._sketch(sketches, metric, labels)
+                for value in values:
+                    sketch.add(value)
+
+    def window(self, seconds, now=None):
+        """
+        Merge the slots of the last `seconds` (rounded up to whole slots).
+
+        Returns:
+            {(metric, labels): DDSketch}
+        """
+        now = time.time() if now is None else now
+        newest = int(now // self.slot_seconds)
+        oldest = newest - max(math.ceil(seconds / self.slot_seconds), 1) + 1
+        merged = {}
+        with self._lock:
+            for index, sketches in self._slots.items():
+                if oldest <= index <= newest:
+                    for key, sketch in sketches.items():
+                        if key not in merged:
+                            merged[key] = DDSketch(self.relative_accuracy, self.max_buckets)
+                        merged[key].merge(sketch)
+        return merged
+
+    def merge(self, other):
+        """Add the slots of other RollingSketches with the same slot length and accuracy."""
+        if (other.slot_seconds, other.relative_accuracy) != (self.slot_seconds, self.relative_accuracy):
+            raise ValueError("Only rolling sketches with the same slots and accuracy can be merged")
+        with other._lock:
+            slots = {index: dict(sketches) for index, sketches in other._slots.items()}
+        with self._lock:
+            newest = max([*self._slots, *slots], default=0)
+            for index, sketches in slots.items():
+                if index <= newest - self.slots:
+                    continue
+                target = self._slots.setdefault(index, {})
+                for (metric, labels), sketch in sketches.items():
+                    self._sketch(target, metric, labels).merge(sketch)
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "slot_seconds": self.slot_seconds,
+                "slots": self.slots,
+                "relative_accuracy": self.relative_accuracy,
+                "max_buckets": self.max_buckets,
+                "data": [[index, metric, list(labels), sketch.to_dict()]
+                         for index, sketches in self._slots.items()
+                         for (metric, labels), sketch in sketches.items()],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        rolling = cls(data["slot_seconds"], data["slots"], data["relative_accuracy"], data["max_buckets"])
+        for index, metric, labels, sketch in data["data"]:
+            rolling._slots.setdefault(index, {})[(metric, tuple(labels))] = DDSketch.from_dict(sketch)
+        return rolling
+
+    def save(self, path):
+        """Write a snapshot to path atomically."""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+
+class SharedSketches:
+    """
+    RollingSketches shared by processes through snapshot files in one directory.
+
+    Each process publishes its own sketches as <pid>.json every `interval`
+    seconds; merged() combines the live sketches with the other processes'
+    latest snapshots. Snapshots older than the longest window are deleted.
+    """
+
+    def __init__(self, sketches, directory, interval=10):
+        self.sketches = sketches
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="sketch-publisher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+    def publish(self):
+        self.sketches.save(self.path)
+
+    def merged(self):
+        """This process's sketches merged with the other processes' snapshots."""
+        merged = RollingSketches(self.sketches.slot_seconds, self.sketches.slots,
+                                 self.sketches.relative_accuracy, self.sketches.max_buckets)
+        merged.merge(self.sketches)
+        expired = time.time() - self.sketches.slots * self.sketches.slot_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == self.path:
+                continue
+            try:
+                if os.path.getmtime(path) < expired:
+                    os.remove(path)
+                    continue
+                merged.merge(RollingSketches.load(path))
+            except (OSError, ValueError, KeyError):
+                # Removed or replaced while reading, or written with other settings
+                continue
+        return merged
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.publish()
+
+
+class LatencyMiddleware:
+    """ASGI middleware recording the latency of each HTTP request, in ms, by method and route path."""
+
+    def __init__(self, app, sketches, routes, metric="latency_ms"):
+        """
+        Args:
+            app: ASGI app to wrap
+            sketches: RollingSketches to record into
+            routes: The application's routes (e.g. app.routes), to label
+                requests by route path rather than by their unbounded URLs
+            metric: Metric name
+        """
+        self.app = app
+        self.sketches = sketches
+        self.routes = routes
+        self.metric = metric
+        self._paths = {}
+
+    def _path(self, scope):
+        # The router sets the matched endpoint on the scope
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._paths:
+            self._paths = {getattr(route, "endpoint", None): route.path for route in self.routes}
+        return self._paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.sketches.add(self.metric, (f"{scope['method']} {self._path(scope)}",),
+                              (time.perf_counter() - start) * 1e3)
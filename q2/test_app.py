@@ -0,0 +1,763 @@
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import application_ids
+import batch_scoring
+from amortization import loan_schedule
+import loan_eligibility_api
+import risk_simulation
+from customer_registry import CustomerRegistry
+from model_registry import ModelRegistry, ShadowScorer
+from sample_data import check_unique_ids, random_application
+from dispute_features import DisputeFeatures, extract_dispute_features
+from scoring_backend import BackendSaturated, ProcessPoolBackend
+from streaming_stats import DDSketch, RollingSketches, SharedSketches
+from loan_eligibility_api import (
+    CustomerData, DisputeRecord, LoanEligibilityRequest, app, calculate_eligibility_score,
+    compute_registered_factors, generate_recommendation,
+)
+
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def customer_registry(monkeypatch):
+    registry = CustomerRegistry(":memory:", CustomerData.parse_raw, compute_registered_factors, cache_size=100)
+    monkeypatch.setattr(loan_eligibility_api, 'customer_registry', registry)
+    return registry
+
+
+def scalar_response(application):
+    request = LoanEligibilityRequest.parse_obj(application)
+    score, dispute_impact = calculate_eligibility_score(request.customer, request.loan_application)
+    result = generate_recommendation(score, request.customer, request.loan_application)
+    result.dispute_impact = dispute_impact
+    return result.dict()
+
+
+def test_batch_scores_match_scalar_path():
+    rng = random.Random(42)
+    applications = [random_application(rng) for _ in range(2000)]
+    requests = [LoanEligibilityRequest.parse_obj(a) for a in applications]
+
+    for application, batch in zip(applications, batch_scoring.score_applications(requests)):
+        scalar = scalar_response(application)
+        assert batch.pop("application_id").startswith("LOAN-")
+        del scalar["application_id"]
+        assert batch == scalar
+
+
+def test_batch_endpoint():
+    rng = random.Random(7)
+    applications = [random_application(rng, f"CUST{i}") for i in range(20)]
+
+    response = client.post("/loan-eligibility/batch", json=applications)
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 20
+    for application, result in zip(applications, results):
+        single = client.post("/loan-eligibility", json=application).json()
+        assert result["eligibility_score"] == pytest.approx(single["eligibility_score"], abs=0.1)
+        assert result["application_id"].startswith("LOAN-")
+
+    assert client.post("/loan-eligibility/batch", json=[]).json() == []
+
+    applications[3]["loan_application"]["customer_id"] = "SOMEONE_ELSE"
+    response = client.post("/loan-eligibility/batch", json=applications)
+    assert response.status_code == 400
+    assert "index 3" in response.json()["detail"]
+
+
+def test_batch_handles_unusual_dispute_dates():
+    application = random_application(random.Random(1))
+    application["customer"]["dispute_history"] = [
+        {"dispute_id": "D1", "description": "x", "submission_date": datetime.now().isoformat() + "Z",
+         "status": "rejected"},
+        {"dispute_id": "D2", "description": "x", "submission_date": (datetime.now() - timedelta(days=10)).isoformat(),
+         "status": "rejected"},
+    ]
+    [result] = batch_scoring.score_applications([LoanEligibilityRequest.parse_obj(application)])
+    # The timezone-aware date is counted as a dispute, but not as recent or rejected
+    assert result["dispute_impact"] == scalar_response(application)["dispute_impact"]
+    assert result["dispute_impact"]["rejected_disputes"] == 1
+
+
+def test_dispute_features():
+    now = datetime(2025, 6, 1, 12)
+
+    def dispute(submission_date, status="resolved"):
+        return DisputeRecord(dispute_id="D", description="x", submission_date=submission_date, status=status)
+
+    history = [
+        dispute("2025-05-01", "rejected"),
+        # 365 whole days old: recent for the score, but not within the past year
+        dispute("2024-06-01T06:00:00"),
+        dispute("2024-05-31T18:00:00", "rejected"),
+        dispute("2023-01-01", "rejected"),
+        dispute("2025-05-30T10:00:00Z", "rejected"),  # timezone-aware
+        dispute("not a date", "rejected"),
+    ]
+    assert extract_dispute_features(history, now) == DisputeFeatures(
+        total_disputes=6, recent_disputes=3, rejected_disputes=3, past_year_disputes=2)
+    assert extract_dispute_features([], now) == extract_dispute_features(None, now) == (0, 0, 0, 0)
+
+
+def test_unparsable_dispute_date_only_counts_towards_total():
+    application = random_application(random.Random(3))
+    application["customer"]["dispute_history"] = [
+        {"dispute_id": "D1", "description": "x", "submission_date": "yesterday", "status": "rejected"},
+    ]
+    response = client.post("/loan-eligibility", json=application)
+    assert response.status_code == 200
+    assert response.json()["dispute_impact"] == {
+        "dispute_score": 9.5, "total_disputes": 1, "recent_disputes": 0, "rejected_disputes": 0}
+
+
+def test_scenario_sweep_matches_single_applications():
+    rng = random.Random(11)
+    application = random_application(rng)
+    application["customer"]["credit_score"] = 760
+    body = {
+        "customer": application["customer"],
+        "loan_amounts": {"start": 10_000, "stop": 400_000, "num": 5},
+        "loan_terms": [60, 360],
+        "loan_types": ["fixed", "balloon"],
+        "loan_purposes": ["home_purchase", "business"],
+        "collateral": {"type": "real_estate", "value": 150_000},
+        "top_n": 3,
+    }
+    response = client.post("/loan-eligibility/scenarios", json=body)
+    assert response.status_code == 200
+    sweep = response.json()
+    assert sweep["loan_amounts"] == [10_000, 107_500, 205_000, 302_500, 400_000]
+
+    for a, amount in enumerate(sweep["loan_amounts"]):
+        for t, term in enumerate(sweep["loan_terms"]):
+            for k, loan_type in enumerate(sweep["loan_types"]):
+                for p, purpose in enumerate(sweep["loan_purposes"]):
+                    single = scalar_response({"customer": application["customer"], "loan_application": {
+                        "loan_amount": amount, "loan_term": term, "loan_type": loan_type, "loan_purpose": purpose,
+                        "collateral": body["collateral"], "customer_id": application["customer"]["customer_id"],
+                    }})
+                    assert sweep["eligibility_scores"][a][t][k][p] == single["eligibility_score"]
+                    assert sweep["suggested_interest_rates"][a][t][k][p] == single["suggested_interest_rate"]
+    assert sweep["dispute_impact"] == single["dispute_impact"]
+
+    best = sweep["best_options"]
+    assert 0 < len(best) <= 3
+    ranks = [(o["approval_status"] == "Approved", o["loan_amount"], -o["suggested_interest_rate"]) for o in best]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+def test_scenario_sweep_validation():
+    customer = random_application(random.Random(12))["customer"]
+    body = {"customer": customer, "loan_amounts": [10_000], "loan_terms": [60], "loan_purposes": ["personal"]}
+    assert client.post("/loan-eligibility/scenarios", json=body).status_code == 200
+
+    for bad in ({"loan_amounts": [10_000, -5]}, {"loan_terms": {"start": 0, "stop": 12, "num": 3}},
+                {"loan_purposes": []}, {"loan_amounts": {"start": 1, "stop": 2, "num": 0}},
+                {"loan_amounts": {"start": 1_000, "stop": 1_000_000, "num": 1_000},
+                 "loan_terms": {"start": 12, "stop": 360, "num": 200}},
+                {"top_n": -1}, {"top_n": 1_000_000}, {"loan_amounts": {"start": 1, "stop": 2, "num": 10 ** 9}}):
+        assert client.post("/loan-eligibility/scenarios", json=dict(body, **bad)).status_code == 422
+
+
+def test_registered_customer_scoring(customer_registry):
+    rng = random.Random(21)
+    for i in range(30):
+        application = random_application(rng, f"CUST{i}")
+        customer, loan = application["customer"], application["loan_application"]
+        assert client.put(f"/customers/CUST{i}", json=customer).status_code == 200
+
+        registered = client.post(f"/customers/CUST{i}/loan-eligibility", json=loan).json()
+        single = client.post("/loan-eligibility", json=application).json()
+        del registered["application_id"], single["application_id"]
+        assert registered == single
+
+    # Updating a profile replaces its cached factors
+    application = random_application(rng, "CUST0")
+    application["customer"]["credit_score"] = 300
+    client.put("/customers/CUST0", json=application["customer"])
+    assert client.get("/customers/CUST0").json()["credit_score"] == 300
+    registered = client.post("/customers/CUST0/loan-eligibility", json=application["loan_application"]).json()
+    assert registered["eligibility_score"] == scalar_response(application)["eligibility_score"]
+
+    loan = application["loan_application"]
+    assert client.post("/customers/CUST1/loan-eligibility", json=loan).status_code == 400
+    assert client.put("/customers/CUST1", json=application["customer"]).status_code == 400
+    assert client.delete("/customers/CUST0").status_code == 204
+    assert client.post("/customers/CUST0/loan-eligibility", json=loan).status_code == 404
+    assert client.get("/customers/CUST0").status_code == 404
+    assert client.delete("/customers/CUST0").status_code == 404
+
+
+def test_registered_factors_refresh_as_disputes_age(tmp_path):
+    path = str(tmp_path / "registry.db")
+    registry = CustomerRegistry(path, CustomerData.parse_raw, compute_registered_factors)
+    now = datetime(2025, 6, 1, 12)
+    customer = CustomerData.parse_obj(dict(random_application(random.Random(22))["customer"], dispute_history=[
+        {"dispute_id": "D1", "description": "x", "submission_date": "2024-06-02T00:00:00", "status": "rejected"},
+        {"dispute_id": "D2", "description": "x", "submission_date": "2023-01-01T00:00:00", "status": "resolved"},
+    ]))
+    factors = registry.put(customer, now)
+    assert factors.dispute_features == (2, 1, 1, 1)
+    assert factors.valid_until == datetime(2025, 6, 2)
+
+    assert registry.get(customer.customer_id, now)[1] is factors
+    later = datetime(2025, 6, 2, 6)
+    _, refreshed = registry.get(customer.customer_id, later)
+    assert refreshed.dispute_features == (2, 1, 1, 0)
+    assert refreshed.valid_until == datetime(2025, 6, 3)
+    assert registry.stats()["refreshes"] == 1
+
+    # The refreshed factors were stored, not just cached
+    reopened = CustomerRegistry(path, CustomerData.parse_raw, compute_registered_factors)
+    profile, stored = reopened.get(customer.customer_id, later)
+    assert stored == refreshed
+    assert profile == customer
+
+
+def test_registry_sees_changes_made_by_other_workers(tmp_path):
+    # Two registries on one file stand in for two worker processes
+    path = str(tmp_path / "registry.db")
+    first = CustomerRegistry(path, CustomerData.parse_raw, compute_registered_factors)
+    second = CustomerRegistry(path, CustomerData.parse_raw, compute_registered_factors)
+    customer = CustomerData.parse_obj(random_application(random.Random(23))["customer"])
+
+    assert second.get(customer.customer_id) is None
+    first.put(customer)
+    assert second.get(customer.customer_id)[0] == customer
+
+    updated = customer.copy(update={"credit_score": 300 if customer.credit_score > 300 else 850})
+    first.put(updated)
+    profile, factors = second.get(customer.customer_id)
+    assert profile == updated
+    assert factors == first.get(customer.customer_id)[1]
+    assert second.stats()["invalidations"] == 1
+
+    first.delete(customer.customer_id)
+    assert second.get(customer.customer_id) is None
+
+
+def test_registry_reuses_pooled_connections(tmp_path, monkeypatch):
+    registry = CustomerRegistry(str(tmp_path / "registry.db"), CustomerData.parse_raw, compute_registered_factors,
+                                cache_size=0)
+    customer = CustomerData.parse_obj(random_application(random.Random(24))["customer"])
+    opened = []
+    open_connection = registry._open
+    monkeypatch.setattr(registry, '_open', lambda: opened.append(1) or open_connection())
+    registry.put(customer)
+    # A thread per lookup, as under the threadpool serving registered routes
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        profiles = list(pool.map(lambda _: registry.get(customer.customer_id)[0], range(50)))
+    assert all(profile == customer for profile in profiles)
+    assert len(opened) <= 4
+
+
+def test_fast_route_matches_regular_route():
+    rng = random.Random(31)
+    for _ in range(200):
+        application = random_application(rng)
+        if rng.random() < 0.2:
+            application["customer"]["debt_to_income_ratio"] = rng.random()
+        regular = client.post("/loan-eligibility", json=application)
+        fast = client.post("/loan-eligibility/fast", json=application)
+        assert fast.status_code == regular.status_code == 200
+        assert fast.headers["content-type"] == "application/json"
+        regular, fast = regular.json(), fast.json()
+        assert fast.pop("application_id").startswith("LOAN-")
+        del regular["application_id"]
+        assert fast == regular
+
+    # Valid requests take the strict path rather than the pydantic fallback
+    body = json.dumps(random_application(rng)).encode()
+    assert isinstance(loan_eligibility_api.decode_eligibility_request(body), tuple)
+
+
+def test_fast_route_errors_match_regular_route():
+    application = random_application(random.Random(32))
+
+    def variant(section, **changes):
+        changed = json.loads(json.dumps(application))
+        changed[section].update(changes)
+        return json.dumps(changed)
+
+    bodies = [
+        "", "null", "[]", "{", '{"customer": NaN}', "\xff\xfe",
+        json.dumps({"customer": application["customer"]}),
+        variant("customer", income=0),
+        variant("customer", income="95000"),
+        variant("customer", credit_score=900),
+        variant("customer", credit_score=700.0),
+        variant("customer", credit_score="700"),
+        variant("customer", credit_score=True),
+        variant("customer", debt_to_income_ratio=1.5),
+        variant("customer", debt_to_income_ratio=None),
+        variant("customer", employment_status="astronaut"),
+        variant("customer", dispute_history=None),
+        variant("customer", dispute_history=[{"dispute_id": "D1", "description": "x",
+                                              "submission_date": "2025-01-01", "status": "lost"}]),
+        variant("customer", email=None, name=12),
+        variant("customer", income=10 ** 30),
+        variant("loan_application", loan_amount=-1, loan_term=0),
+        variant("loan_application", customer_id="SOMEONE_ELSE"),
+        variant("loan_application", collateral={"type": "vehicle"}),
+        variant("loan_application", unknown_field=1),
+    ]
+    for body in bodies:
+        for content_type in ("application/json", None):
+            headers = {"content-type": content_type} if content_type else {}
+            regular = client.post("/loan-eligibility", content=body, headers=headers)
+            fast = client.post("/loan-eligibility/fast", content=body, headers=headers)
+            assert fast.status_code == regular.status_code, body
+            if regular.status_code == 200:
+                assert fast.json()["eligibility_score"] == regular.json()["eligibility_score"]
+            else:
+                assert fast.json() == regular.json(), body
+
+    for content_type in ("text/plain", "application/x-www-form-urlencoded"):
+        headers = {"content-type": content_type}
+        regular = client.post("/loan-eligibility", content=bodies[7], headers=headers)
+        fast = client.post("/loan-eligibility/fast", content=bodies[7], headers=headers)
+        assert (fast.status_code, fast.json()) == (regular.status_code, regular.json())
+
+
+def test_process_backend_limits_and_timings():
+    backend = ProcessPoolBackend(workers=1, max_in_flight=1, max_queue_depth=1)
+    try:
+        running = backend.submit(time.sleep, 0.3)
+        queued = backend.submit(time.sleep, 0.3)
+        with pytest.raises(BackendSaturated):
+            backend.submit(time.sleep, 0.3)
+        running.result(timeout=30)
+        queued.result(timeout=30)
+        with pytest.raises(ZeroDivisionError):
+            backend.submit(divmod, 1, 0).result(timeout=30)
+
+        stats = backend.stats()
+        assert (stats["running"], stats["queued"], stats["rejected"], stats["failed"]) == (0, 0, 1, 1)
+        assert stats["compute"]["count"] == 2
+        assert stats["compute"]["p50_ms"] >= 300
+        # The queued call waited for the running one to finish
+        assert stats["queue_wait"]["count"] == 3
+        assert stats["queue_wait"]["p99_ms"] >= 250
+    finally:
+        backend.shutdown()
+
+
+def test_process_backend_survives_cancelled_callers():
+    backend = ProcessPoolBackend(workers=1, max_in_flight=1, max_queue_depth=2)
+
+    async def time_out():
+        running = asyncio.wrap_future(backend.submit(time.sleep, 0.3))
+        queued = backend.submit(divmod, 7, 2)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(running, 0.05)
+        return queued
+
+    try:
+        # The caller of the running call stops waiting; the queued calls still run
+        queued = asyncio.run(time_out())
+        skipped = backend.submit(time.sleep, 0.3)
+        skipped.cancel()
+        assert queued.result(timeout=30) == (3, 1)
+        assert backend.submit(divmod, 9, 4).result(timeout=30) == (2, 1)
+        assert skipped.cancelled()
+        stats = backend.stats()
+        assert (stats["running"], stats["queued"], stats["compute"]["count"]) == (0, 0, 3)
+    finally:
+        backend.shutdown()
+
+
+def test_saturated_backend_returns_503(monkeypatch):
+    backend = ProcessPoolBackend(workers=1, max_in_flight=1, max_queue_depth=0)
+    monkeypatch.setattr(loan_eligibility_api, 'scoring_backend', backend)
+    application = random_application(random.Random(7))
+    try:
+        busy = backend.submit(time.sleep, 1)
+        for route in ("/loan-eligibility", "/loan-eligibility/fast"):
+            response = client.post(route, json=application)
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+        busy.result(timeout=30)
+
+        assert client.post("/loan-eligibility", json=application).status_code == 200
+        stats = client.get("/stats").json()["scoring_backend"]
+        assert (stats["backend"], stats["rejected"]) == ("ProcessPoolBackend", 2)
+    finally:
+        backend.shutdown()
+
+
+def reference_schedule(amount, term, monthly_rates, interest_only=0, amortization=None):
+    """Month-by-month schedule, recomputing the installment every month."""
+    amortization = term - interest_only if amortization is None else amortization
+    balance, payments = amount, []
+    for month, rate in enumerate(monthly_rates, 1):
+        interest = balance * rate
+        if month == term:
+            principal = balance
+        elif month <= interest_only:
+            principal = 0
+        else:
+            left = amortization - (month - 1 - interest_only)
+            installment = balance * rate / (1 - (1 + rate) ** -left) if rate else balance / left
+            principal = installment - interest
+        balance -= principal
+        payments.append(interest + principal)
+    return payments
+
+
+def test_amortization_schedules_match_monthly_loop():
+    fixed = loan_schedule(200_000, 360, "fixed", 6.0)
+    assert fixed["payments"][0] == fixed["payments"][-1] == round(200_000 * 0.005 / (1 - 1.005 ** -360), 2)
+    assert fixed["balances"][-1] == 0
+
+    cases = [
+        (dict(loan_type="fixed", annual_rate=0.0), [0.0] * 48, {}),
+        (dict(loan_type="variable", annual_rate=5.0, rate_path=[7.0, 3.5], rate_reset_months=12),
+         [5 / 1200] * 12 + [7 / 1200] * 12 + [3.5 / 1200] * 24, {}),
+        (dict(loan_type="interest_only", annual_rate=4.0), [4 / 1200] * 48, dict(interest_only=48)),
+        (dict(loan_type="interest_only", annual_rate=4.0, interest_only_months=12), [4 / 1200] * 48,
+         dict(interest_only=12)),
+        (dict(loan_type="balloon", annual_rate=8.0), [8 / 1200] * 48, dict(amortization=360)),
+    ]
+    for options, rates, periods in cases:
+        schedule = loan_schedule(50_000, 48, **options)
+        expected = reference_schedule(50_000, 48, rates, **periods)
+        assert schedule["payments"] == pytest.approx(expected, abs=0.01), options
+        assert schedule["balances"][-1] == 0
+        assert schedule["total_paid"] == pytest.approx(sum(expected), abs=0.01)
+
+
+def test_amortization_endpoints():
+    response = client.post("/amortization-schedule", json={
+        "loan_amount": 10_000, "loan_term": 24, "loan_type": "balloon", "annual_rate": 6.5,
+        "balloon_amortization_months": 120,
+    })
+    assert response.status_code == 200
+    schedule = response.json()
+    assert len(schedule["payments"]) == 24
+    assert schedule["payments"][-1] > 5 * schedule["payments"][0]  # the balloon
+
+    for invalid in ({"rate_path": [5.0]}, {"loan_term": 0}, {"annual_rate": -1},
+                    {"loan_type": "interest_only", "interest_only_months": 30}):
+        body = dict({"loan_amount": 10_000, "loan_term": 24, "loan_type": "fixed", "annual_rate": 6.5}, **invalid)
+        assert client.post("/amortization-schedule", json=body).status_code == 422, invalid
+
+    rng = random.Random(3)
+    loans = [
+        {"loan_amount": rng.uniform(1_000, 500_000), "loan_term": rng.choice([12, 60, 121, 360]),
+         "loan_type": loan_type, "annual_rate": rng.uniform(0, 15), "start_month": rng.randint(0, 24),
+         **({"rate_path": [rng.uniform(0, 15) for _ in range(3)]} if loan_type == "variable" else {})}
+        for loan_type in rng.choices(["fixed", "variable", "interest_only", "balloon"], k=300)
+    ]
+    response = client.post("/portfolio/cash-flow", json={"loans": loans})
+    assert response.status_code == 200
+    cash_flow = response.json()
+
+    horizon = max(loan["loan_term"] + loan["start_month"] for loan in loans)
+    expected = [0.0] * horizon
+    active = [0] * horizon
+    for loan in loans:
+        schedule = loan_schedule(**{k: v for k, v in loan.items() if k != "start_month"})
+        for month, payment in enumerate(schedule["payments"]):
+            expected[loan["start_month"] + month] += payment
+            active[loan["start_month"] + month] += 1
+    assert cash_flow["months"] == list(range(1, horizon + 1))
+    assert cash_flow["payments"] == pytest.approx(expected, abs=1.0)
+    assert cash_flow["active_loans"] == active
+    assert cash_flow["balances"][-1] == 0
+    assert client.post("/portfolio/cash-flow", json={"loans": []}).json()["months"] == []
+
+    loan = dict(loans[0], start_month=loan_eligibility_api.MAX_SCHEDULE_MONTHS + 1)
+    assert client.post("/portfolio/cash-flow", json={"loans": [loan]}).status_code == 422
+    too_many = [loans[0]] * (loan_eligibility_api.MAX_PORTFOLIO_LOANS + 1)
+    assert client.post("/portfolio/cash-flow", json={"loans": too_many}).status_code == 422
+
+
+def test_risk_simulation_is_reproducible_and_independent_of_chunking(monkeypatch):
+    applications = [random_application(random.Random(i), f"CUST{i}") for i in range(5)]
+    body = {"applications": applications, "simulation": {"paths": 2_000, "seed": 11, "time_budget_ms": 60_000}}
+    batch = client.post("/loan-eligibility/risk/batch", json=body).json()
+    assert [result["risk"] for result in client.post("/loan-eligibility/risk/batch", json=body).json()] == \
+        [result["risk"] for result in batch]
+
+    monkeypatch.setattr(loan_eligibility_api, 'SIMULATION_CHUNK_SIZE', 1)
+    monkeypatch.setattr(loan_eligibility_api.simulation_backend, 'workers', 5)
+    assert [result["risk"] for result in client.post("/loan-eligibility/risk/batch", json=body).json()] == \
+        [result["risk"] for result in batch]
+
+    single = client.post("/loan-eligibility/risk", json={"application": applications[0],
+                                                          "simulation": body["simulation"]}).json()
+    assert single["risk"] == batch[0]["risk"]
+    for result, application in zip(batch, applications):
+        scalar = scalar_response(application)
+        assert result["eligibility"].pop("application_id").startswith("LOAN-")
+        del scalar["application_id"]
+        assert result["eligibility"] == scalar
+        risk = result["risk"]
+        assert (risk["paths"], risk["truncated"]) == (2_000, False)
+        low, high = risk["probability_of_default_band"]
+        assert low <= risk["probability_of_default"] <= high
+        assert risk["loss_percentiles"]["p50"] <= risk["loss_percentiles"]["p99"]
+
+
+def test_risk_simulation_ranks_applicants_and_respects_time_budget():
+    def application(income, credit_score, loan_amount, loan_type="fixed"):
+        body = random_application(random.Random(0))
+        body["customer"].update(income=income, credit_score=credit_score, total_debts=income * 0.1,
+                                employment_status="employed", employment_duration=60, previous_defaults=0,
+                                dispute_history=[], debt_to_income_ratio=None)
+        body["loan_application"].update(loan_amount=loan_amount, loan_term=360, loan_type=loan_type,
+                                        co_applicant=None, collateral=None)
+        return body
+
+    simulation = {"paths": 5_000, "seed": 3, "time_budget_ms": 60_000}
+    strong, weak = [
+        client.post("/loan-eligibility/risk", json={"application": body, "simulation": simulation}).json()["risk"]
+        for body in (application(150_000, 800, 200_000), application(40_000, 580, 200_000))
+    ]
+    assert strong["probability_of_default"] < weak["probability_of_default"]
+    assert strong["expected_loss"] < weak["expected_loss"]
+
+    started = time.perf_counter()
+    rushed = client.post("/loan-eligibility/risk", json={
+        "application": application(40_000, 580, 200_000, "variable"),
+        "simulation": {"paths": 100_000, "time_budget_ms": 1},
+    }).json()["risk"]
+    assert rushed["truncated"] and rushed["paths"] < 100_000
+    assert time.perf_counter() - started < 5
+
+    # Applications not started by the deadline are not simulated
+    body = application(40_000, 580, 200_000)
+    request = loan_eligibility_api.LoanEligibilityRequest.parse_obj(body)
+    columns = batch_scoring.applications_to_columns([request] * 3)
+    inputs = risk_simulation.risk_inputs(columns, batch_scoring.score_columns(columns))
+    late = risk_simulation.simulate_default_risk(inputs, np.random.SeedSequence(0).spawn(3), 5_000, time.time())
+    assert [(risk["paths"], risk["truncated"], risk["probability_of_default"]) for risk in late] == [(0, True, None)] * 3
+
+    # Simulations run on a backend of their own
+    simulated = client.get("/stats").json()["simulation_backend"]["compute"]["count"]
+    client.post("/loan-eligibility/risk", json={"application": body, "simulation": simulation})
+    assert client.get("/stats").json()["simulation_backend"]["compute"]["count"] == simulated + 1
+
+    for invalid in ({"paths": 0}, {"paths": 1_000_000}, {"time_budget_ms": 0},
+                    {"time_budget_ms": loan_eligibility_api.MAX_SIMULATION_TIME_BUDGET_MS + 1}, {"seed": -1}):
+        response = client.post("/loan-eligibility/risk", json={"application": application(50_000, 700, 10_000),
+                                                                "simulation": invalid})
+        assert response.status_code == 422, invalid
+    body["loan_application"]["loan_term"] = loan_eligibility_api.MAX_SCHEDULE_MONTHS + 1
+    assert client.post("/loan-eligibility/risk", json={"application": body}).status_code == 422
+    assert client.post("/loan-eligibility/risk/batch", json={"applications": [body]}).status_code == 422
+
+
+def candidate_model(customer, loan_application, customer_factors=None):
+    """A shadow candidate one point more generous than v1."""
+    result = loan_eligibility_api.evaluate_application(customer, loan_application, customer_factors)
+    result["eligibility_score"] = min(result["eligibility_score"] + 1, 100)
+    return result
+
+
+def candidate_columns(columns):
+    """candidate_model over columns of applications."""
+    scores = batch_scoring.score_columns(columns)
+    scores["eligibility_score"] = np.minimum(scores["eligibility_score"] + 1, 100)
+    return scores
+
+
+def broken_model(customer, loan_application, customer_factors=None):
+    raise ValueError("weights not loaded")
+
+
+@pytest.fixture
+def shadow_scorer(monkeypatch, tmp_path):
+    registry = ModelRegistry()
+    registry.register("v1", loan_eligibility_api.evaluate_application, score_columns=batch_scoring.score_columns)
+    registry.register("v2", candidate_model, score_columns=candidate_columns)
+    registry.register("broken", broken_model)
+    registry.set_shadow("v2")
+    scorer = ShadowScorer(ProcessPoolBackend(workers=1, max_in_flight=1, max_queue_depth=64), tmp_path / "shadow.jsonl")
+    monkeypatch.setattr(loan_eligibility_api, 'model_registry', registry)
+    monkeypatch.setattr(loan_eligibility_api, 'shadow_scorer', scorer)
+    yield scorer
+    scorer.close()
+
+
+def test_shadow_model_is_logged_next_to_production(shadow_scorer, customer_registry):
+    rng = random.Random(5)
+    responses = []
+    for i in range(6):
+        application = random_application(rng, f"CUST{i}")
+        route = "/loan-eligibility/fast" if i % 2 else "/loan-eligibility"
+        responses.append(client.post(route, json=application).json())
+    customer_registry.put(CustomerData.parse_obj(application["customer"]))
+    responses.append(client.post("/customers/CUST5/loan-eligibility", json=application["loan_application"]).json())
+
+    assert shadow_scorer.flush(timeout=30)
+    records = [json.loads(line) for line in shadow_scorer.log_path.read_text().splitlines()]
+    assert sorted(record["application_id"] for record in records) == \
+        sorted(response["application_id"] for response in responses)
+    by_id = {response["application_id"]: response for response in responses}
+    for record in records:
+        response = by_id[record["application_id"]]
+        assert record["production"]["version"] == "v1"
+        assert record["production"]["eligibility_score"] == response["eligibility_score"]
+        assert record["shadow"] == dict(record["shadow"], version="v2",
+                                        eligibility_score=min(response["eligibility_score"] + 1, 100))
+    assert shadow_scorer.stats()["logged"] == 7
+
+    loan_eligibility_api.model_registry.set_shadow("broken")
+    assert client.post("/loan-eligibility", json=application).status_code == 200
+    assert shadow_scorer.flush(timeout=30)
+    last = json.loads(shadow_scorer.log_path.read_text().splitlines()[-1])
+    assert last["shadow"] == {"version": "broken", "error": "ValueError: weights not loaded"}
+    assert client.get("/models").json() == {"versions": ["v1", "v2", "broken"], "production": "v1",
+                                            "shadow": "broken"}
+
+
+def test_every_endpoint_scores_with_the_production_model(shadow_scorer):
+    registry = loan_eligibility_api.model_registry
+    with pytest.raises(ValueError, match="registered versions: v1, v2, broken"):
+        registry.set_shadow("v3")
+    with pytest.raises(ValueError, match="score_columns"):
+        registry.set_production("broken")
+    assert registry.production.version == "v1"
+
+    application = random_application(random.Random(13))
+    sweep = {"customer": application["customer"], "loan_amounts": [5_000, 50_000], "loan_terms": [36],
+             "loan_purposes": ["personal"]}
+    risk = {"application": application, "simulation": {"paths": 100, "seed": 1, "time_budget_ms": 60_000}}
+
+    def scores():
+        return [client.post("/loan-eligibility", json=application).json()["eligibility_score"],
+                client.post("/loan-eligibility/batch", json=[application]).json()[0]["eligibility_score"],
+                client.post("/loan-eligibility/risk", json=risk).json()["eligibility"]["eligibility_score"],
+                *client.post("/loan-eligibility/scenarios", json=sweep).json()["eligibility_scores"][0][0][0]]
+
+    v1 = scores()
+    registry.set_shadow(None)
+    registry.set_production("v2")
+    assert scores() == [min(score + 1, 100) for score in v1]
+
+
+def test_shadow_scoring_sheds_when_backed_up(shadow_scorer):
+    shadow_scorer.backend.max_queue_depth = 0
+    busy = shadow_scorer.backend.submit(time.sleep, 1)
+    application = random_application(random.Random(9))
+    for _ in range(3):
+        response = client.post("/loan-eligibility", json=application)
+        assert response.status_code == 200
+    busy.result(timeout=30)
+    stats = client.get("/stats").json()["shadow_scoring"]
+    assert (stats["submitted"], stats["shed"]) == (0, 3)
+
+
+def test_sketches_quantiles_merge_and_windows(tmp_path):
+    rng = random.Random(3)
+    values = [rng.lognormvariate(3, 1) for _ in range(20_000)]
+    halves = DDSketch(), DDSketch()
+    for i, value in enumerate(values):
+        halves[i % 2].add(value)
+    sketch = DDSketch.from_dict(json.loads(json.dumps(halves[0].to_dict()))).merge(halves[1])
+    assert sketch.count == len(values)
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.03 * exact
+    assert len(sketch.buckets) <= sketch.max_buckets
+
+    # Negative values (e.g. scores of heavily indebted applicants) sort below zero
+    signed = [value - 30 for value in values] + [0.0] * 100
+    halves = DDSketch(), DDSketch()
+    for i, value in enumerate(signed):
+        halves[i % 2].add(value)
+    sketch = DDSketch.from_dict(json.loads(json.dumps(halves[0].to_dict()))).merge(halves[1])
+    ordered = sorted(signed)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(signed) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.03 * abs(exact)
+    assert (sketch.min, sketch.max) == (min(signed), max(signed))
+
+    rolling = RollingSketches(slot_seconds=60, slots=10)
+    for minute in range(30):
+        rolling.add("score", ("Approved",), minute, now=minute * 60)
+    # Only the last 10 slots are kept, however many were written
+    assert len(rolling._slots) == 10
+    assert rolling.window(120, now=29 * 60)[("score", ("Approved",))].count == 2
+    assert rolling.window(3600, now=29 * 60)[("score", ("Approved",))].min == 20
+
+    # Another worker's snapshot is merged into the shared view
+    other = RollingSketches(slot_seconds=60, slots=10)
+    other.add("score", ("Denied",), 5, now=29 * 60)
+    other.save(str(tmp_path / "1.json"))
+    merged = SharedSketches(rolling, str(tmp_path)).merged().window(60, now=29 * 60)
+    assert {labels for _, labels in merged} == {("Approved",), ("Denied",)}
+
+
+def test_stats_reports_score_and_latency_distributions():
+    def hour_stats():
+        return client.get("/stats", params={"window": 3600}).json()["distributions"]["3600s"]
+
+    before = hour_stats()
+    rng = random.Random(11)
+    applications = [random_application(rng) for _ in range(20)]
+    for application in applications[:10]:
+        assert client.post("/loan-eligibility", json=application).status_code == 200
+    assert client.post("/loan-eligibility/batch", json=applications[10:]).status_code == 200
+    after = hour_stats()
+
+    scores = after["eligibility_score"]
+    assert scores["all"]["count"] - before["eligibility_score"]["all"]["count"] == 20
+    assert sum(summary["count"] for summary in scores["by_loan_purpose"].values()) == scores["all"]["count"]
+    assert abs(sum(after["approval_status_mix"].values()) - 1) < 1e-3
+    # Latencies are labelled by route path, not by URL
+    assert after["latency_ms"]["POST /loan-eligibility"]["count"] >= 10
+    client.get("/customers/UNKNOWN-42")
+    assert "GET /customers/{customer_id}" in hour_stats()["latency_ms"]
+
+    # Negative scores are recorded like any other, never failing the request
+    application = random_application(random.Random(12))
+    application["customer"].update(income=20_000, total_debts=60_000, debt_to_income_ratio=None, credit_score=300,
+                                   previous_defaults=3, employment_status="unemployed")
+    responses = [client.post("/loan-eligibility", json=application),
+                 client.post("/loan-eligibility/batch", json=[application])]
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json()["eligibility_score"] < 0
+    assert hour_stats()["eligibility_score"]["all"]["min"] <= responses[0].json()["eligibility_score"]
+
+    assert set(client.get("/stats").json()["distributions"]) == {"60s", "900s", "3600s"}
+    assert client.get("/stats", params={"window": 0}).status_code == 422
+
+
+def test_application_ids_are_unique_across_processes_and_threads():
+    streams = check_unique_ids(processes=4, threads=4, count=25_000, keep=True)
+    values = [value for stream in streams for value in stream[3]]
+    assert len(set(values)) == len(values) == 400_000
+    assert len({stream[0] for stream in streams}) > 1
+
+    # Strings sort like the IDs' values, i.e. by generation time
+    sample = random.Random(5).sample(values, 2000)
+    assert sorted(sample, key=application_ids.encode) == sorted(sample)
+    assert all(application_ids.decode(application_ids.encode(value)) == value for value in sample)
+    assert abs(application_ids.timestamp_ms(max(values)) - time.time() * 1000) < 60_000
+
+    response = client.post("/loan-eligibility", json=random_application(random.Random(1))).json()
+    assert len(response["application_id"]) == len("LOAN-") + 26
+
+
+def test_application_ids_increase_when_the_clock_goes_back(monkeypatch):
+    generator = application_ids.IdGenerator(machine_id=7)
+    clock = iter([5_000_000_000, 5_000_000_000, 4_000_000_000, 6_000_000_000])
+    monkeypatch.setattr(application_ids.time, 'time_ns', lambda: next(clock))
+    values = [generator.next_value() for _ in range(4)]
+    assert values == sorted(set(values))
+    assert [application_ids.timestamp_ms(value) for value in values] == [5000, 5000, 5000, 6000]